@@ -1,41 +1,115 @@
+from django import forms
+from functools import partial
+
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.admin import UserAdmin
 from django.urls import path, reverse
 from django.utils.html import format_html
 from django.utils import timezone
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
-from .models import Collect, Payment, Comment, Profile
-from django.core.mail import send_mail
-from django.conf import settings
+from django.template.response import TemplateResponse
+from django.db import transaction
+from .models import Collect, CollectStats, Payment, Comment, Profile, OutgoingEmail, ImageTask
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.core.exceptions import PermissionDenied, ValidationError
+from .search import search_query, supports_full_text
+from .caching import invalidate_tags, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
+from .pagination import EstimatedCountPaginator, keyset_page
+
+
+class AutocompleteFilterSelect(AutocompleteSelect):
+    """Поле автодополнения для фильтра: пока значение не выбрано, в нём название фильтра."""
+
+    def __init__(self, field, admin_site, placeholder):
+        super().__init__(field, admin_site, attrs={'data-width': '100%'})
+        self.placeholder = placeholder
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-placeholder'] = self.placeholder
+        return attrs
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по внешнему ключу с полем автодополнения вместо выпадающего списка со
+    всеми пользователями или сборами: варианты подгружаются поиском админки
+    связанной модели, а при отрисовке из БД читается только выбранный объект.
+    Поле отправляется формой поиска списка под тем же параметром, что и у
+    стандартного фильтра (``author__id__exact``).
+    """
+    template = 'admin/autocomplete_filter.html'
 
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        widget = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteFilterSelect(field, model_admin.admin_site, self.title),
+        ).widget
+        try:
+            self.rendered_widget = widget.render(self.lookup_kwarg, self.lookup_val)
+        except (ValueError, ValidationError):
+            # Некорректный параметр: список всё равно ответит ошибкой фильтра.
+            self.rendered_widget = widget.render(self.lookup_kwarg, None)
 
-class CommentInline(admin.TabularInline):
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'Все',
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
     """
-    Позволяет отображать и удалять комментарии прямо на странице сбора.
+    Список таблицы на миллионы строк: оценка числа результатов вместо COUNT(*),
+    без второго подсчёта «всего» и со скриптами для ``AutocompleteFilter``.
     """
-    model = Comment
-    extra = 0
-    readonly_fields = ('author', 'text', 'created_at')
-    can_delete = True
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+def user_id_by_username(username):
+    """Поиск по точному логину идёт по уникальному индексу auth_user."""
+    return User.objects.filter(username=username).values_list('pk', flat=True).first()
 
-    fields = ('author', 'text', 'created_at')
 
 @admin.action(description='Активировать выбранные сборы')
 def make_collects_active(modeladmin, request, queryset):
     """Массово делает сборы активными."""
-    queryset.update(is_active=True)
+    pks = list(queryset.values_list('pk', flat=True))
+    queryset.update(is_active=True, updated_at=timezone.now())
+    invalidate_tags(ACTIVE_LIST, ARCHIVE_LIST, *(collect_tag(pk) for pk in pks))
 
 @admin.register(Collect)
-class CollectAdmin(admin.ModelAdmin):
+class CollectAdmin(LargeTableAdmin):
     list_display = (
         'id', 'author', 'title', 'goal_amount',
         'raised_amount', 'end_at', 'is_active', 'end_collect_button'
     )
-    list_filter = ('is_active', 'author', 'closure_requested')
+    list_filter = ('is_active', ('author', AutocompleteFilter), 'closure_requested')
+    list_select_related = ('author',)
     search_fields = ('title', 'author__username', 'description')
-    readonly_fields = ('raised_amount', 'created_at')
+    autocomplete_fields = ('author',)
+    readonly_fields = ('raised_amount', 'created_at', 'comments_link')
     actions = [make_collects_active]
-    inlines = [CommentInline]
+    comments_per_page = 50
     fieldsets = (
         ('Основная информация', {
             'fields': ('author', 'title', 'occasion', 'description', 'cover_image')
@@ -49,6 +123,9 @@ class CollectAdmin(admin.ModelAdmin):
         ('Статус и даты', {
             'fields': ('end_at', 'is_active', 'closure_requested', 'close_reason')
         }),
+        ('Комментарии', {
+            'fields': ('comments_link',)
+        }),
     )
 
     def end_collect_button(self, obj):
@@ -59,6 +136,34 @@ class CollectAdmin(admin.ModelAdmin):
 
     end_collect_button.short_description = 'Действие'
 
+    def comments_link(self, obj):
+        """
+        Комментарии открываются отдельной постраничной панелью: у популярного
+        сбора их десятки тысяч, и встроенная форма с каждым из них не успевала
+        отрисоваться.
+        """
+        if obj.pk is None:
+            return '—'
+        count = CollectStats.objects.filter(pk=obj.pk).values_list('comments_count', flat=True).first() or 0
+        url = reverse('admin:collect_comments', args=[obj.pk])
+        return format_html('<a class="button" href="{}">Комментарии ({})</a>', url, count)
+
+    comments_link.short_description = 'Комментарии'
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        В PostgreSQL ищет по GIN-индексу search_vector, а точное совпадение логина
+        автора — по индексу внешнего ключа, вместо icontains по трём колонкам с JOIN.
+        """
+        search_term = search_term.strip()
+        if not search_term or not supports_full_text(queryset):
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q(search_vector=search_query(search_term))
+        author_id = user_id_by_username(search_term)
+        if author_id is not None:
+            condition |= Q(author_id=author_id)
+        return queryset.filter(condition), False
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -66,7 +171,12 @@ class CollectAdmin(admin.ModelAdmin):
                 'collect/<int:pk>/end/',
                 self.admin_site.admin_view(self.end_collect_view),
                 name='collect_end'
-            )
+            ),
+            path(
+                'collect/<int:pk>/comments/',
+                self.admin_site.admin_view(self.comments_view),
+                name='collect_comments'
+            ),
         ]
         return custom_urls + urls
 
@@ -76,26 +186,100 @@ class CollectAdmin(admin.ModelAdmin):
         collect.end_at = timezone.now()
         if not collect.close_reason:
             collect.close_reason = "Завершено администратором."
-        collect.save()
-
-        if collect.author.email:
-            send_mail(
-                f'Ваш сбор "{collect.title}" завершён',
-                f'Здравствуйте, {collect.author.username}!\n\n'
-                f'Ваш сбор "{collect.title}" был завершён администратором.\n'
-                f'Причина: {collect.close_reason}',
-                settings.DEFAULT_FROM_EMAIL,
-                [collect.author.email]
-            )
+        with transaction.atomic():
+            collect.save()
+
+            if collect.author.email:
+                OutgoingEmail.enqueue(
+                    f'Ваш сбор "{collect.title}" завершён',
+                    f'Здравствуйте, {collect.author.username}!\n\n'
+                    f'Ваш сбор "{collect.title}" был завершён администратором.\n'
+                    f'Причина: {collect.close_reason}',
+                    [collect.author.email]
+                )
 
         self.message_user(request, f"Сбор '{collect.title}' был успешно завершён.")
         return HttpResponseRedirect(reverse('admin:collect_app_collect_changelist'))
 
+    def comments_view(self, request, pk):
+        """
+        Комментарии сбора страницами по ``comments_per_page``: курсор идёт по
+        индексу comment_collect_created_idx, авторы читаются тем же запросом.
+        Отмеченные комментарии удаляются одним DELETE (``Comment.delete_selected``).
+        """
+        collect = get_object_or_404(Collect.objects.only('title'), pk=pk)
+        if not self.has_view_or_change_permission(request, collect):
+            raise PermissionDenied
+        has_delete_permission = request.user.has_perm('collect_app.delete_comment')
+
+        if request.method == 'POST':
+            if not has_delete_permission:
+                raise PermissionDenied
+            pks = [int(value) for value in request.POST.getlist('selected') if value.isdigit()]
+            with transaction.atomic():
+                deleted = Comment.delete_selected(collect.pk, pks)
+                if deleted:
+                    transaction.on_commit(partial(invalidate_tags, collect_tag(collect.pk), ACTIVE_LIST, ARCHIVE_LIST))
+            self.message_user(request, f"Удалено комментариев: {deleted}.")
+            return HttpResponseRedirect(request.get_full_path())
+
+        cursor = request.GET.get('cursor')
+        comments, next_cursor = keyset_page(
+            Comment.objects.filter(collect_id=collect.pk).select_related('author')
+            .only('text', 'created_at', 'author__username'),
+            ['-created_at', '-id'], cursor, self.comments_per_page,
+        )
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Комментарии к сбору "{collect.title}"',
+            'collect': collect,
+            'comments': comments,
+            'next_cursor': next_cursor,
+            'is_first_page': not cursor,
+            'has_delete_permission': has_delete_permission,
+        }
+        return TemplateResponse(request, 'admin/collect_app/collect/comments.html', context)
+
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdmin):
     list_display = ('collect', 'user', 'amount', 'created_at')
-    list_filter = ('collect', 'user')
+    list_filter = (('collect', AutocompleteFilter), ('user', AutocompleteFilter))
+    list_select_related = ('collect', 'user')
     search_fields = ('collect__title', 'user__username')
+    autocomplete_fields = ('collect', 'user')
+    search_collects_limit = 1000
+
+    def get_queryset(self, request):
+        # Для строки списка нужны только названия сбора и логин участника.
+        return super().get_queryset(request).defer(
+            'collect__description', 'collect__search_vector', 'collect__cover_renditions',
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        В PostgreSQL ищет сборы по GIN-индексу search_vector, участника — по
+        точному логину, а число — как номер платежа, вместо icontains по двум
+        JOIN на всей таблице платежей.
+        """
+        search_term = search_term.strip()
+        if not search_term or not supports_full_text(queryset):
+            return super().get_search_results(request, queryset, search_term)
+        collects = Collect.objects.filter(search_vector=search_query(search_term))
+        collect_ids = list(collects.values_list('pk', flat=True)[:self.search_collects_limit + 1])
+        if len(collect_ids) > self.search_collects_limit:
+            # Частое слово: платежи подходящих сборов быстро находятся обходом индекса по дате.
+            condition = Q(collect__in=collects.values('pk'))
+        else:
+            # Явный список даёт планировщику точную оценку, и платежи редкого сбора
+            # читаются по индексу сбора, а не перебором всей таблицы по дате.
+            condition = Q(collect_id__in=collect_ids)
+        user_id = user_id_by_username(search_term)
+        if user_id is not None:
+            condition |= Q(user_id=user_id)
+        if search_term.isdigit():
+            condition |= Q(pk=int(search_term))
+        return queryset.filter(condition), False
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -104,4 +288,36 @@ class ProfileAdmin(admin.ModelAdmin):
     def get_full_name(self, obj):
         return obj.user.get_full_name()
 
-    get_full_name.short_description = 'ФИО'
\ No newline at end of file
+    get_full_name.short_description = 'ФИО'
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('subject', 'body', 'recipients', 'attempts', 'last_error', 'created_at', 'sent_at')
+
+@admin.register(ImageTask)
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'source', 'status', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'object_id', 'source', 'attempts', 'last_error', 'created_at', 'processed_at')
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class IndexedUserAdmin(UserAdmin):
+    """
+    Пользователи ищутся по началу логина без учёта регистра (индекс
+    ``auth_user_username_upper_like_idx`` на ``UPPER(username)``, миграция
+    0018) — так работают и фильтры с автодополнением в сборах и платежах.
+    Стандартный поиск ``icontains`` по четырём колонкам читает всю таблицу.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term or not supports_full_text(queryset):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(username__istartswith=search_term), False
@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CollectViewSet, PaymentViewSet, UserViewSet
+from .views import (
+    CollectViewSet, PaymentViewSet, UserViewSet, for_server, api_collects, api_collect, api_payments, api_payment,
+    api_users, api_user, aapi_collects, aapi_collect, aapi_payments, aapi_payment, aapi_users, aapi_user, export_data,
+)
 
 router = DefaultRouter()
 router.register(r'collects', CollectViewSet)
@@ -8,5 +11,15 @@ router.register(r'payments', PaymentViewSet)
 router.register(r'users', UserViewSet)
 
 urlpatterns = [
+    # Чтение проекциями (projections), под ASGI — асинхронное; остальные методы эти представления передают вьюсетам.
+    path('collects/', for_server(api_collects, aapi_collects)),
+    path('collects/<int:pk>/', for_server(api_collect, aapi_collect)),
+    path('payments/', for_server(api_payments, aapi_payments)),
+    path('payments/<int:pk>/', for_server(api_payment, aapi_payment)),
+    path('users/', for_server(api_users, aapi_users)),
+    path('users/<int:pk>/', for_server(api_user, aapi_user)),
+    # Потоковые выгрузки для отчётов; до роутера, иначе export примут за pk.
+    path('payments/export/', export_data, {'resource': 'payments'}, name='export_payments'),
+    path('collects/export/', export_data, {'resource': 'collects'}, name='export_collects'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
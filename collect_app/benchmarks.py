@@ -0,0 +1,381 @@
+"""
+Бенчмарки горячих путей с бюджетами SQL-запросов.
+
+Каждый сценарий выполняется один раз «холодным» (теги кэша сброшены), затем
+``iterations`` раз «тёплым». Для сценария фиксируются перцентили задержки,
+максимальное число SQL-запросов и доля попаданий в кэш. Результаты
+сериализуются в JSON с хэшем коммита, поэтому прогоны можно сравнивать между
+коммитами (см. ``manage.py benchmark --compare``).
+
+``run_load`` — нагрузочный замер запущенного сервера (RPS и перцентили при
+заданной параллельности), чтобы сравнивать режимы ``gunicorn.conf.py``.
+"""
+import asyncio
+import json
+import random
+import re
+import subprocess
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+
+from . import projections
+from .caching import invalidate_tags, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
+from .models import Collect, CollectStats, Comment, Payment
+from .serializers import CollectSerializer, PaymentSerializer, UserSerializer
+from .utils import get_engine
+
+_MISSING = object()
+
+
+class Scenario:
+    """
+    Описание одного замера: ``path`` — функция ``(fixtures) -> URL``,
+    ``user`` — ключ пользователя в fixtures (None — аноним),
+    ``budget`` — максимально допустимое число SQL-запросов за запрос,
+    ``conditional`` — повторять запрос с ``If-None-Match`` из первого ответа,
+    ``reconnect`` — закрывать соединения с БД после каждого запроса, как в конце
+    настоящего запроса (тестовый клиент Django этого не делает): показывает цену
+    установки соединения и выигрыш пула ``collect_app.pooled_postgresql``.
+    """
+
+    def __init__(self, name, path, budget, method='get', user=None, data=None, status=200, conditional=False,
+                 reconnect=False):
+        self.name = name
+        self.path = path
+        self.budget = budget
+        self.method = method
+        self.user = user
+        self.data = data
+        self.status = status
+        self.conditional = conditional
+        self.reconnect = reconnect
+
+
+SCENARIOS = [
+    Scenario('home', lambda f: reverse('home'), budget=1),
+    Scenario('home_reconnect', lambda f: reverse('home'), budget=1, reconnect=True),
+    Scenario('archive', lambda f: reverse('archive'), budget=1),
+    Scenario('collect_detail', lambda f: reverse('collect_detail', args=[f['collect']]), budget=3),
+    Scenario('collect_detail_304', lambda f: reverse('collect_detail', args=[f['collect']]), budget=1,
+             status=304, conditional=True),
+    Scenario('payment_demo_post', lambda f: reverse('payment_demo', args=[f['collect']]), budget=10,
+             method='post', user='donor', data={'amount': 100}, status=302),
+    Scenario('admin_user_list', lambda f: reverse('admin_user_list'), budget=3, user='admin'),
+    Scenario('api_collect_list', lambda f: '/api/v1/collects/', budget=1),
+    Scenario('api_collect_detail', lambda f: f"/api/v1/collects/{f['collect']}/", budget=2),
+    Scenario('api_collect_detail_304', lambda f: f"/api/v1/collects/{f['collect']}/", budget=1,
+             status=304, conditional=True),
+    Scenario('api_payment_list', lambda f: '/api/v1/payments/', budget=1),
+    Scenario('api_payment_detail', lambda f: f"/api/v1/payments/{f['payment']}/", budget=1),
+    Scenario('api_user_list', lambda f: '/api/v1/users/', budget=1),
+    Scenario('api_user_detail', lambda f: f"/api/v1/users/{f['donor']}/", budget=1),
+]
+
+
+def prepare_fixtures(comments=200):
+    """
+    Готовит данные для сценариев поверх существующей БД: служебных пользователей,
+    активный сбор с ``comments`` комментариями и хотя бы один платёж.
+    """
+    admin, _ = User.objects.get_or_create(username='bench_admin', defaults={'is_superuser': True, 'is_staff': True})
+    donor, _ = User.objects.get_or_create(username='bench_donor')
+    collect = Collect.objects.filter(is_active=True, goal_amount__isnull=True).order_by('pk').first()
+    if collect is None:
+        collect = Collect.objects.create(
+            author=admin, title='Бенчмарк', occasion=Collect.Occasion.PROJECT,
+            description='Сбор для бенчмарков', is_active=True,
+        )
+    missing = comments - collect.comments.count()
+    if missing > 0:
+        Comment.objects.bulk_create(
+            Comment(collect=collect, author=donor, text=f'Комментарий {i}') for i in range(missing)
+        )
+        CollectStats.rebuild([collect.pk])
+    payment = collect.payments.first() or Payment.objects.create(collect=collect, user=donor, amount=100)
+    return {'admin': admin.pk, 'donor': donor.pk, 'collect': collect.pk, 'payment': payment.pk}
+
+
+@contextmanager
+def count_cache_hits(stats, alias='default'):
+    """Считает попадания и промахи ``get``/``get_many`` выбранного бэкенда кэша."""
+    backend = caches[alias]
+    original_get, original_get_many = backend.get, backend.get_many
+
+    def get(key, default=None, version=None):
+        value = original_get(key, _MISSING, version=version)
+        stats['hits' if value is not _MISSING else 'misses'] += 1
+        return default if value is _MISSING else value
+
+    def get_many(keys, version=None):
+        keys = list(keys)
+        found = original_get_many(keys, version=version)
+        stats['hits'] += len(found)
+        stats['misses'] += len(keys) - len(found)
+        return found
+
+    backend.get, backend.get_many = get, get_many
+    try:
+        yield stats
+    finally:
+        del backend.get, backend.get_many
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(scenario, fixtures, iterations=50):
+    client = Client()
+    if scenario.user:
+        client.force_login(User.objects.get(pk=fixtures[scenario.user]))
+    path = scenario.path(fixtures)
+    send = getattr(client, scenario.method)
+
+    headers = {}
+
+    def request():
+        response = send(path, scenario.data, **headers) if scenario.data is not None else send(path, **headers)
+        # В TestCase запрос идёт внутри транзакции теста, её соединение закрывать нельзя.
+        if scenario.reconnect and not connection.in_atomic_block:
+            connections.close_all()
+        if response.status_code != scenario.status:
+            raise AssertionError(f'{scenario.name}: {path} вернул {response.status_code}, ожидался {scenario.status}')
+
+    invalidate_tags(ACTIVE_LIST, ARCHIVE_LIST, collect_tag(fixtures['collect']))
+    if scenario.conditional:
+        headers['HTTP_IF_NONE_MATCH'] = send(path)['ETag']
+    with CaptureQueriesContext(connection) as cold:
+        request()
+    queries = len(cold)
+
+    timings = []
+    cache_stats = {'hits': 0, 'misses': 0}
+    with count_cache_hits(cache_stats):
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as warm:
+                started = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(warm))
+
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': queries,
+        'budget': scenario.budget,
+        'within_budget': queries <= scenario.budget,
+        'cache_hit_ratio': round(cache_stats['hits'] / lookups, 3) if lookups else None,
+    }
+
+
+# Путь цензуры до перехода на автомат: альтернация регулярных выражений
+# и затем profanity.censor, перекомпилирующий регулярку на каждое слово.
+LEGACY_RU_PATTERN = re.compile(r'(' + '|'.join([
+    r'п(и|е|ы)?з(д|т)', r'хуй', r'хую', r'хуя', r'хуе|ё', r'ёб', r'еб[а-я]*', r'бля[тд][ьи]?',
+    r'сука', r'мудак', r'пидор[а-я]*', r'гондон[а-я]*', r'чмо', r'сук(а|и)', r'сучка', r'сучье',
+]) + r')', flags=re.IGNORECASE)
+
+
+def legacy_censor(text):
+    from profanity import profanity
+    return LEGACY_RU_PATTERN.sub('***', profanity.censor(text))
+
+
+def censor_texts(count=100, length=5000, seed=42):
+    """Детерминированные длинные описания с редкими вкраплениями мата."""
+    rng = random.Random(seed)
+    words = ['сбор', 'подарок', 'друзья', 'помощь', 'проект', 'праздник', 'коллеги', 'spasibo', 'help', 'вместе']
+    words += ['сука', 'fuck'] + words * 20
+    texts = []
+    for _ in range(count):
+        text = []
+        size = 0
+        while size < length:
+            word = rng.choice(words)
+            text.append(word)
+            size += len(word) + 1
+        texts.append(' '.join(text))
+    return texts
+
+
+def run_censor_benchmark(count=100, length=5000, iterations=5):
+    """Время цензуры пачки описаний (мс на пачку): прежний путь, автомат по строке и пачкой."""
+    texts = censor_texts(count, length)
+    engine = get_engine()
+    variants = {
+        'legacy': lambda: [legacy_censor(text) for text in texts],
+        'engine': lambda: [engine.censor(text) for text in texts],
+        'engine_batch': lambda: engine.censor_many(texts),
+    }
+    results = {}
+    for name, run in variants.items():
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {'p50_ms': round(percentile(timings, 50), 3), 'min_ms': round(min(timings), 3)}
+    return {'texts': count, 'length': length, 'results': results}
+
+
+# Ресурс API → (проекция, сериализатор, выборка для DRF, сортировка, поля разреженного ответа).
+API_RESOURCES = {
+    'collects': (
+        projections.COLLECT, CollectSerializer, Collect.objects.select_related('stats'), ('-created_at', '-id'),
+        'id,title,raised_amount,get_raised_percentage',
+    ),
+    'payments': (projections.PAYMENT, PaymentSerializer, Payment.objects.all(), ('-created_at', '-id'), 'id,amount'),
+    'users': (projections.USER, UserSerializer, User.objects.all(), ('id',), 'id,username'),
+}
+
+
+def run_api_benchmark(rows=10000, iterations=5):
+    """
+    Страница API из ``rows`` строк (мс и строк в секунду): сериализаторы DRF с
+    ``JSONRenderer``, проекция ``values_list()`` с orjson и проекция с
+    ``?fields=``. Замеряются выборка и сборка JSON, без HTTP и кэша.
+    """
+    request = RequestFactory().get('/api/')
+    results = {}
+    for resource, (projection, serializer, queryset, ordering, sparse) in API_RESOURCES.items():
+        def drf():
+            page = list(queryset.order_by(*ordering)[:rows])
+            return JSONRenderer().render(serializer(page, many=True, context={'request': request}).data)
+
+        def projected(fields):
+            page_rows, _, build = projection.select(queryset.model.objects.all(), projection.field_names(fields), ordering)
+            return projections.render(build(list(page_rows.order_by(*ordering)[:rows]), request))
+
+        count = queryset.order_by()[:rows].count()
+        variants = {'drf': drf, 'projection': lambda: projected(None), 'projection_sparse': lambda: projected(sparse)}
+        for name, run in variants.items():
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            p50 = percentile(timings, 50)
+            results[f'{resource}/{name}'] = {
+                'rows': count,
+                'p50_ms': round(p50, 3),
+                'rows_per_s': round(count / p50 * 1000) if p50 else 0,
+            }
+    return {'rows': rows, 'results': results}
+
+
+async def _fetch(host, port, request):
+    """Один запрос по новому соединению (синхронные воркеры gunicorn не держат keep-alive); возвращает статус."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _load(url, concurrency, total):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += f'?{parts.query}'
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+        'Accept: application/json, text/html\r\nConnection: close\r\n\r\n'
+    ).encode()
+    timings, statuses = [], Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                statuses[await _fetch(parts.hostname, parts.port or 80, request)] += 1
+            except (OSError, IndexError, ValueError):
+                statuses['error'] += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, timings, statuses
+
+
+def run_load(url, concurrency=100, requests=2000):
+    """
+    Нагрузка на запущенный сервер: ``requests`` GET-запросов к ``url`` из
+    ``concurrency`` параллельных соединений. Клиент на asyncio, без зависимостей.
+    """
+    elapsed, timings, statuses = asyncio.run(_load(url, concurrency, requests))
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': requests,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(iterations=50, comments=200, names=None):
+    fixtures = prepare_fixtures(comments=comments)
+    scenarios = [scenario for scenario in SCENARIOS if not names or scenario.name in names]
+    return {
+        'commit': current_commit(),
+        'database': connection.vendor,
+        'iterations': iterations,
+        'results': {scenario.name: run_scenario(scenario, fixtures, iterations) for scenario in scenarios},
+    }
+
+
+def compare(current, baseline):
+    """Строки отчёта об изменении p95 и числа запросов относительно базового прогона."""
+    lines = [f"{current['commit']} против {baseline.get('commit', '?')}"]
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            lines.append(f'{name:24} новый сценарий')
+            continue
+        delta = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+        lines.append(
+            f"{name:24} p95 {before['p95_ms']:>9.2f} → {result['p95_ms']:>9.2f} мс ({delta:+.1f}%)  "
+            f"запросов {before['queries']} → {result['queries']}"
+        )
+    return lines
+
+
+def dump(report, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
@@ -0,0 +1,222 @@
+"""
+Тегированное кэширование страниц.
+
+Каждая закэшированная страница помечается набором тегов (например, ``collect:42``
+или ``collects:active``). Версии тегов хранятся в кэше и входят в ключ страницы,
+поэтому инвалидация — это увеличение версии тега: старые ключи перестают
+использоваться и вытесняются по TTL, а остальной кэш не затрагивается.
+
+Страница, прочитанная с реплики вскоре после инвалидации её тегов, не
+кэшируется: реплика могла ещё не получить запись, и устаревшая страница
+осталась бы под новой версией тегов до истечения TTL.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.utils.cache import has_vary_header, patch_response_headers, patch_vary_headers
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_headers
+
+from . import replicas
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_LIST = 'collects:active'
+ARCHIVE_LIST = 'collects:archive'
+
+STATS_INVALIDATIONS = 'cachetags:stats:invalidations'
+STATS_PAGES = 'cachetags:stats:pages'
+
+
+def collect_tag(pk):
+    return f'collect:{pk}'
+
+
+def list_tag(is_active):
+    return ACTIVE_LIST if is_active else ARCHIVE_LIST
+
+
+def _version_key(tag):
+    return f'cachetags:version:{tag}'
+
+
+def _mtime_key(tag):
+    return f'cachetags:mtime:{tag}'
+
+
+def _pages_key(tag, version):
+    return f'cachetags:pages:{tag}:{version}'
+
+
+def _initial_version():
+    # Версия не должна повторяться после вытеснения ключа из кэша,
+    # поэтому отсчёт начинается с текущего времени в миллисекундах.
+    return int(time.time() * 1000)
+
+
+def get_tag_versions(tags):
+    """Возвращает текущие версии тегов за один запрос к кэшу."""
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    for tag in tags:
+        if tag not in versions:
+            cache.add(_version_key(tag), _initial_version(), timeout=None)
+            versions[tag] = cache.get(_version_key(tag))
+    return versions
+
+
+async def aget_tag_versions(tags):
+    """Асинхронный вариант ``get_tag_versions``."""
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = {keys[key]: value for key, value in (await cache.aget_many(keys)).items()}
+    for tag in tags:
+        if tag not in versions:
+            await cache.aadd(_version_key(tag), _initial_version(), timeout=None)
+            versions[tag] = await cache.aget(_version_key(tag))
+    return versions
+
+
+def invalidate_tags(*tags):
+    """
+    Инвалидирует все страницы, помеченные любым из тегов.
+    Возвращает число закэшированных страниц, которые стали недействительны.
+    """
+    tags = sorted(set(tags))
+    versions = get_tag_versions(tags)
+    counters = cache.get_many([_pages_key(tag, versions[tag]) for tag in tags])
+    pages = sum(counters.values())
+
+    for tag in tags:
+        try:
+            cache.incr(_version_key(tag))
+        except ValueError:
+            cache.set(_version_key(tag), _initial_version(), timeout=None)
+    cache.set_many({_mtime_key(tag): time.time() for tag in tags}, timeout=None)
+
+    cache.add(STATS_INVALIDATIONS, 0, timeout=None)
+    cache.add(STATS_PAGES, 0, timeout=None)
+    cache.incr(STATS_INVALIDATIONS)
+    cache.incr(STATS_PAGES, pages)
+    logger.info('Cache invalidation: tags=%s pages=%d', ','.join(tags), pages)
+    return pages
+
+
+def get_tag_mtime(tags):
+    """Время последней инвалидации любого из тегов (Unix time) или None, если неизвестно."""
+    mtimes = cache.get_many([_mtime_key(tag) for tag in tags])
+    return max(mtimes.values()) if len(mtimes) == len(tags) else None
+
+
+async def aget_tag_mtime(tags):
+    mtimes = await cache.aget_many([_mtime_key(tag) for tag in tags])
+    return max(mtimes.values()) if len(mtimes) == len(tags) else None
+
+
+def _maybe_stale(tags):
+    if not replicas.read_from_replica():
+        return False
+    mtime = get_tag_mtime(tags)
+    return mtime is not None and time.time() - mtime < replicas.staleness_bound()
+
+
+async def _amaybe_stale(tags):
+    if not replicas.read_from_replica():
+        return False
+    mtime = await aget_tag_mtime(tags)
+    return mtime is not None and time.time() - mtime < replicas.staleness_bound()
+
+
+def invalidation_stats():
+    """Суммарное число инвалидаций и затронутых ими страниц."""
+    stats = cache.get_many([STATS_INVALIDATIONS, STATS_PAGES])
+    return {
+        'invalidations': stats.get(STATS_INVALIDATIONS, 0),
+        'pages': stats.get(STATS_PAGES, 0),
+    }
+
+
+def cache_page_tagged(timeout, tags, vary=()):
+    """
+    Аналог ``cache_page``, в ключ которого входят версии тегов.
+
+    ``tags`` — список тегов либо функция ``(request, *args, **kwargs) -> список тегов``
+    для тегов, зависящих от параметров URL. ``vary`` — заголовки запроса, от которых
+    зависит страница (добавляются в Vary ответа).
+
+    ``cache_page`` в Django 4.2 не поддерживает асинхронные представления, поэтому
+    для них страница кэшируется напрямую асинхронным API кэша под ключом из версий
+    тегов, URL и заголовков ``vary``.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _async_cache_page_tagged(view_func, timeout, tags, vary)
+        if vary:
+            view_func = vary_on_headers(*vary)(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            view_tags = sorted(tags(request, *args, **kwargs) if callable(tags) else tags)
+            versions = get_tag_versions(view_tags)
+            key_prefix = '.'.join(f'{tag}@{versions[tag]}' for tag in view_tags)
+
+            def render(request, *args, **kwargs):
+                response = view_func(request, *args, **kwargs)
+                # Флаг выставляет FetchFromCacheMiddleware, а читает UpdateCacheMiddleware после представления.
+                if getattr(request, '_cache_update_cache', False) and _maybe_stale(view_tags):
+                    request._cache_update_cache = False
+                return response
+
+            response = cache_page(timeout, key_prefix=key_prefix)(render)(request, *args, **kwargs)
+
+            if getattr(request, '_cache_update_cache', False) and response.status_code == 200:
+                for tag in view_tags:
+                    key = _pages_key(tag, versions[tag])
+                    cache.add(key, 0, timeout=timeout)
+                    cache.incr(key)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def _page_key(request, key_prefix, vary):
+    parts = [request.build_absolute_uri(), *(request.headers.get(header, '') for header in vary)]
+    return f"cachetags:page:{key_prefix}:{hashlib.md5('|'.join(parts).encode()).hexdigest()}"
+
+
+def _async_cache_page_tagged(view_func, timeout, tags, vary):
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await view_func(request, *args, **kwargs)
+        view_tags = sorted(tags(request, *args, **kwargs) if callable(tags) else tags)
+        versions = await aget_tag_versions(view_tags)
+        key = _page_key(request, '.'.join(f'{tag}@{versions[tag]}' for tag in view_tags), vary)
+        response = await cache.aget(key)
+        if response is not None:
+            return response
+
+        response = await view_func(request, *args, **kwargs)
+        patch_vary_headers(response, vary)
+        # Те же ограничения, что у UpdateCacheMiddleware: не кэшируем ошибки, потоки,
+        # приватные ответы и cookie, выданные запросу без cookie.
+        cacheable = (
+            response.status_code == 200 and not response.streaming
+            and 'private' not in response.get('Cache-Control', '')
+            and not (not request.COOKIES and response.cookies and has_vary_header(response, 'Cookie'))
+        )
+        if cacheable and await _amaybe_stale(view_tags):
+            return response
+        if cacheable:
+            patch_response_headers(response, timeout)
+            await cache.aset(key, response, timeout)
+            for tag in view_tags:
+                counter = _pages_key(tag, versions[tag])
+                await cache.aadd(counter, 0, timeout=timeout)
+                await cache.aincr(counter)
+        return response
+    return _wrapped_view
+
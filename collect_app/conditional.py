@@ -0,0 +1,178 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для страниц и API сборов.
+
+Версия сбора — ``Collect.updated_at``, её меняют все пути записи сбора, платежей
+и комментариев; версия списков — версии тегов кэша (см. ``caching``). Ответ 304
+отдаётся после одного чтения версии: из БД для сбора, из кэша для списков.
+
+HTML-страницы зависят от посетителя (формы, кнопки автора), поэтому в их ETag
+входит отпечаток cookie сессии — он меняется при входе и выходе и не требует
+запросов к БД. Пока у посетителя есть непоказанные flash-сообщения, условные
+заголовки не выставляются, чтобы сообщение не потерялось за ответом 304.
+
+Декораторы подходят и для асинхронных представлений: ``condition`` в Django 4.2
+их не поддерживает, поэтому для них версии читаются асинхронным ORM и API кэша,
+а проверка заголовков выполняется той же ``get_conditional_response``. ETag
+выставляется всегда, когда известна версия, и проверяется раньше даты;
+Last-Modified с секундной точностью не даёт 304 на устаревшую копию (см.
+``_conditional_response``).
+"""
+import hashlib
+import math
+from calendar import timegm
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .caching import aget_tag_mtime, aget_tag_versions, get_tag_versions, get_tag_mtime
+from .models import Collect
+
+
+def _viewer(request):
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return hashlib.sha1(session.encode()).hexdigest()[:12] if session else 'anon'
+
+
+def _has_pending_messages(request):
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+async def _ahas_pending_messages(request):
+    # Без cookie сообщений их нет и в сессии: FallbackStorage пишет в сессию только
+    # переполнение cookie. С cookie проверка может прочитать сессию — уходим в поток.
+    if CookieStorage.cookie_name not in request.COOKIES:
+        return False
+    return await sync_to_async(_has_pending_messages)(request)
+
+
+def collect_version(request, pk):
+    """``updated_at`` сбора; читается из БД один раз за запрос."""
+    versions = request.__dict__.setdefault('_collect_versions', {})
+    if pk not in versions:
+        versions[pk] = Collect.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return versions[pk]
+
+
+async def acollect_version(request, pk):
+    versions = request.__dict__.setdefault('_collect_versions', {})
+    if pk not in versions:
+        versions[pk] = await Collect.objects.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+    return versions[pk]
+
+
+def _conditional_response(request, etag, last_modified):
+    """
+    Проверка условных заголовков: ``(ответ 304/412 или None, ETag, Last-Modified)``.
+
+    Last-Modified передаётся с точностью до секунды, а версии — до микросекунды,
+    поэтому две записи за одну секунду дают одинаковый Last-Modified. Чтобы
+    клиент, присылающий только If-Modified-Since, не получил 304 на устаревшую
+    копию, дата сравнивается с версией, округлённой вверх: 304 по дате
+    отдаётся, только если версия не новее присланной секунды. Основной
+    валидатор — ETag с полной версией; If-None-Match проверяется первым.
+    """
+    etag = quote_etag(etag) if etag else None
+    if last_modified is None:
+        header = check = None
+    else:
+        header = timegm(last_modified.utctimetuple())
+        check = math.ceil(last_modified.timestamp())
+    return get_conditional_response(request, etag=etag, last_modified=check), etag, header
+
+
+def _set_validators(request, response, etag, last_modified):
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+    return response
+
+
+def _condition(validators, avalidators):
+    """
+    Аналог ``condition`` для синхронных и асинхронных представлений:
+    ``validators(request, *args, **kwargs) -> (etag, last_modified)`` и его
+    асинхронный вариант ``avalidators``.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def ainner(request, *args, **kwargs):
+                response, etag, last_modified = _conditional_response(
+                    request, *await avalidators(request, *args, **kwargs)
+                )
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                return _set_validators(request, response, etag, last_modified)
+            return ainner
+
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            response, etag, last_modified = _conditional_response(request, *validators(request, *args, **kwargs))
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            return _set_validators(request, response, etag, last_modified)
+        return inner
+    return decorator
+
+
+def _collect_etag(request, pk, version, per_viewer):
+    parts = [f'collect{pk}', f'{version.timestamp():.6f}']
+    if per_viewer:
+        parts.append(_viewer(request))
+    return '-'.join(parts)
+
+
+def collect_condition(per_viewer=False):
+    """ETag/Last-Modified для представления одного сбора (параметр URL ``pk``)."""
+    def validators(request, *args, pk, **kwargs):
+        if per_viewer and _has_pending_messages(request):
+            return None, None
+        version = collect_version(request, int(pk))
+        if version is None:
+            return None, None
+        return _collect_etag(request, pk, version, per_viewer), version
+
+    async def avalidators(request, *args, pk, **kwargs):
+        if per_viewer and await _ahas_pending_messages(request):
+            return None, None
+        version = await acollect_version(request, int(pk))
+        if version is None:
+            return None, None
+        return _collect_etag(request, pk, version, per_viewer), version
+
+    return _condition(validators, avalidators)
+
+
+def _tags_etag(request, tags, versions, per_viewer):
+    parts = [f'{tag}@{versions[tag]}' for tag in sorted(tags)]
+    if per_viewer:
+        parts.append(_viewer(request))
+    return '.'.join(parts)
+
+
+def _mtime_datetime(mtime):
+    return datetime.fromtimestamp(mtime, tz=timezone.utc) if mtime is not None else None
+
+
+def tags_condition(tags, per_viewer=False):
+    """ETag/Last-Modified для страниц, закэшированных по тегам (списки сборов)."""
+    def validators(request, *args, **kwargs):
+        if per_viewer and _has_pending_messages(request):
+            return None, None
+        return _tags_etag(request, tags, get_tag_versions(tags), per_viewer), _mtime_datetime(get_tag_mtime(tags))
+
+    async def avalidators(request, *args, **kwargs):
+        if per_viewer and await _ahas_pending_messages(request):
+            return None, None
+        versions = await aget_tag_versions(tags)
+        return _tags_etag(request, tags, versions, per_viewer), _mtime_datetime(await aget_tag_mtime(tags))
+
+    return _condition(validators, avalidators)
@@ -0,0 +1,275 @@
+"""
+Пул соединений Postgres для бэкенда ``collect_app.pooled_postgresql``.
+
+Django закрывает соединение в конце каждого запроса (``CONN_MAX_AGE = 0``), а
+бэкенд с пулом вместо закрытия возвращает его сюда; следующий запрос того же
+процесса берёт готовое соединение без TCP-рукопожатия и аутентификации. Пул
+общий для всех потоков процесса, поэтому работает и под WSGI, и под ASGI, где
+асинхронный ORM выполняет запросы в разных потоках.
+
+* ``MAX_SIZE`` — сколько соединений процесс держит открытыми; при исчерпании
+  запрос ждёт освободившееся соединение не дольше ``TIMEOUT`` секунд.
+* ``MIN_SIZE`` — сколько простаивающих соединений не закрываются по ``MAX_IDLE``.
+* ``MAX_AGE`` — соединение старше этого закрывается при возврате и выдаче.
+* ``CHECK_IDLE`` — соединение, простоявшее дольше, перед выдачей проверяется
+  запросом ``SELECT 1``; закрытое сервером заменяется новым.
+
+Метрики: ожидание соединения попадает в ``Server-Timing`` запроса (см.
+``instrumentation``), сводка по пулам процесса — в ``pool_stats``.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from .instrumentation import current_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10.0,
+    'MAX_AGE': 1800.0,
+    'MAX_IDLE': 300.0,
+    'CHECK_IDLE': 30.0,
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Свободное соединение не появилось за ``TIMEOUT``; Django превращает это в ``OperationalError``."""
+
+
+class _Waiter:
+    """Запрос, ждущий соединения: ему передаётся ``(соединение, когда возвращено)`` или место для нового (None)."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.handoff = None
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул. Ожидающие обслуживаются по очереди: освободившееся
+    соединение передаётся первому из них, а не достаётся тому, кто первым
+    захватит блокировку, — иначе поток, вернувший соединение, тут же забирал бы
+    его снова, а остальные ждали бы до ``TIMEOUT``.
+    """
+
+    def __init__(self, host, database, min_size, max_size, timeout, max_age, max_idle, check_idle):
+        self.name = f'{host}/{database}'
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self._idle = deque()  # (соединение, когда возвращено); выдаётся последнее возвращённое
+        self._born = {}  # соединение → когда открыто
+        self._opening = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.wait_max = 0.0
+
+    @property
+    def size(self):
+        return len(self._born) + self._opening
+
+    def getconn(self, connect):
+        """Выдаёт соединение из пула или открывает новое через ``connect()``."""
+        started = time.monotonic()
+        waited = False
+        while True:
+            waiter = None
+            with self._lock:
+                if self._waiters or (not self._idle and self.size >= self.max_size):
+                    waiter = _Waiter()
+                    self._waiters.append(waiter)
+                elif self._idle:
+                    handoff = self._idle.pop()
+                else:
+                    self._opening += 1
+                    handoff = None
+            if waiter is not None:
+                waited = True
+                handoff = self._wait(waiter, started)
+
+            if handoff is None:
+                connection = self._open(connect)
+            elif not self._usable(*handoff):
+                continue
+            else:
+                connection = handoff[0]
+            break
+
+        wait = time.monotonic() - started
+        with self._lock:
+            self.counters['checkouts'] += 1
+            self.counters['waits'] += waited
+            self.counters['wait_time'] += wait
+            self.wait_max = max(self.wait_max, wait)
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.pool_wait += wait
+        return connection
+
+    def putconn(self, connection):
+        """Возвращает соединение; оборванное, в транзакции или устаревшее закрывается."""
+        if not connection.closed and connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                pass
+        if connection.closed or connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            return self._discard(connection, 'broken')
+        if time.monotonic() - self._born.get(connection, 0) > self.max_age:
+            return self._discard(connection, 'age')
+        stale = []
+        with self._lock:
+            if self._waiters:
+                self._hand_over(self._waiters.popleft(), (connection, time.monotonic()))
+                return
+            self._idle.append((connection, time.monotonic()))
+            # Давно простаивающие соединения лежат в начале очереди.
+            while len(self._born) - len(stale) > self.min_size and time.monotonic() - self._idle[0][1] > self.max_idle:
+                stale.append(self._idle.popleft()[0])
+        for idle_connection in stale:
+            self._discard(idle_connection, 'idle')
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection, 'shutdown')
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - born for born in self._born.values()]
+            checkouts = self.counters['checkouts']
+            return {
+                'name': self.name,
+                'size': len(self._born),
+                'idle': len(self._idle),
+                'in_use': len(self._born) - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': checkouts,
+                'exhausted': self.counters['waits'],
+                'timeouts': self.counters['timeouts'],
+                'wait_ms_avg': round(self.counters['wait_time'] / checkouts * 1000, 3) if checkouts else 0,
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+                'opened': self.counters['opened'],
+                'closed': {
+                    reason: self.counters[f'closed_{reason}']
+                    for reason in ('age', 'idle', 'broken', 'check', 'shutdown')
+                },
+                'age_s_max': round(max(ages), 1) if ages else 0,
+                'age_s_avg': round(sum(ages) / len(ages), 1) if ages else 0,
+            }
+
+    def _wait(self, waiter, started):
+        waiter.event.wait(max(0, started + self.timeout - time.monotonic()))
+        with self._lock:
+            if not waiter.event.is_set():
+                self._waiters.remove(waiter)
+                self.counters['timeouts'] += 1
+                raise PoolTimeout(f'Пул {self.name}: нет свободного соединения за {self.timeout} с')
+        return waiter.handoff
+
+    @staticmethod
+    def _hand_over(waiter, handoff):
+        waiter.handoff = handoff
+        waiter.event.set()
+
+    def _free_slot(self):
+        """Место закрытого соединения достаётся первому ожидающему (вызывается под блокировкой)."""
+        if self._waiters and self.size < self.max_size:
+            self._opening += 1
+            self._hand_over(self._waiters.popleft(), None)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._lock:
+                self._opening -= 1
+                self._free_slot()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._born[connection] = time.monotonic()
+            self.counters['opened'] += 1
+        return connection
+
+    def _usable(self, connection, returned_at):
+        """Проверка при выдаче; непригодное соединение закрывается."""
+        now = time.monotonic()
+        if connection.closed:
+            self._discard(connection, 'broken')
+            return False
+        if now - self._born[connection] > self.max_age:
+            self._discard(connection, 'age')
+            return False
+        if now - returned_at > self.check_idle:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except psycopg2.Error:
+                logger.info('Пул %s: соединение закрыто сервером, открываю новое', self.name)
+                self._discard(connection, 'check')
+                return False
+        return True
+
+    def _discard(self, connection, reason):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._born.pop(connection, None)
+            self.counters[f'closed_{reason}'] += 1
+            self._free_slot()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(settings_dict, conn_params):
+    """
+    Пул процесса для параметров подключения. Ключ включает PID: после fork
+    (gunicorn с ``preload_app``) дочерний процесс заводит собственные пулы.
+    """
+    key = (os.getpid(), repr(sorted(conn_params.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+                pool = _pools[key] = ConnectionPool(
+                    conn_params.get('host') or 'localhost', conn_params.get('dbname'),
+                    options['MIN_SIZE'], options['MAX_SIZE'], options['TIMEOUT'],
+                    options['MAX_AGE'], options['MAX_IDLE'], options['CHECK_IDLE'],
+                )
+    return pool
+
+
+def close_pools(database=None):
+    """Закрывает простаивающие соединения пулов процесса (всех или к базе ``database``)."""
+    for pool in list(_pools.values()):
+        if database is None or pool.database == database:
+            pool.close()
+
+
+def pool_stats():
+    pid = os.getpid()
+    return [pool.stats() for (owner, _), pool in list(_pools.items()) if owner == pid]
@@ -0,0 +1,59 @@
+"""
+Кэширование фрагментов: готовый HTML карточек сбора.
+
+Ключ карточки включает ``Collect.updated_at``, поэтому любое изменение сбора,
+его платежей или комментариев даёт новый ключ, а старые фрагменты вытесняются
+по TTL. Страница списка получает все карточки одним ``get_many`` и дорисовывает
+только недостающие; части, зависящие от посетителя, остаются в ``home.html``.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Увеличивать при изменении collect_card.html, чтобы не отдавать устаревшую разметку.
+CARD_TEMPLATE_VERSION = 2
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(collect):
+    return f'card:v{CARD_TEMPLATE_VERSION}:{collect.pk}:{collect.updated_at.timestamp():.6f}'
+
+
+def _render_missing(keys, collects, cached):
+    return {
+        key: render_to_string('collect_card.html', {'collect': collect})
+        for key, collect in zip(keys, collects) if key not in cached
+    }
+
+
+def render_cards(collects):
+    """Список пар ``(сбор, HTML карточки)`` в исходном порядке."""
+    collects = list(collects)
+    keys = [card_key(collect) for collect in collects]
+    cached = cache.get_many(keys)
+    missing = _render_missing(keys, collects, cached)
+    if missing:
+        cache.set_many(missing, timeout=CARD_TIMEOUT)
+        cached.update(missing)
+    return [(collect, mark_safe(cached[key])) for key, collect in zip(keys, collects)]
+
+
+async def arender_cards(collects):
+    """Асинхронный вариант ``render_cards``: шаблон карточки не обращается к БД и рендерится на месте."""
+    collects = list(collects)
+    keys = [card_key(collect) for collect in collects]
+    cached = await cache.aget_many(keys)
+    missing = _render_missing(keys, collects, cached)
+    if missing:
+        await cache.aset_many(missing, timeout=CARD_TIMEOUT)
+        cached.update(missing)
+    return [(collect, mark_safe(cached[key])) for key, collect in zip(keys, collects)]
+
+
+class CollectCardsMixin:
+    """Добавляет в контекст ``ListView`` готовые карточки ``cards`` для объектов страницы."""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cards'] = render_cards(context['object_list'])
+        return context
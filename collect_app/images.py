@@ -0,0 +1,172 @@
+"""
+Обработка загруженных изображений: обложек сборов и аватаров.
+
+Загрузка только ставит задачу ``ImageTask`` в той же транзакции, что и сохранение
+модели, а воркер ``process_images`` в фоне:
+
+* поворачивает изображение по EXIF и удаляет метаданные (в том числе геолокацию)
+  из оригинала, ограничивая его размер ``MAX_DIMENSION``; очищенный оригинал
+  записывается под новым именем, потому что nginx кэширует ``/media/`` на неделю
+  и по старому URL клиенты получали бы файл с метаданными;
+* строит уменьшенные копии (renditions) в WebP и JPEG для каждого размера из
+  ``RENDITIONS``; их описание сохраняется в JSON-поле модели и выводится в
+  шаблонах через ``srcset`` (см. ``templatetags/collect_images.py``).
+
+Имена копий уникальны для каждого загруженного файла, поэтому nginx отдаёт их
+с неограниченным временем кэширования.
+"""
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Оригинал больше этого размера по длинной стороне уменьшается.
+MAX_DIMENSION = 2560
+
+# Набор копий: имя → (ширины для srcset, соотношение сторон для обрезки или None).
+RENDITIONS = {
+    'cover': {
+        'card': ((400, 800), 2.0),
+        'detail': ((800, 1600), None),
+    },
+    'avatar': {
+        'thumb': ((50, 100), 1.0),
+        'profile': ((150, 300), 1.0),
+    },
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+RENDITIONS_DIR = 'renditions'
+
+# Форматы, в которых перезаписывается оригинал, по расширению файла; остальные
+# форматы перекодируются в JPEG с расширением ``JPEG_EXTENSION``.
+ORIGINAL_FORMATS = {
+    '.png': ('PNG', {'optimize': True}),
+    '.webp': FORMATS['webp'],
+    '.jpg': FORMATS['jpeg'],
+    '.jpeg': FORMATS['jpeg'],
+}
+JPEG_EXTENSION = '.jpg'
+
+
+def open_image(field_file):
+    """
+    Читает изображение, поворачивает его по EXIF и приводит к RGB.
+    Возвращает ``(изображение, есть ли в файле метаданные)``.
+    """
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    has_metadata = bool(image.getexif()) or any(key in image.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+    return _to_rgb(ImageOps.exif_transpose(image)), has_metadata
+
+
+def _to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG не поддерживает прозрачность: подкладываем белый фон.
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, output_format):
+    """Кодирует изображение без метаданных: Pillow не переносит EXIF, если его не передать явно."""
+    pil_format, options = output_format
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def resize(image, width, aspect):
+    """Копия шириной ``width`` (без увеличения); при заданном ``aspect`` — с обрезкой по центру."""
+    width = min(width, image.width)
+    if aspect:
+        height = min(round(width / aspect), image.height)
+        width = min(width, round(height * aspect))
+        return ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def strip_original(field_file, image, has_metadata):
+    """
+    Записывает оригинал без метаданных и с ограниченным размером под новым
+    именем (расширение соответствует формату) и переключает на него
+    ``field_file.name``. Прежний файл не удаляется: его удаляет вызывающий код,
+    когда новое имя сохранено в модели. Возвращает изображение, с которого
+    строятся копии.
+    """
+    if max(image.size) > MAX_DIMENSION:
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
+    elif not has_metadata:
+        return image
+    stem, extension = posixpath.splitext(field_file.name)
+    extension = extension.lower()
+    if extension not in ORIGINAL_FORMATS:
+        extension = JPEG_EXTENSION
+    content = encode(image, ORIGINAL_FORMATS[extension])
+    token = hashlib.sha1(content.read()).hexdigest()[:8]
+    content.seek(0)
+    field_file.name = field_file.storage.save(f'{stem}-{token}{extension}', content)
+    return image
+
+
+def build_renditions(field_file, kind):
+    """
+    Обрабатывает файл и возвращает описание копий для JSON-поля модели:
+    ``{'source': имя оригинала, 'sizes': {имя: {'width': ..., 'height': ...,
+    'webp': [[путь, ширина], ...], 'jpeg': [...]}}}``. По ``source`` шаблоны
+    отличают копии текущего файла от копий заменённого, ещё не обработанного.
+    Если оригинал пришлось очистить, ``source`` — имя очищенного файла
+    (см. ``strip_original``).
+    """
+    image = strip_original(field_file, *open_image(field_file))
+    storage = field_file.storage
+    stem = posixpath.splitext(posixpath.basename(field_file.name))[0]
+    token = hashlib.sha1(field_file.name.encode()).hexdigest()[:8]
+
+    sizes = {}
+    for name, (widths, aspect) in RENDITIONS[kind].items():
+        entry = {fmt: [] for fmt in FORMATS}
+        seen = set()
+        for width in widths:
+            copy = resize(image, width, aspect)
+            if copy.width in seen:
+                continue
+            seen.add(copy.width)
+            if 'width' not in entry:
+                entry['width'], entry['height'] = copy.size
+            for fmt in FORMATS:
+                path = posixpath.join(RENDITIONS_DIR, f'{kind}s', f'{stem}-{token}-{name}-{copy.width}w.{fmt}')
+                entry[fmt].append([storage.save(path, encode(copy, FORMATS[fmt])), copy.width])
+        sizes[name] = entry
+    return {'source': field_file.name, 'sizes': sizes}
+
+
+def current_rendition(field_file, renditions, name):
+    """Описание копии ``name`` для файла поля или None, если копии ещё не построены."""
+    if not field_file or not renditions or renditions.get('source') != field_file.name:
+        return None
+    return renditions['sizes'].get(name)
+
+
+def rendition_paths(renditions):
+    sizes = (renditions or {}).get('sizes', {})
+    return {path for entry in sizes.values() for fmt in FORMATS for path, _ in entry.get(fmt, ())}
+
+
+def delete_renditions(storage, renditions, keep=None):
+    """Удаляет файлы прежних копий, кроме перечисленных в ``keep``."""
+    for path in rendition_paths(renditions) - rendition_paths(keep):
+        storage.delete(path)
@@ -0,0 +1,234 @@
+"""
+Телеметрия отдельного запроса: SQL, кэш Redis, шаблоны и письма.
+
+Метрики текущего запроса лежат в ContextVar, поэтому работают и под WSGI, и под ASGI.
+Источники подключаются без изменений в представлениях:
+
+* SQL — через обёртку ``execute_wrappers``, которую получает каждое соединение
+  при открытии (сигнал ``connection_created``);
+* кэш — через клиент ``InstrumentedRedisClient`` (``CACHES[...]['OPTIONS']['CLIENT_CLASS']``);
+* шаблоны — через бэкенд ``InstrumentedDjangoTemplates`` (``TEMPLATES[...]['BACKEND']``);
+* письма — через ``record_mail`` при постановке писем в outbox;
+* ожидание соединения из пула — через бэкенд ``collect_app.pooled_postgresql``.
+"""
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django_redis.client import DefaultClient
+
+logger = logging.getLogger('collect_app.slow_requests')
+
+_current = ContextVar('request_metrics', default=None)
+_MISSING = object()
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def sql_shape(sql):
+    """Нормализует SQL до «формы»: списки параметров IN и литералы схлопываются."""
+    return _LITERALS.sub('?', _IN_LIST.sub('(...)', sql))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sql = defaultdict(lambda: [0, 0.0])
+        self.cache_gets = 0
+        self.cache_hits = 0
+        self.cache_sets = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.mails = 0
+        self.pool_wait = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            stats = self.sql[sql_shape(sql)]
+            stats[0] += 1
+            stats[1] += duration
+
+    def top_sql(self, limit=5):
+        ranked = sorted(self.sql.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {'shape': shape, 'count': count, 'total_ms': round(total * 1000, 2)}
+            for shape, (count, total) in ranked
+        ]
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'pool;dur={self.pool_wait * 1000:.1f}',
+            f'cache;desc="{self.cache_hits}/{self.cache_gets} hits, {self.cache_sets} sets"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'mail;desc="{self.mails} queued"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def as_dict(self, total):
+        return {
+            'duration_ms': round(total * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'queries': self.queries,
+            'pool_wait_ms': round(self.pool_wait * 1000, 1),
+            'cache': {'gets': self.cache_gets, 'hits': self.cache_hits, 'sets': self.cache_sets},
+            'template_ms': round(self.template_time * 1000, 1),
+            'mails': self.mails,
+            'top_sql': self.top_sql(),
+        }
+
+
+def current_metrics():
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute_wrapper(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Соединения Django свои у каждого потока, а асинхронный ORM и ``sync_to_async``
+    выполняют SQL не в потоке цикла событий. Поэтому обёртка ставится на само
+    соединение при открытии, а метрики запроса берёт из ContextVar, который
+    asgiref передаёт в поток вместе с вызовом.
+    """
+    if _record_query not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает свою обёртку через pop().
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def record_mail(count=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.mails += count
+
+
+class RequestMetricsMiddleware:
+    """
+    Собирает метрики запроса, отдаёт их в заголовке ``Server-Timing`` и пишет
+    структурированную запись в лог ``collect_app.slow_requests``, если запрос
+    дольше ``SLOW_REQUEST_MS``. Отключается настройкой ``REQUEST_METRICS_ENABLED``.
+
+    Работает и в синхронной, и в асинхронной цепочке middleware: под ASGI
+    асинхронные представления не переключаются из-за него в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_MS', 500) / 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, total):
+        response['Server-Timing'] = metrics.server_timing(total)
+        if total >= self.slow_threshold:
+            record = {'method': request.method, 'path': request.get_full_path(), 'status': response.status_code}
+            record.update(metrics.as_dict(total))
+            logger.warning('Slow request %s', json.dumps(record, ensure_ascii=False))
+        return response
+
+
+class InstrumentedRedisClient(DefaultClient):
+    """Клиент django_redis, учитывающий обращения к кэшу в метриках текущего запроса."""
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_gets += 1
+            metrics.cache_hits += value is not _MISSING
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version, client=client)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_gets += len(keys)
+            metrics.cache_hits += len(found)
+        return found
+
+    def set(self, *args, **kwargs):
+        # add() и set_many() в DefaultClient реализованы через set().
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_sets += 1
+        return super().set(*args, **kwargs)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Вложенные рендеры (render_to_string внутри шаблона) уже входят во внешний.
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Шаблонный бэкенд Django, замеряющий время рендера шаблонов верхнего уровня."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,207 @@
+"""
+Живые обновления страницы сбора через Server-Sent Events.
+
+Пути записи (платёж, комментарий, закрытие сбора) после фиксации транзакции
+публикуют готовое SSE-событие в канал Redis ``collect-live:<pk>``. Каждый
+ASGI-процесс держит одну подписку на шаблон ``collect-live:*`` и раздаёт
+сообщения подключённым к нему зрителям из памяти: тысячи открытых страниц
+одного сбора — это одно сообщение Redis на процесс и ни одного запроса к БД.
+
+Поток событий отдаёт ``LiveUpdatesApp`` — ASGI-приложение перед Django
+(см. ``group_collects/asgi.py``), которое без middleware и сессий держит
+соединение и замечает отключение клиента. Под WSGI тот же URL отвечает 204,
+и браузер не переподключается.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'collect-live:'
+# Комментарий-пинг не даёт прокси закрыть простаивающее соединение.
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000
+# Медленному клиенту достаются только последние события.
+QUEUE_SIZE = 64
+
+
+def channel(collect_id):
+    return f'{CHANNEL_PREFIX}{collect_id}'
+
+
+def format_event(event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+@lru_cache(maxsize=None)
+def _publisher():
+    return redis.Redis.from_url(settings.LIVE_UPDATES_REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+
+
+def publish(collect_id, event, data):
+    """Публикует событие; недоступность Redis не должна ломать путь записи."""
+    if not settings.LIVE_UPDATES_REDIS_URL:
+        return
+    try:
+        _publisher().publish(channel(collect_id), format_event(event, data))
+    except redis.RedisError:
+        logger.warning('Не удалось опубликовать событие %s сбора %s', event, collect_id, exc_info=True)
+
+
+def publish_many(events):
+    """Публикует пачку событий ``(collect_id, event, data)`` одним обращением к Redis."""
+    if not settings.LIVE_UPDATES_REDIS_URL or not events:
+        return
+    pipeline = _publisher().pipeline(transaction=False)
+    for collect_id, event, data in events:
+        pipeline.publish(channel(collect_id), format_event(event, data))
+    try:
+        pipeline.execute()
+    except redis.RedisError:
+        logger.warning('Не удалось опубликовать %s событий', len(events), exc_info=True)
+
+
+def progress_data(collect):
+    return {
+        'raised_amount': collect.raised_amount,
+        'goal_amount': collect.goal_amount,
+        'percentage': collect.get_raised_percentage(),
+        'is_active': collect.is_active,
+    }
+
+
+def publish_progress(collect):
+    publish(collect.pk, 'progress', progress_data(collect))
+
+
+def closed_data(collect):
+    return {**progress_data(collect), 'close_reason': collect.close_reason}
+
+
+def publish_closed(collect):
+    publish(collect.pk, 'closed', closed_data(collect))
+
+
+def publish_closed_many(collects):
+    publish_many([(collect.pk, 'closed', closed_data(collect)) for collect in collects])
+
+
+def publish_comment(comment):
+    publish(comment.collect_id, 'comment', {
+        'id': comment.pk,
+        'html': render_to_string('comment_list.html', {'comments': [comment]}),
+    })
+
+
+class Broadcaster:
+    """Одна подписка Redis на процесс, раздающая события очередям подключённых зрителей."""
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.reader = None
+
+    @asynccontextmanager
+    async def subscribe(self, collect_id):
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.ensure_future(self.run())
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.listeners[collect_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self.listeners[collect_id].discard(queue)
+            if not self.listeners[collect_id]:
+                del self.listeners[collect_id]
+
+    def dispatch(self, channel_name, message):
+        collect_id = channel_name[len(CHANNEL_PREFIX):]
+        for queue in self.listeners.get(collect_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def run(self):
+        while True:
+            client = aioredis.Redis.from_url(settings.LIVE_UPDATES_REDIS_URL, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                async for message in pubsub.listen():
+                    self.dispatch(message['channel'], message['data'])
+            except redis.RedisError:
+                logger.warning('Подписка на живые обновления прервалась, переподключаюсь', exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+broadcaster = Broadcaster()
+
+
+class LiveUpdatesApp:
+    """ASGI-приложение: поток событий ``collect_events``, остальные запросы — в Django."""
+
+    headers = [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # nginx не должен буферизовать поток.
+        (b'x-accel-buffering', b'no'),
+    ]
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        collect_id = self.match(scope)
+        if collect_id is None:
+            return await self.application(scope, receive, send)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': self.headers})
+        async with broadcaster.subscribe(collect_id) as queue:
+            stream = asyncio.ensure_future(self.stream(queue, send))
+            disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+            done, pending = await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+
+    @staticmethod
+    def match(scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET' or not settings.LIVE_UPDATES_REDIS_URL:
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        return str(match.kwargs['pk']) if match.url_name == 'collect_events' else None
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def stream(queue, send):
+        async def write(chunk):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+        await write(f'retry: {RETRY_MS}\n\n')
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                message = ': ping\n\n'
+            await write(message)
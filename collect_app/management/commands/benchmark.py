@@ -0,0 +1,75 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from collect_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Runs hot-path benchmarks and fails when a view exceeds its SQL query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Тёплых запросов на сценарий')
+        parser.add_argument('--comments', type=int, default=200, help='Комментариев у сбора для collect_detail')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Запустить только указанные сценарии')
+        parser.add_argument('--fill', action='store_true', help='Перед замером пересоздать данные через fill_db')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', help='Сравнить с ранее сохранённым JSON-файлом')
+        parser.add_argument('--censor', action='store_true', help='Только микробенчмарк цензуры длинных описаний')
+        parser.add_argument('--api', action='store_true', help='Только микробенчмарк страниц API: DRF против проекций')
+        parser.add_argument('--api-rows', type=int, default=10000, help='Строк на странице для --api')
+        parser.add_argument('--load', action='append', metavar='URL', help='Нагрузочный замер запущенного сервера по URL')
+        parser.add_argument('--concurrency', type=int, default=100, help='Параллельных соединений для --load')
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на URL для --load')
+
+    def handle(self, *args, **options):
+        if options['censor']:
+            report = benchmarks.run_censor_benchmark(iterations=options['iterations'])
+            self.stdout.write(f"Цензура {report['texts']} описаний по {report['length']} символов")
+            for name, result in report['results'].items():
+                self.stdout.write(f"{name:24} p50 {result['p50_ms']:>9.2f} мс  min {result['min_ms']:>9.2f} мс")
+            return
+
+        if options['api']:
+            report = benchmarks.run_api_benchmark(options['api_rows'], iterations=options['iterations'])
+            self.stdout.write(f"Страницы API до {report['rows']} строк")
+            self.stdout.write(f"{'вариант':32} {'строк':>6} {'p50':>9} {'строк/с':>10}")
+            for name, result in report['results'].items():
+                self.stdout.write(
+                    f"{name:32} {result['rows']:>6} {result['p50_ms']:>9.2f} {result['rows_per_s']:>10}"
+                )
+            return
+
+        if options['load']:
+            self.stdout.write(f"{'URL':48} {'RPS':>8} {'p50':>9} {'p95':>9} {'p99':>9}  статусы")
+            for url in options['load']:
+                result = benchmarks.run_load(url, options['concurrency'], options['requests'])
+                self.stdout.write(
+                    f"{url:48} {result['rps']:>8.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                    f" {result['p99_ms']:>9.2f}  {result['statuses']}"
+                )
+            return
+
+        if options['fill']:
+            call_command('fill_db', stdout=self.stdout)
+
+        report = benchmarks.run_benchmarks(
+            iterations=options['iterations'], comments=options['comments'], names=options['scenarios']
+        )
+        self.stdout.write(f"Коммит {report['commit']}, БД {report['database']}, {report['iterations']} итераций")
+        self.stdout.write(f"{'сценарий':24} {'p50':>9} {'p95':>9} {'p99':>9}  запросы  кэш")
+        for name, result in report['results'].items():
+            line = (
+                f"{name:24} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+                f"  {result['queries']:>3}/{result['budget']:<3}  {result['cache_hit_ratio']}"
+            )
+            self.stdout.write(line if result['within_budget'] else self.style.ERROR(line))
+
+        if options['output']:
+            benchmarks.dump(report, options['output'])
+        if options['compare']:
+            for line in benchmarks.compare(report, benchmarks.load(options['compare'])):
+                self.stdout.write(line)
+
+        over_budget = [name for name, result in report['results'].items() if not result['within_budget']]
+        if over_budget:
+            raise CommandError(f"Превышен бюджет SQL-запросов: {', '.join(over_budget)}")
@@ -0,0 +1,48 @@
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from collect_app import live
+from collect_app.caching import invalidate_tags, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
+from collect_app.models import Collect
+
+
+class Command(BaseCommand):
+    help = 'Closes active collects whose end_at has passed, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сборов за одну транзакцию')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, проверяя сроки')
+        parser.add_argument('--interval', type=float, default=30, help='Пауза, когда закрывать нечего, сек.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                closed = self.close_batch(options['batch_size'])
+                if closed:
+                    self.stdout.write(f"Закрыто сборов: {closed}")
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+    def close_batch(self, batch_size):
+        """
+        Одна короткая транзакция на пачку: строки заблокированы только на время её
+        UPDATE, поэтому даже тысячи сборов, истекающих в полночь, закрываются, не
+        задерживая платежи. Кэш сбрасывается одним вызовом на пачку — страницы
+        закрытых сборов и оба списка, — а события зрителям уходят одним
+        конвейером Redis.
+        """
+        with transaction.atomic():
+            closed = Collect.close_expired(batch_size)
+            if closed:
+                transaction.on_commit(partial(
+                    invalidate_tags, *(collect_tag(collect.pk) for collect in closed), ACTIVE_LIST, ARCHIVE_LIST
+                ))
+                transaction.on_commit(partial(live.publish_closed_many, closed))
+        return len(closed)
@@ -1,65 +1,169 @@
 import random
+import time
 from decimal import Decimal
-from django.core.management.base import BaseCommand
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from faker import Faker
-from collect_app.models import Collect, Payment
+
+from collect_app.caching import invalidate_tags, ACTIVE_LIST, ARCHIVE_LIST
+from collect_app.models import Collect, CollectStats, Payment, Profile, UserDonationSummary
+
+
+def raw_delete(queryset):
+    """
+    Удаляет строки набора и всех зависимых по CASCADE моделей одним DELETE на таблицу,
+    без загрузки объектов в память и без сигналов.
+    """
+    model = queryset.model
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        through._base_manager.filter(**{f'{field.m2m_field_name()}__in': queryset})._raw_delete(queryset.db)
+    for rel in model._meta.related_objects:
+        related = rel.related_model._base_manager.filter(**{f'{rel.field.name}__in': queryset})
+        if rel.on_delete is models.CASCADE:
+            raw_delete(related)
+        elif rel.on_delete is models.SET_NULL:
+            related.update(**{rel.field.name: None})
+    queryset._raw_delete(queryset.db)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'Generates mock data for the database'
+    help = 'Generates a deterministic mock dataset of any size for the database'
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Начинаю генерацию моковых данных...")
-        self.stdout.write(self.style.WARNING("Сигналы на время заполнения отключены (если они были)."))
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Количество пользователей')
+        parser.add_argument('--collects', type=int, default=500, help='Количество сборов')
+        parser.add_argument('--payments', type=int, default=5000, help='Количество платежей')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора для воспроизводимости')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--active-share', type=float, default=0.8, help='Доля активных сборов')
 
-        fake = Faker('ru_RU')
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.rng = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
 
-        Payment.objects.all().delete()
-        Collect.objects.all().delete()
-        User.objects.filter(is_superuser=False).delete()
+        self.stdout.write("Начинаю генерацию моковых данных...")
+        self.stdout.write(self.style.WARNING("Данные вставляются через bulk_create: сигналы и Payment.save не вызываются."))
+
+        with transaction.atomic():
+            raw_delete(Payment.objects.all())
+            raw_delete(Collect.objects.all())
+            raw_delete(User.objects.filter(is_superuser=False))
         self.stdout.write("Старые данные (пользователи, сборы, платежи) удалены.")
 
-        users = []
-        for _ in range(1000):
-            username = fake.user_name()
-            while User.objects.filter(username=username).exists():
-                username = fake.user_name() + str(random.randint(1, 99))
+        user_ids = self.create_users(options['users'])
+        self.stdout.write(f"Создано {len(user_ids)} пользователей.")
+
+        collect_ids = self.create_collects(options['collects'], user_ids, options['active_share'])
+        self.stdout.write(f"Создано {len(collect_ids)} сборов.")
+
+        payment_count = self.create_payments(options['payments'], collect_ids, user_ids)
+        self.stdout.write(f"Создано {payment_count} платежей.")
+
+        self.finalize_collects()
+        for batch in batched(collect_ids, self.batch_size):
+            CollectStats.rebuild(batch)
+        # Суперпользователи переживают пересоздание данных, но их платежи удалены — пересчитываем всех.
+        for batch in batched(User.objects.order_by('pk').values_list('pk', flat=True).iterator(), self.batch_size):
+            UserDonationSummary.rebuild(batch)
+        invalidate_tags(ACTIVE_LIST, ARCHIVE_LIST)
 
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Генерация моковых данных успешно завершена за {elapsed:.1f} с! ✅"))
 
-            user = User.objects.create_user(
-                username=username,
-                email=fake.email(),
-                password='password123',
-                first_name=fake.first_name(),
-                last_name=fake.last_name()
+    def pool(self, factory, size):
+        """Заранее сгенерированный набор значений Faker: вызывать Faker на каждую строку слишком дорого."""
+        return [factory() for _ in range(size)]
+
+    def create_users(self, count):
+        password = make_password('password123')
+        first_names = self.pool(self.fake.first_name, 500)
+        last_names = self.pool(self.fake.last_name, 500)
+        date_joined = timezone.now()
+        rows = (
+            User(
+                username=f'user{i:07d}',
+                email=f'user{i:07d}@example.com',
+                password=password,
+                first_name=self.rng.choice(first_names),
+                last_name=self.rng.choice(last_names),
+                date_joined=date_joined,
             )
-            users.append(user)
-        self.stdout.write(f"Создано {len(users)} пользователей.")
+            for i in range(count)
+        )
+        user_ids = []
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(batch)
+                Profile.objects.bulk_create([Profile(user_id=user.pk) for user in users])
+            user_ids.extend(user.pk for user in users)
+        return user_ids
 
-        collects = []
+    def create_collects(self, count, user_ids, active_share):
         occasions = [choice[0] for choice in Collect.Occasion.choices]
-        for _ in range(500):
-            collect = Collect.objects.create(
-                author=random.choice(users),
-                title=fake.sentence(nb_words=6).replace('.', ''),
-                occasion=random.choice(occasions),
-                description=fake.text(max_nb_chars=500),
-                goal_amount=Decimal(random.randrange(10000, 500000, 1000)),
-                end_at=fake.future_datetime(end_date='+90d'),
+        titles = [sentence.replace('.', '') for sentence in self.pool(lambda: self.fake.sentence(nb_words=6), 500)]
+        descriptions = self.pool(lambda: self.fake.text(max_nb_chars=500), 200)
+        end_dates = self.pool(lambda: self.fake.future_datetime(end_date='+90d', tzinfo=timezone.get_current_timezone()), 500)
+        rows = (
+            Collect(
+                author_id=self.rng.choice(user_ids),
+                title=self.rng.choice(titles),
+                occasion=self.rng.choice(occasions),
+                description=self.rng.choice(descriptions),
+                goal_amount=Decimal(self.rng.randrange(10000, 500000, 1000)),
+                end_at=self.rng.choice(end_dates),
+                is_active=self.rng.random() < active_share,
             )
-            collects.append(collect)
-        self.stdout.write(f"Создано {len(collects)} сборов.")
-
-        payment_count = 0
-        for collect in collects:
-            num_payments = random.randint(5, 15)
-            for _ in range(num_payments):
-                Payment.objects.create(
-                    collect=collect,
-                    user=random.choice(users),
-                    amount=Decimal(random.randrange(100, 2500, 50)),
-                )
-                payment_count += 1
-        self.stdout.write(f"Создано {payment_count} платежей.")
-        self.stdout.write(self.style.SUCCESS("Генерация моковых данных успешно завершена! ✅"))
\ No newline at end of file
+            for _ in range(count)
+        )
+        collect_ids = []
+        for batch in batched(rows, self.batch_size):
+            collect_ids.extend(collect.pk for collect in Collect.objects.bulk_create(batch))
+        return collect_ids
+
+    def create_payments(self, count, collect_ids, user_ids):
+        if not collect_ids or not user_ids:
+            return 0
+        rows = (
+            Payment(
+                collect_id=self.rng.choice(collect_ids),
+                user_id=self.rng.choice(user_ids),
+                amount=Decimal(self.rng.randrange(100, 2500, 50)),
+            )
+            for _ in range(count)
+        )
+        created = 0
+        for batch in batched(rows, self.batch_size):
+            Payment.objects.bulk_create(batch)
+            created += len(batch)
+            if created % (self.batch_size * 100) == 0:
+                self.stdout.write(f"  ... {created} платежей")
+        return created
+
+    def finalize_collects(self):
+        """Пересчитывает собранные суммы одним UPDATE и закрывает сборы, достигшие цели."""
+        totals = (
+            Payment.objects.filter(collect=OuterRef('pk'))
+            .order_by().values('collect').annotate(total=Sum('amount')).values('total')
+        )
+        with transaction.atomic():
+            Collect.objects.update(raised_amount=Coalesce(Subquery(totals), Decimal(0)), updated_at=timezone.now())
+            Collect.objects.filter(
+                is_active=True, goal_amount__isnull=False, raised_amount__gte=F('goal_amount')
+            ).update(is_active=False, end_at=timezone.now(), close_reason=Collect.AUTO_CLOSE_REASON, updated_at=timezone.now())
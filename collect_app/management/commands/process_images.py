@@ -0,0 +1,152 @@
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from collect_app import images
+from collect_app.caching import invalidate_tags, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
+from collect_app.models import Collect, Comment, ImageTask, Profile
+
+# Тип изображения → (модель, поле файла, поле с описанием копий).
+TARGETS = {
+    ImageTask.Kind.COVER: (Collect, 'cover_image', 'cover_renditions'),
+    ImageTask.Kind.AVATAR: (Profile, 'avatar', 'avatar_renditions'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Builds resized WebP/JPEG renditions for uploaded covers and avatars and strips their metadata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Изображений за одну выборку')
+        parser.add_argument('--max-attempts', type=int, default=3, help='Попыток до статуса "Ошибка"')
+        parser.add_argument('--retry-delay', type=int, default=60, help='Базовая задержка повтора, сек.')
+        parser.add_argument('--lease', type=int, default=300, help='На сколько взятая задача скрыта от других воркеров, сек.')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между опросами пустой очереди, сек.')
+        parser.add_argument('--backfill', action='store_true', help='Поставить в очередь уже загруженные изображения без копий')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f"Поставлено в очередь: {self.backfill()}")
+        try:
+            while True:
+                done, failed = self.drain_batch(options)
+                if done or failed:
+                    self.stdout.write(f"Обработано: {done}, с ошибкой: {failed}")
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+    def backfill(self):
+        """Ставит задачи для файлов, у которых нет копий текущей версии и нет ожидающей задачи."""
+        pending = set(
+            ImageTask.objects.filter(status=ImageTask.Status.PENDING).values_list('kind', 'object_id', 'source')
+        )
+        tasks = []
+        for kind, (model, field, renditions_field) in TARGETS.items():
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for pk, name, renditions in rows.values_list('pk', field, renditions_field).iterator():
+                if (renditions or {}).get('source') != name and (kind, pk, name) not in pending:
+                    tasks.append(ImageTask(kind=kind, object_id=pk, source=name))
+        ImageTask.objects.bulk_create(tasks, batch_size=1000)
+        return len(tasks)
+
+    def drain_batch(self, options):
+        """
+        Забирает пачку задач короткой транзакцией с SKIP LOCKED и откладывает их
+        на ``--lease`` секунд: другие воркеры их не возьмут, а задачи упавшего
+        воркера вернутся в очередь. Изображения читаются, уменьшаются и
+        записываются вне транзакции, поэтому строки сборов блокируются только на
+        время записи результата одной задачи и не задерживают платежи.
+        """
+        done = failed = 0
+        with transaction.atomic():
+            batch = list(
+                ImageTask.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=ImageTask.Status.PENDING, next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at')[:options['batch_size']]
+            )
+            if not batch:
+                return done, failed
+            ImageTask.objects.filter(pk__in=[task.pk for task in batch]).update(
+                next_attempt_at=timezone.now() + timedelta(seconds=options['lease'])
+            )
+
+        for task in batch:
+            try:
+                self.process(task)
+            except Exception as exc:
+                task.mark_failed(exc, options['max_attempts'], options['retry_delay'])
+                task.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+                failed += 1
+            else:
+                done += 1
+        return done, failed
+
+    @staticmethod
+    def finish(task):
+        task.status = ImageTask.Status.DONE
+        task.processed_at = timezone.now()
+        task.attempts += 1
+        task.save(update_fields=['status', 'attempts', 'processed_at'])
+
+    def process(self, task):
+        """
+        Строит копии изображения и одной короткой транзакцией сохраняет их
+        описание в модели и закрывает задачу. Задача, файл которой уже заменён
+        или удалён, закрывается без обработки: для нового файла поставлена своя задача.
+
+        Очищенный от метаданных оригинал получает новое имя, поэтому вместе с
+        полем файла и копиями обновляется версия страниц, где изображение
+        показано: обложки — на сборе и в списках, аватара — на сборах автора и
+        сборах с его комментариями.
+        """
+        model, field, renditions_field = TARGETS[task.kind]
+        instance = model.objects.filter(pk=task.object_id).only('pk', field, renditions_field).first()
+        if instance is None or getattr(instance, field).name != task.source:
+            self.finish(task)
+            return
+        field_file = getattr(instance, field)
+        storage = field_file.storage
+        renditions = images.build_renditions(field_file, task.kind)
+        replaced = field_file.name != task.source
+
+        updates = {renditions_field: renditions, field: field_file.name}
+        if model is Collect:
+            collect_ids, tags = [instance.pk], [collect_tag(instance.pk), ACTIVE_LIST, ARCHIVE_LIST]
+        else:
+            collect_ids = self.collects_showing(instance.user_id)
+            tags = [collect_tag(pk) for pk in collect_ids]
+        with transaction.atomic():
+            updated = model.objects.filter(pk=instance.pk, **{field: task.source}).update(**updates)
+            if updated and collect_ids:
+                # Новая версия сборов обновляет ETag и ключи кэша карточек.
+                Collect.objects.filter(pk__in=collect_ids).update(updated_at=timezone.now())
+                transaction.on_commit(partial(invalidate_tags, *tags))
+            self.finish(task)
+
+        if updated:
+            images.delete_renditions(storage, getattr(instance, renditions_field), keep=renditions)
+            if replaced:
+                storage.delete(task.source)
+        else:
+            # Файл заменили, пока строились копии.
+            images.delete_renditions(storage, renditions)
+            if replaced:
+                storage.delete(field_file.name)
+
+    @staticmethod
+    def collects_showing(user_id):
+        """Сборы, на страницах которых показан аватар пользователя: его собственные и с его комментариями."""
+        return list(Collect.objects.filter(
+            Q(author_id=user_id) | Q(pk__in=Comment.objects.filter(author_id=user_id).values('collect_id'))
+        ).values_list('pk', flat=True))
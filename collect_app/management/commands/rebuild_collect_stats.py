@@ -0,0 +1,38 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from collect_app.caching import invalidate_tags, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
+from collect_app.models import Collect, CollectStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds denormalised per-collect statistics from payments and comments in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сборов за один пересчёт')
+        parser.add_argument('--collect', type=int, action='append', dest='collects', help='Пересчитать только указанные сборы')
+
+    def handle(self, *args, **options):
+        queryset = Collect.objects.order_by('pk')
+        if options['collects']:
+            queryset = queryset.filter(pk__in=options['collects'])
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            with transaction.atomic():
+                # Платёж блокирует строку сбора (register_donation) — параллельный прирост не затрётся пересчётом.
+                list(Collect.objects.filter(pk__in=batch).select_for_update().values_list('pk', flat=True))
+                rebuilt += CollectStats.rebuild(batch)
+                # Новая версия сборов обновляет ETag и ключи кэша карточек со счётчиками.
+                Collect.objects.filter(pk__in=batch).update(updated_at=timezone.now())
+                transaction.on_commit(partial(invalidate_tags, *map(collect_tag, batch)))
+            self.stdout.write(f"  ... пересчитано {rebuilt} сборов")
+        invalidate_tags(ACTIVE_LIST, ARCHIVE_LIST)
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересчитана для {rebuilt} сборов."))
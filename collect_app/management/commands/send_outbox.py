@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from collect_app.models import OutgoingEmail
+
+
+class Command(BaseCommand):
+    help = 'Sends queued emails from the outbox in batches over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Писем за одну выборку')
+        parser.add_argument('--max-attempts', type=int, default=8, help='Попыток до статуса "Ошибка"')
+        parser.add_argument('--retry-delay', type=int, default=30, help='Базовая задержка повтора, сек.')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между опросами пустой очереди, сек.')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                sent, failed = self.drain_batch(connection, options)
+                if sent or failed:
+                    self.stdout.write(f"Отправлено: {sent}, с ошибкой: {failed}")
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+    def drain_batch(self, connection, options):
+        """
+        Забирает пачку готовых к отправке писем. Строки блокируются с SKIP LOCKED,
+        поэтому несколько воркеров могут работать параллельно, не отправляя письма дважды.
+        """
+        sent = failed = 0
+        with transaction.atomic():
+            batch = list(
+                OutgoingEmail.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=OutgoingEmail.Status.PENDING, next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at')[:options['batch_size']]
+            )
+            if not batch:
+                return sent, failed
+
+            for email in batch:
+                message = EmailMessage(
+                    email.subject, email.body, settings.DEFAULT_FROM_EMAIL, email.recipients,
+                    connection=connection,
+                )
+                try:
+                    connection.open()
+                    connection.send_messages([message])
+                except Exception as exc:
+                    # Соединение могло оборваться: следующее письмо откроет новое.
+                    connection.close()
+                    email.mark_failed(exc, options['max_attempts'], options['retry_delay'])
+                    failed += 1
+                else:
+                    email.status = OutgoingEmail.Status.SENT
+                    email.sent_at = timezone.now()
+                    email.attempts += 1
+                    sent += 1
+
+            OutgoingEmail.objects.bulk_update(
+                batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+            )
+        return sent, failed
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comments_count(apps, schema_editor):
+    Collect = apps.get_model('collect_app', 'Collect')
+    Comment = apps.get_model('collect_app', 'Comment')
+    counts = (
+        Comment.objects.filter(collect=OuterRef('pk'))
+        .order_by().values('collect').annotate(total=Count('pk')).values('total')
+    )
+    Collect.objects.update(comments_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0008_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collect',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(backfill_comments_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['collect', 'created_at', 'id'], name='comment_collect_created_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:31
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0009_comments_count_and_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collect',
+            index=models.Index(fields=['-created_at', '-id'], name='collect_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collect',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='collect_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collect',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('end_at', 'created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', False)), name='collect_archive_closed_idx'),
+        ),
+    ]
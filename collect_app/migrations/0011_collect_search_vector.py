@@ -0,0 +1,72 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:33
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce({row}occasion_other_text, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce({row}description, '')), 'C')
+"""
+
+FORWARD_SQL = [
+    f"""
+    CREATE FUNCTION collect_app_collect_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {VECTOR_SQL.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER collect_app_collect_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, occasion_other_text, search_vector
+    ON collect_app_collect
+    FOR EACH ROW EXECUTE FUNCTION collect_app_collect_search_vector_update();
+    """,
+    f"UPDATE collect_app_collect SET search_vector = {VECTOR_SQL.format(row='')};",
+    "CREATE INDEX collect_search_vector_idx ON collect_app_collect USING gin (search_vector);",
+]
+
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS collect_search_vector_idx;",
+    "DROP TRIGGER IF EXISTS collect_app_collect_search_vector_trigger ON collect_app_collect;",
+    "DROP FUNCTION IF EXISTS collect_app_collect_search_vector_update();",
+]
+
+
+def run_postgres_only(statements):
+    # Триггер и GIN-индекс есть только в PostgreSQL; на SQLite поиск работает через icontains.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0010_collect_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collect',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='collect',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='collect_search_vector_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(run_postgres_only(FORWARD_SQL), run_postgres_only(BACKWARD_SQL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+BATCH_SIZE = 2000
+
+
+def backfill_collect_stats(apps, schema_editor):
+    Collect = apps.get_model('collect_app', 'Collect')
+    CollectStats = apps.get_model('collect_app', 'CollectStats')
+    Payment = apps.get_model('collect_app', 'Payment')
+    last_pk = 0
+    while True:
+        batch = list(
+            Collect.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'comments_count')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        donations = {
+            row['collect']: row for row in Payment.objects.filter(collect_id__in=[pk for pk, _ in batch])
+            .order_by().values('collect')
+            .annotate(count=Count('pk'), donors=Count('user', distinct=True), last=Max('created_at'))
+        }
+        empty = {'count': 0, 'donors': 0, 'last': None}
+        CollectStats.objects.bulk_create([
+            CollectStats(
+                collect_id=pk,
+                donations_count=donations.get(pk, empty)['count'],
+                donors_count=donations.get(pk, empty)['donors'],
+                last_donation_at=donations.get(pk, empty)['last'],
+                comments_count=comments_count,
+            )
+            for pk, comments_count in batch
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0011_collect_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectStats',
+            fields=[
+                ('collect', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='collect_app.collect', verbose_name='Сбор')),
+                ('donations_count', models.PositiveIntegerField(default=0, verbose_name='Пожертвований')),
+                ('donors_count', models.PositiveIntegerField(default=0, verbose_name='Участников')),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее пожертвование')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+            ],
+            options={
+                'verbose_name': 'Статистика сбора',
+                'verbose_name_plural': 'Статистика сборов',
+            },
+        ),
+        migrations.RunPython(backfill_collect_stats, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='collect',
+            name='comments_count',
+        ),
+    ]
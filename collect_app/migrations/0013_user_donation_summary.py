@@ -0,0 +1,68 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Sum
+
+BATCH_SIZE = 2000
+
+
+def backfill_summaries(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Collect = apps.get_model('collect_app', 'Collect')
+    Payment = apps.get_model('collect_app', 'Payment')
+    UserDonationSummary = apps.get_model('collect_app', 'UserDonationSummary')
+    last_pk = 0
+    while True:
+        batch = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1]
+        donations = {
+            row['user']: row for row in Payment.objects.filter(user_id__in=batch)
+            .order_by().values('user')
+            .annotate(total=Sum('amount'), count=Count('pk'), last=Max('created_at'))
+        }
+        collects = dict(
+            Collect.objects.filter(author_id__in=batch)
+            .order_by().values('author').annotate(count=Count('pk')).values_list('author', 'count')
+        )
+        empty = {'total': 0, 'count': 0, 'last': None}
+        UserDonationSummary.objects.bulk_create([
+            UserDonationSummary(
+                user_id=pk,
+                collects_created=collects.get(pk, 0),
+                total_donated=donations.get(pk, empty)['total'],
+                donations_count=donations.get(pk, empty)['count'],
+                last_donation_at=donations.get(pk, empty)['last'],
+            )
+            for pk in batch
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('collect_app', '0012_collect_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDonationSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='donation_summary', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('collects_created', models.PositiveIntegerField(default=0, verbose_name='Создано сборов')),
+                ('total_donated', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Всего пожертвовано')),
+                ('donations_count', models.PositiveIntegerField(default=0, verbose_name='Пожертвований')),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее пожертвование')),
+            ],
+            options={
+                'verbose_name': 'Сводка пользователя',
+                'verbose_name_plural': 'Сводки пользователей',
+                'indexes': [models.Index(fields=['collects_created', 'user'], name='summary_collects_idx'), models.Index(fields=['total_donated', 'user'], name='summary_donated_idx'), models.Index(fields=['donations_count', 'user'], name='summary_donations_idx'), models.Index(fields=['last_donation_at', 'user'], name='summary_last_donation_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
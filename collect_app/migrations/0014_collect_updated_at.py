@@ -0,0 +1,20 @@
+# Generated by Django 4.2.26 on 2026-10-17 20:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0013_user_donation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collect',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0015_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collect',
+            index=models.Index(condition=models.Q(('end_at__isnull', False), ('is_active', True)), fields=['end_at'], name='collect_active_end_idx'),
+        ),
+    ]
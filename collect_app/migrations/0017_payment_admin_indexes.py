@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-17 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect_app', '0016_collect_active_end_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-created_at', '-id'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['collect', '-created_at', '-id'], name='payment_collect_created_idx'),
+        ),
+    ]
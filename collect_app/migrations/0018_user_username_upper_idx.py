@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+INDEX_NAME = 'auth_user_username_upper_like_idx'
+
+
+def create_index(apps, schema_editor):
+    # istartswith в PostgreSQL — UPPER(username::text) LIKE UPPER(%s); text_pattern_ops
+    # нужен для LIKE по префиксу при любой сортировке (collation) базы. На SQLite не нужен.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table)
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {table} (UPPER("username"::text) text_pattern_ops);'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('collect_app', '0017_payment_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,10 +1,29 @@
-from django.db import models
+from django.db import models, transaction, connections, router
+from django.db.models import Case, Count, Exists, F, Max, Q, Sum, When
+from django.db.models.functions import Coalesce, Greatest
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
-from .utils import censor
+from .utils import censor, censor_many
+from .instrumentation import record_mail
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.validators import RegexValidator, MinLengthValidator
+from datetime import timedelta
+from decimal import Decimal
 from django.utils import timezone
+from functools import partial
+from . import live
+
+
+def loaded_file_name(instance, field):
+    """
+    Имя файла в поле без обращения к дескриптору, чтобы не загружать отложенное поле.
+    Для отложенного поля возвращает None.
+    """
+    if field not in instance.__dict__:
+        return None
+    value = instance.__dict__[field]
+    return getattr(value, 'name', value) or ''
 
 
 class Profile(models.Model):
@@ -14,14 +33,26 @@ class Profile(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, verbose_name="Аватар")
+    # Уменьшенные копии аватара, заполняет воркер process_images (см. collect_app/images.py).
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии аватара")
 
     class Meta:
         verbose_name = "Профиль"
         verbose_name_plural = "Профили"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__original_avatar = loaded_file_name(self, 'avatar')
+
     def __str__(self):
         return f'Профиль {self.user.username}'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            ImageTask.enqueue_if_changed(ImageTask.Kind.AVATAR, self, 'avatar', self.__original_avatar)
+        self.__original_avatar = loaded_file_name(self, 'avatar')
+
     @property
     def full_name(self):
         return self.user.get_full_name()
@@ -53,11 +84,17 @@ class Collect(models.Model):
                                       verbose_name="Сумма для сбора")
     raised_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Собрано")
     cover_image = models.ImageField(upload_to='covers/', null=True, blank=True, verbose_name="Обложка сбора")
+    # Уменьшенные копии обложки, заполняет воркер process_images (см. collect_app/images.py).
+    cover_renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии обложки")
     end_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата и время окончания сбора')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Версия сбора для условных GET: меняется при любом изменении сбора, его платежей и комментариев.
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     is_active = models.BooleanField(default=False, verbose_name="Сбор активен")
     closure_requested = models.BooleanField(default=False, verbose_name="Запрошено закрытие")
     close_reason = models.TextField(blank=True, null=True, verbose_name="Причина завершения сбора")
+    # Заполняется триггером PostgreSQL, см. collect_app/search.py.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     payment_type = models.CharField(
         max_length=10,
@@ -98,6 +135,8 @@ class Collect(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__original_is_active = self.is_active
+        self.__original_author_id = self.__dict__.get('author_id')
+        self.__original_cover_image = loaded_file_name(self, 'cover_image')
 
     @property
     def payment_purpose(self):
@@ -114,6 +153,156 @@ class Collect(models.Model):
         verbose_name = "Сбор"
         verbose_name_plural = "Сборы"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='collect_created_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_active=True), name='collect_active_created_idx'),
+            models.Index(Coalesce('end_at', 'created_at').desc(), F('id').desc(),
+                         condition=Q(is_active=False), name='collect_archive_closed_idx'),
+            # Очередь на закрытие по сроку (close_expired_collects): только открытые сборы с датой окончания.
+            models.Index(fields=['end_at'], condition=Q(is_active=True, end_at__isnull=False), name='collect_active_end_idx'),
+            GinIndex(fields=['search_vector'], name='collect_search_vector_idx'),
+        ]
+
+    AUTO_CLOSE_REASON = "Сбор автоматически завершён, так как цель достигнута."
+    EXPIRED_CLOSE_REASON = "Сбор автоматически завершён, так как истёк срок сбора."
+    CENSORED_FIELDS = ('title', 'description', 'close_reason', 'occasion_other_text')
+
+    @classmethod
+    def register_donation(cls, collect_id, amount, using=None):
+        """
+        Атомарно увеличивает собранную сумму на стороне БД (UPDATE ... RETURNING)
+        и, если цель достигнута, закрывает сбор в той же транзакции.
+
+        Строка сбора остаётся заблокированной первым UPDATE до конца транзакции,
+        поэтому параллельные платежи не теряют обновлений, а автозакрытие
+        срабатывает ровно один раз. Возвращает кортеж (новая сумма, время
+        автозакрытия или None).
+        """
+        using = using or router.db_for_write(cls)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        raised_field = cls._meta.get_field('raised_amount')
+        goal_field = cls._meta.get_field('goal_amount')
+        updated_field = cls._meta.get_field('updated_at')
+        sql = (
+            f'UPDATE {qn(cls._meta.db_table)} '
+            f'SET {qn(raised_field.column)} = {qn(raised_field.column)} + %s, {qn(updated_field.column)} = %s '
+            f'WHERE {qn(cls._meta.pk.column)} = %s '
+            f'RETURNING {qn(raised_field.column)}, {qn(goal_field.column)}, {qn(cls._meta.get_field("is_active").column)}'
+        )
+        with transaction.atomic(using=using, savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [
+                    raised_field.get_db_prep_save(amount, connection),
+                    updated_field.get_db_prep_save(timezone.now(), connection),
+                    collect_id,
+                ])
+                row = cursor.fetchone()
+            if row is None:
+                raise cls.DoesNotExist(f'Collect {collect_id} does not exist.')
+            raised_amount = raised_field.to_python(row[0])
+            goal_amount = goal_field.to_python(row[1])
+            is_active = bool(row[2])
+
+            closed_at = None
+            if is_active and goal_amount and raised_amount >= goal_amount:
+                closed_at = timezone.now()
+                cls.objects.using(using).filter(pk=collect_id, is_active=True).update(
+                    is_active=False, end_at=closed_at, close_reason=cls.AUTO_CLOSE_REASON, updated_at=closed_at
+                )
+        return raised_amount, closed_at
+
+    @classmethod
+    def close_expired(cls, limit, now=None, using=None):
+        """
+        Закрывает до ``limit`` сборов с истёкшим ``end_at`` одним UPDATE ... RETURNING
+        и ставит письма их авторам в outbox в той же транзакции. Сборы выбираются
+        по индексу collect_active_end_idx с SKIP LOCKED: строку, заблокированную
+        платежом, пачка пропускает, не дожидаясь его, а закроет следующая.
+        Причина закрытия, указанная автором в запросе на закрытие, сохраняется.
+        Возвращает закрытые сборы с авторами.
+        """
+        using = using or router.db_for_write(cls)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        now = now or timezone.now()
+        reason = cls._meta.get_field('close_reason').column
+        with transaction.atomic(using=using, savepoint=False):
+            due = (
+                cls.objects.using(using).filter(is_active=True, end_at__lte=now)
+                .order_by('end_at').select_for_update(skip_locked=True).values('pk')[:limit]
+            )
+            due_sql, due_params = due.query.get_compiler(using).as_sql()
+            sql = (
+                f'UPDATE {qn(cls._meta.db_table)} '
+                f'SET {qn(cls._meta.get_field("is_active").column)} = %s, '
+                f"{qn(reason)} = COALESCE(NULLIF({qn(reason)}, ''), %s), "
+                f'{qn(cls._meta.get_field("updated_at").column)} = %s '
+                f'WHERE {qn(cls._meta.pk.column)} IN ({due_sql}) '
+                f'RETURNING {qn(cls._meta.pk.column)}'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [
+                    False, cls.EXPIRED_CLOSE_REASON,
+                    cls._meta.get_field('updated_at').get_db_prep_save(now, connection),
+                    *due_params,
+                ])
+                ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return []
+            closed = list(
+                cls.objects.using(using).filter(pk__in=ids).select_related('author').only(
+                    'title', 'goal_amount', 'raised_amount', 'is_active', 'close_reason',
+                    'author__username', 'author__email',
+                )
+            )
+            OutgoingEmail.objects.bulk_create(
+                email for email in (collect.closed_email() for collect in closed) if email
+            )
+        return closed
+
+    @classmethod
+    def touch(cls, collect_id, using=None):
+        """Обновляет версию сбора при изменениях, которые не проходят через save()."""
+        cls.objects.using(using).filter(pk=collect_id).update(updated_at=timezone.now())
+
+    def closed_email(self):
+        """Письмо автору о завершении сбора или None, если у автора нет адреса."""
+        if not self.author.email:
+            return None
+        subject = f'ℹ️ Ваш сбор "{self.title}" завершён'
+        message = (
+            f'Здравствуйте, {self.author.username}!\n\n'
+            f'Ваш сбор "{self.title}" был завершён и перенесён в архив.\n'
+            f'Причина: {self.close_reason or "Завершён администратором"}\n\n'
+            f'Спасибо за вашу инициативу!'
+        )
+        return OutgoingEmail(subject=subject, body=message, recipients=[self.author.email])
+
+    def auto_close_emails(self):
+        """Письма автору и администраторам о закрытии сбора по достижении цели."""
+        emails = [email for email in [self.closed_email()] if email]
+
+        admin_emails = OutgoingEmail.admin_recipients()
+        if admin_emails:
+            subject = f'🎯 Сбор "{self.title}" автоматически завершён'
+            message = (f'Сбор "{self.title}" был автоматически завершён.\n\n'
+                       f'Причина: 100% необходимой суммы ({self.goal_amount} ₽) было собрано.')
+            emails.append(OutgoingEmail(subject=subject, body=message, recipients=admin_emails))
+        return emails
+
+    def apply_donation(self, raised_amount, closed_at):
+        """
+        Переносит в объект результат ``register_donation``: новую сумму и
+        автозакрытие, уже записанные в БД. Закрытие отмечается и как исходное
+        состояние, чтобы следующий save() не отправил письмо и событие о нём ещё раз.
+        """
+        self.raised_amount = raised_amount
+        if closed_at:
+            self.is_active = False
+            self.end_at = closed_at
+            self.close_reason = self.AUTO_CLOSE_REASON
+            self.__original_is_active = False
 
     def get_raised_percentage(self):
         if self.goal_amount and self.goal_amount > 0:
@@ -124,11 +313,18 @@ class Collect(models.Model):
         return self.title
 
     def save(self, *args, **kwargs):
-        if self.title: self.title = censor(self.title)
-        if self.description: self.description = censor(self.description)
-        if self.close_reason: self.close_reason = censor(self.close_reason)
-        if self.occasion_other_text: self.occasion_other_text = censor(self.occasion_other_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        fields = [name for name in self.CENSORED_FIELDS if update_fields is None or name in update_fields]
+        if fields:
+            for name, value in zip(fields, censor_many(getattr(self, name) for name in fields)):
+                setattr(self, name, value)
         is_new = self.pk is None
+        closed = not is_new and not self.is_active and self.__original_is_active
+        previous_author_id = self.__original_author_id
+        author_changed = not is_new and previous_author_id is not None and previous_author_id != self.author_id
+        emails = []
 
         if not is_new and self.is_active and not self.__original_is_active and self.author.email:
             subject = f'✅ Ваш сбор "{self.title}" одобрен!'
@@ -137,21 +333,27 @@ class Collect(models.Model):
                 f'Ваш сбор "{self.title}" успешно прошёл модерацию и теперь активен.\n'
                 f'Вы можете посмотреть его на сайте.'
             )
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.author.email], fail_silently=False)
-
-        if not is_new and not self.is_active and self.__original_is_active and self.author.email:
-            subject = f'ℹ️ Ваш сбор "{self.title}" завершён'
-            message = (
-                f'Здравствуйте, {self.author.username}!\n\n'
-                f'Ваш сбор "{self.title}" был завершён и перенесён в архив.\n'
-                f'Причина: {self.close_reason or "Завершён администратором"}\n\n'
-                f'Спасибо за вашу инициативу!'
-            )
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.author.email], fail_silently=False)
-
-
-        super().save(*args, **kwargs)
+            emails.append(OutgoingEmail(subject=subject, body=message, recipients=[self.author.email]))
+
+        if closed and self.author.email:
+            emails.append(self.closed_email())
+
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            using = self._state.db
+            if is_new:
+                CollectStats.objects.using(using).create(collect=self)
+                UserDonationSummary.record_collect(self.author_id, using=using)
+            elif author_changed:
+                UserDonationSummary.rebuild([previous_author_id, self.author_id], using=using)
+            if emails:
+                OutgoingEmail.objects.bulk_create(emails)
+            ImageTask.enqueue_if_changed(ImageTask.Kind.COVER, self, 'cover_image', self.__original_cover_image)
+            if closed:
+                transaction.on_commit(partial(live.publish_closed, self))
         self.__original_is_active = self.is_active
+        self.__original_author_id = self.author_id
+        self.__original_cover_image = loaded_file_name(self, 'cover_image')
 
 
 class Payment(models.Model):
@@ -168,49 +370,197 @@ class Payment(models.Model):
         verbose_name = "Платёж"
         verbose_name_plural = "Платежи"
         ordering = ['-created_at']
+        indexes = [
+            # Список платежей в админке: все платежи и платежи одного сбора от новых к старым.
+            models.Index(fields=['-created_at', '-id'], name='payment_created_idx'),
+            models.Index(fields=['collect', '-created_at', '-id'], name='payment_collect_created_idx'),
+        ]
 
     def __str__(self):
         return f'Платёж от {self.user.username} на {self.amount} ₽'
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
-            collect = self.collect
-            collect.raised_amount += self.amount
-            collect.save(update_fields=['raised_amount'])
-
-            if self.user.email:
-                subject = f'✅ Спасибо за ваше пожертвование!'
-                message = (f'Здравствуйте, {self.user.username}!\n\n'
-                           f'Вы успешно пожертвовали {self.amount} ₽ на сбор "{collect.title}".\n\n'
-                           f'Спасибо за вашу поддержку!')
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.user.email], fail_silently=False)
-
-            if collect.author.email and collect.author != self.user:
-                remaining_amount = (
-                            collect.goal_amount - collect.raised_amount) if collect.goal_amount else 'бесконечности'
-                subject = f'💰 Новый донат в вашем сборе "{collect.title}"!'
-                message = (f'Здравствуйте, {collect.author.username}!\n\n'
-                           f'Пользователь {self.user.username} поддержал ваш сбор "{collect.title}" на сумму {self.amount} ₽.\n'
-                           f'Всего собрано: {collect.raised_amount} ₽.\n'
-                           f'Осталось собрать: {remaining_amount} ₽.\n\n'
-                           'Так держать!')
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [collect.author.email], fail_silently=False)
-
-            if collect.is_active and collect.goal_amount and collect.raised_amount >= collect.goal_amount:
-                collect.is_active = False
-                collect.end_at = timezone.now()
-                collect.close_reason = "Сбор автоматически завершён, так как цель достигнута."
-                collect.save()
-
-                admin_users = User.objects.filter(is_superuser=True)
-                admin_emails = [user.email for user in admin_users if user.email]
-                if admin_emails:
-                    subject = f'🎯 Сбор "{collect.title}" автоматически завершён'
-                    message = (f'Сбор "{collect.title}" был автоматически завершён.\n\n'
-                               f'Причина: 100% необходимой суммы ({collect.goal_amount} ₽) было собрано.')
-                    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, admin_emails, fail_silently=False)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if is_new:
+                # Сумма сбора меняется в той же БД, куда записан платёж.
+                using = self._state.db
+                raised_amount, auto_closed = Collect.register_donation(self.collect_id, self.amount, using=using)
+                # Строка сбора уже заблокирована register_donation, поэтому проверка
+                # «первый ли это платёж участника» не гоняется с параллельными платежами.
+                CollectStats.record_donation(
+                    self.collect_id, self.user_id, self.created_at, payment_id=self.pk, using=using
+                )
+                UserDonationSummary.record_donation(self.user_id, self.amount, self.created_at, using=using)
+                collect = self.collect
+                collect.apply_donation(raised_amount, auto_closed)
+                OutgoingEmail.objects.bulk_create(self._build_notifications(collect, raised_amount, auto_closed))
+
+    def _build_notifications(self, collect, raised_amount, auto_closed):
+        """Готовит письма о новом платеже для записи в outbox в той же транзакции."""
+        emails = []
+        if self.user.email:
+            subject = f'✅ Спасибо за ваше пожертвование!'
+            message = (f'Здравствуйте, {self.user.username}!\n\n'
+                       f'Вы успешно пожертвовали {self.amount} ₽ на сбор "{collect.title}".\n\n'
+                       f'Спасибо за вашу поддержку!')
+            emails.append(OutgoingEmail(subject=subject, body=message, recipients=[self.user.email]))
+
+        if collect.author.email and collect.author_id != self.user_id:
+            remaining_amount = (
+                        collect.goal_amount - raised_amount) if collect.goal_amount else 'бесконечности'
+            subject = f'💰 Новый донат в вашем сборе "{collect.title}"!'
+            message = (f'Здравствуйте, {collect.author.username}!\n\n'
+                       f'Пользователь {self.user.username} поддержал ваш сбор "{collect.title}" на сумму {self.amount} ₽.\n'
+                       f'Всего собрано: {raised_amount} ₽.\n'
+                       f'Осталось собрать: {remaining_amount} ₽.\n\n'
+                       'Так держать!')
+            emails.append(OutgoingEmail(subject=subject, body=message, recipients=[collect.author.email]))
+
+        if auto_closed:
+            emails.extend(collect.auto_close_emails())
+        return emails
+
+
+class CollectStats(models.Model):
+    """
+    Денормализованная статистика сбора. Обновляется инкрементально в путях записи
+    платежей и комментариев; пересобрать из Payment/Comment можно командой
+    ``rebuild_collect_stats``.
+    """
+    collect = models.OneToOneField(Collect, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                                   verbose_name="Сбор")
+    donations_count = models.PositiveIntegerField(default=0, verbose_name="Пожертвований")
+    donors_count = models.PositiveIntegerField(default=0, verbose_name="Участников")
+    last_donation_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее пожертвование")
+    comments_count = models.PositiveIntegerField(default=0, verbose_name="Комментариев")
+
+    class Meta:
+        verbose_name = "Статистика сбора"
+        verbose_name_plural = "Статистика сборов"
+
+    def __str__(self):
+        return f'Статистика сбора #{self.collect_id}'
+
+    @property
+    def average_donation(self):
+        if not self.donations_count:
+            return None
+        return (self.collect.raised_amount / self.donations_count).quantize(Decimal('0.01'))
+
+    @classmethod
+    def record_donation(cls, collect_id, user_id, created_at, payment_id, using=None):
+        """Учитывает новый платёж; вызывать в транзакции после Collect.register_donation."""
+        earlier = Payment.objects.using(using).filter(collect_id=collect_id, user_id=user_id).exclude(pk=payment_id)
+        updated = cls.objects.using(using).filter(pk=collect_id).update(
+            donations_count=F('donations_count') + 1,
+            donors_count=F('donors_count') + Case(When(Exists(earlier), then=0), default=1),
+            last_donation_at=created_at,
+        )
+        if not updated:
+            cls.rebuild([collect_id], using=using)
+
+    @classmethod
+    def rebuild(cls, collect_ids, using=None):
+        """Пересчитывает статистику указанных сборов из Payment и Comment (два агрегирующих запроса)."""
+        collect_ids = list(collect_ids)
+        donations = {
+            row['collect']: row for row in Payment.objects.using(using).filter(collect_id__in=collect_ids)
+            .order_by().values('collect')
+            .annotate(count=Count('pk'), donors=Count('user', distinct=True), last=Max('created_at'))
+        }
+        comments = dict(
+            Comment.objects.using(using).filter(collect_id__in=collect_ids)
+            .order_by().values('collect').annotate(count=Count('pk')).values_list('collect', 'count')
+        )
+        empty = {'count': 0, 'donors': 0, 'last': None}
+        stats = [
+            cls(
+                collect_id=collect_id,
+                donations_count=donations.get(collect_id, empty)['count'],
+                donors_count=donations.get(collect_id, empty)['donors'],
+                last_donation_at=donations.get(collect_id, empty)['last'],
+                comments_count=comments.get(collect_id, 0),
+            )
+            for collect_id in Collect.objects.using(using).filter(pk__in=collect_ids).values_list('pk', flat=True)
+        ]
+        cls.objects.using(using).bulk_create(
+            stats, update_conflicts=True, unique_fields=['collect'],
+            update_fields=['donations_count', 'donors_count', 'last_donation_at', 'comments_count'],
+        )
+        return len(stats)
+
+
+class UserDonationSummary(models.Model):
+    """
+    Материализованная сводка по пользователю для списка пользователей в админке.
+    Обновляется путями записи платежей и сборов; пересобирается методом ``rebuild``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='donation_summary',
+                                verbose_name="Пользователь")
+    collects_created = models.PositiveIntegerField(default=0, verbose_name="Создано сборов")
+    total_donated = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Всего пожертвовано")
+    donations_count = models.PositiveIntegerField(default=0, verbose_name="Пожертвований")
+    last_donation_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее пожертвование")
+
+    class Meta:
+        verbose_name = "Сводка пользователя"
+        verbose_name_plural = "Сводки пользователей"
+        indexes = [
+            models.Index(fields=['collects_created', 'user'], name='summary_collects_idx'),
+            models.Index(fields=['total_donated', 'user'], name='summary_donated_idx'),
+            models.Index(fields=['donations_count', 'user'], name='summary_donations_idx'),
+            models.Index(fields=['last_donation_at', 'user'], name='summary_last_donation_idx'),
+        ]
+
+    def __str__(self):
+        return f'Сводка пользователя #{self.user_id}'
+
+    @classmethod
+    def record_donation(cls, user_id, amount, created_at, using=None):
+        updated = cls.objects.using(using).filter(pk=user_id).update(
+            total_donated=F('total_donated') + amount,
+            donations_count=F('donations_count') + 1,
+            last_donation_at=created_at,
+        )
+        if not updated:
+            cls.rebuild([user_id], using=using)
+
+    @classmethod
+    def record_collect(cls, user_id, using=None):
+        if not cls.objects.using(using).filter(pk=user_id).update(collects_created=F('collects_created') + 1):
+            cls.rebuild([user_id], using=using)
+
+    @classmethod
+    def rebuild(cls, user_ids, using=None):
+        """Пересчитывает сводки указанных пользователей из Payment и Collect (без JOIN-размножения строк)."""
+        user_ids = list(user_ids)
+        donations = {
+            row['user']: row for row in Payment.objects.using(using).filter(user_id__in=user_ids)
+            .order_by().values('user')
+            .annotate(total=Sum('amount'), count=Count('pk'), last=Max('created_at'))
+        }
+        collects = dict(
+            Collect.objects.using(using).filter(author_id__in=user_ids)
+            .order_by().values('author').annotate(count=Count('pk')).values_list('author', 'count')
+        )
+        empty = {'total': 0, 'count': 0, 'last': None}
+        summaries = [
+            cls(
+                user_id=user_id,
+                collects_created=collects.get(user_id, 0),
+                total_donated=donations.get(user_id, empty)['total'],
+                donations_count=donations.get(user_id, empty)['count'],
+                last_donation_at=donations.get(user_id, empty)['last'],
+            )
+            for user_id in User.objects.using(using).filter(pk__in=user_ids).values_list('pk', flat=True)
+        ]
+        cls.objects.using(using).bulk_create(
+            summaries, update_conflicts=True, unique_fields=['user'],
+            update_fields=['collects_created', 'total_donated', 'donations_count', 'last_donation_at'],
+        )
+        return len(summaries)
 
 
 class Comment(models.Model):
@@ -224,18 +574,175 @@ class Comment(models.Model):
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['collect', 'created_at', 'id'], name='comment_collect_created_idx'),
+        ]
 
     def __str__(self):
         return f'Комментарий от {self.author} к сбору "{self.collect.title}"'
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        if self.text: self.text = censor(self.text)
-        super().save(*args, **kwargs)
-
-        if is_new and self.collect.author.email and self.collect.author != self.author:
-            subject = f'💬 Новый комментарий к вашему сбору "{self.collect.title}"'
-            message = (f'Здравствуйте, {self.collect.author.username}!\n\n'
-                       f'Пользователь {self.author.username} оставил комментарий к вашему сбору:\n'
-                       f'"{self.text}"\n\n')
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.collect.author.email], fail_silently=False)
\ No newline at end of file
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.text = censor(self.text)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if is_new:
+                CollectStats.objects.filter(pk=self.collect_id).update(comments_count=F('comments_count') + 1)
+                Collect.touch(self.collect_id)
+
+            if is_new and self.collect.author.email and self.collect.author != self.author:
+                subject = f'💬 Новый комментарий к вашему сбору "{self.collect.title}"'
+                message = (f'Здравствуйте, {self.collect.author.username}!\n\n'
+                           f'Пользователь {self.author.username} оставил комментарий к вашему сбору:\n'
+                           f'"{self.text}"\n\n')
+                OutgoingEmail.enqueue(subject, message, [self.collect.author.email])
+
+    @classmethod
+    def delete_selected(cls, collect_id, pks, using=None):
+        """
+        Удаляет выбранные комментарии сбора одним DELETE, без загрузки объектов
+        и поштучных сигналов post_delete: счётчик комментариев и версия сбора
+        обновляются один раз на всю пачку. Сброс кэша — за вызывающим (после
+        фиксации транзакции). Возвращает число удалённых комментариев.
+        """
+        pks = list(pks)
+        if not pks:
+            return 0
+        using = using or router.db_for_write(cls)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        sql = (
+            f'DELETE FROM {qn(cls._meta.db_table)} '
+            f'WHERE {qn(cls._meta.get_field("collect").column)} = %s '
+            f'AND {qn(cls._meta.pk.column)} IN ({", ".join(["%s"] * len(pks))})'
+        )
+        with transaction.atomic(using=using, savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [collect_id, *pks])
+                deleted = cursor.rowcount
+            if deleted:
+                CollectStats.objects.using(using).filter(pk=collect_id).update(
+                    comments_count=Greatest(F('comments_count') - deleted, 0)
+                )
+                Collect.touch(collect_id, using=using)
+        return deleted
+
+
+class RetryMixin:
+    """
+    Повторы для очередей с полями ``status`` (с ``Status.FAILED``), ``attempts``,
+    ``next_attempt_at`` и ``last_error``: OutgoingEmail и ImageTask.
+    """
+
+    def mark_failed(self, error, max_attempts, base_delay):
+        """Фиксирует неудачную попытку и откладывает следующую с экспоненциальной задержкой."""
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = self.Status.FAILED
+        else:
+            self.next_attempt_at = timezone.now() + timedelta(seconds=base_delay * 2 ** (self.attempts - 1))
+
+
+class OutgoingEmailManager(models.Manager):
+    """Учитывает поставленные в очередь письма в метриках текущего запроса."""
+
+    def create(self, **kwargs):
+        record_mail()
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        record_mail(len(objs))
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class OutgoingEmail(RetryMixin, models.Model):
+    """
+    Очередь исходящих писем (transactional outbox). Письмо записывается в той же
+    транзакции, что и изменение данных, а отправляет его воркер `send_outbox`.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает отправки'
+        SENT = 'sent', 'Отправлено'
+        FAILED = 'failed', 'Ошибка'
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст письма")
+    recipients = models.JSONField(default=list, verbose_name="Получатели")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток отправки")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    objects = OutgoingEmailManager()
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} → {", ".join(self.recipients)}'
+
+    @classmethod
+    def enqueue(cls, subject, message, recipient_list):
+        """Ставит письмо в очередь. Вызывать внутри транзакции изменения данных."""
+        return cls.objects.create(subject=subject, body=message, recipients=list(recipient_list))
+
+    @staticmethod
+    def admin_recipients():
+        return list(User.objects.filter(is_superuser=True).exclude(email='').values_list('email', flat=True))
+
+
+class ImageTask(RetryMixin, models.Model):
+    """
+    Очередь обработки загруженных изображений. Задача записывается в той же
+    транзакции, что и новая обложка или аватар, а обрабатывает её воркер `process_images`.
+    """
+
+    class Kind(models.TextChoices):
+        COVER = 'cover', 'Обложка сбора'
+        AVATAR = 'avatar', 'Аватар'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает обработки'
+        DONE = 'done', 'Обработано'
+        FAILED = 'failed', 'Ошибка'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices, verbose_name="Тип изображения")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID объекта")
+    source = models.CharField(max_length=255, verbose_name="Исходный файл")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток обработки")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата обработки")
+
+    class Meta:
+        verbose_name = "Обработка изображения"
+        verbose_name_plural = "Обработка изображений"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='imagetask_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.object_id}: {self.source}'
+
+    @classmethod
+    def enqueue_if_changed(cls, kind, instance, field, original):
+        """Ставит файл поля в очередь, если он отличается от загруженного ранее."""
+        name = loaded_file_name(instance, field)
+        if name and original is not None and name != original:
+            return cls.objects.create(kind=kind, object_id=instance.pk, source=name)
+        return None
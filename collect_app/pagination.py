@@ -0,0 +1,264 @@
+"""
+Курсорная (keyset) пагинация.
+
+Вместо OFFSET следующая страница выбирается условием «строго после последней
+строки предыдущей страницы» по полям сортировки, поэтому стоимость страницы не
+зависит от её номера, если сортировку поддерживает индекс. Последнее поле
+сортировки должно быть уникальным (обычно ``id``).
+
+Для списков админки, где нужны номера страниц, ``EstimatedCountPaginator``
+заменяет точный COUNT(*) больших таблиц оценкой планировщика Postgres.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    # DjangoJSONEncoder обрезает микросекунды, а курсору нужна точная граница.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Тип {type(value).__name__} не поддерживается в курсоре.')
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _ordering_field(queryset, name):
+    """Поле модели или output_field аннотации, по которому идёт сортировка."""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def decode_cursor(cursor, queryset, ordering):
+    """Разбирает курсор и приводит значения к типам полей (или аннотаций) сортировки."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError
+        return [
+            _ordering_field(queryset, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        raise BadRequest('Некорректный курсор страницы.')
+
+
+def keyset_filter(ordering, values):
+    """Условие «строка идёт после values» для сортировки ordering (поля с '-' — по убыванию)."""
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    if len(ordering) > 1:
+        # Нестрогая граница по первому полю даёт планировщику условие для индекса:
+        # без неё OR-цепочка проверяется фильтром и просматривает все пропущенные строки.
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        condition &= Q(**{f'{first.lstrip("-")}__{bound}': values[0]})
+    return condition
+
+
+def _page_queryset(queryset, ordering, cursor, size):
+    # Запрашивается на одну строку больше, чтобы узнать о следующей странице без COUNT.
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, queryset, ordering)))
+    return queryset[:size + 1]
+
+
+def _split_page(items, ordering, size, value):
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(value(items[-1], field.lstrip('-')) for field in ordering)
+    return items, next_cursor
+
+
+def keyset_page(queryset, ordering, cursor=None, size=20, value=getattr):
+    """
+    Возвращает ``(объекты страницы, курсор следующей страницы или None)``.
+    ``value(строка, поле)`` достаёт значение поля сортировки из строки выборки
+    (для ``values_list()`` — по номеру колонки).
+    """
+    return _split_page(list(_page_queryset(queryset, ordering, cursor, size)), ordering, size, value)
+
+
+async def akeyset_page(queryset, ordering, cursor=None, size=20, value=getattr):
+    """Асинхронный вариант ``keyset_page`` на асинхронном ORM."""
+    items = [item async for item in _page_queryset(queryset, ordering, cursor, size)]
+    return _split_page(items, ordering, size, value)
+
+
+class KeysetPaginationMixin:
+    """
+    Курсорная пагинация для ``ListView`` вместо ``paginate_by``: без OFFSET и COUNT.
+    В контекст добавляются ``next_cursor`` и ``is_first_page``.
+    """
+    keyset_ordering = ['-created_at', '-id']
+    page_size = 9
+    cursor_param = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def get_context_data(self, **kwargs):
+        cursor = self.request.GET.get(self.cursor_param)
+        items, next_cursor = keyset_page(self.object_list, self.get_keyset_ordering(), cursor, self.page_size)
+        context = super().get_context_data(object_list=items, **kwargs)
+        context['next_cursor'] = next_cursor
+        context['is_first_page'] = not cursor
+        return context
+
+
+def estimated_count(queryset):
+    """
+    Оценка числа строк без их подсчёта: для таблицы без фильтров — ``reltuples``
+    из ``pg_class`` (обновляется autovacuum/ANALYZE), для отфильтрованной
+    выборки — число строк из плана запроса. Не на Postgres и для ещё не
+    проанализированной таблицы — None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор админки: если оценка больше ``exact_below`` строк, число
+    результатов берётся из оценки, а точный COUNT(*) не выполняется. Небольшие
+    выборки (например, платежи одного сбора) считаются точно.
+
+    Страница выбирается в два шага: OFFSET пропускает только первичные ключи
+    (по индексу сортировки), а строки со связанными объектами читаются для
+    одной страницы, а не для всех пропущенных.
+    """
+    exact_below = 100_000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < self.exact_below:
+            return super().count
+        return estimate
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        pks = list(self.object_list.values_list('pk', flat=True)[bottom:top])
+        return self._get_page(self.object_list.filter(pk__in=pks), number, self)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация API на основе ``keyset_page``. В отличие от встроенной
+    ``CursorPagination`` не использует OFFSET для строк с одинаковой позицией,
+    поэтому стоимость страницы постоянна. Поддерживается только переход вперёд.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 10_000
+
+    def page_size_for(self, params):
+        """Размер страницы из ``?page_size=`` (не больше ``max_page_size``) или размер по умолчанию."""
+        try:
+            size = int(params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None, value=getattr):
+        """
+        Страница для вьюсета DRF или представления вне DRF (обычный ``HttpRequest``
+        и ``values_list()``-выборка, см. ``value`` у ``keyset_page``).
+        """
+        self.request = request
+        params = getattr(request, 'query_params', request.GET)
+        try:
+            self.page, self.next_cursor = keyset_page(
+                queryset, list(self.ordering), params.get(self.cursor_query_param), self.page_size_for(params), value
+            )
+        except BadRequest:
+            raise NotFound(self.invalid_cursor_message)
+        return self.page
+
+    async def apaginate_queryset(self, queryset, request, value=getattr):
+        """
+        Асинхронный вариант ``paginate_queryset`` для представлений вне DRF.
+        """
+        self.request = request
+        params = request.GET
+        try:
+            self.page, self.next_cursor = await akeyset_page(
+                queryset, list(self.ordering), params.get(self.cursor_query_param), self.page_size_for(params), value
+            )
+        except BadRequest:
+            raise NotFound(self.invalid_cursor_message)
+        return self.page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class IdCursorPagination(KeysetCursorPagination):
+    """Курсор по первичному ключу — для таблиц без индекса по дате (пользователи)."""
+    ordering = ('id',)
+
+
+class SearchResultsPagination(PageNumberPagination):
+    """Постраничная выдача результатов поиска, упорядоченных по релевантности."""
+    page_size = 20
@@ -0,0 +1,36 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# Пустая строка NDJSON: пропускается, но занимает номер строки в отчёте импорта.
+BLANK_LINE = object()
+
+
+class NDJSONParser(BaseParser):
+    """
+    Парсер NDJSON (один JSON-объект на строку). Возвращает генератор, поэтому
+    строки разбираются по мере чтения тела запроса, а не загружаются целиком.
+    Некорректная строка превращается в ``ParseError``, который получает
+    обработчик вместо данных строки, пустая — в ``BLANK_LINE``.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        return self._iter_rows(stream, encoding)
+
+    @staticmethod
+    def _iter_rows(stream, encoding):
+        if stream is None:
+            return
+        for line in stream:
+            line = line.strip()
+            if not line:
+                yield BLANK_LINE
+                continue
+            try:
+                yield json.loads(line.decode(encoding))
+            except (UnicodeDecodeError, ValueError) as exc:
+                yield ParseError(f'JSON parse error - {exc}')
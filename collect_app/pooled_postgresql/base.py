@@ -0,0 +1,43 @@
+"""
+Бэкенд PostgreSQL с пулом соединений (см. ``collect_app.dbpool``).
+
+Отличается от ``django.db.backends.postgresql`` только тем, откуда берётся
+соединение и куда оно уходит при закрытии. Настройки пула — ключ ``POOL``
+в описании БД (``MIN_SIZE``, ``MAX_SIZE``, ``TIMEOUT``, ``MAX_AGE``,
+``MAX_IDLE``, ``CHECK_IDLE``); ``CONN_MAX_AGE`` должен оставаться 0, чтобы
+соединение возвращалось в пул в конце каждого запроса.
+"""
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from collect_app import dbpool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # Простаивающие соединения пула мешают DROP DATABASE и CREATE DATABASE ... TEMPLATE.
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        dbpool.close_pools(self.connection.settings_dict['NAME'])
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        dbpool.close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        self.pool = dbpool.get_pool(self.settings_dict, conn_params)
+        connection = self.pool.getconn(partial(super().get_new_connection, conn_params))
+        # Родитель выставляет уровень изоляции только при открытии соединения.
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = IsolationLevel(isolation_level) if isolation_level is not None else IsolationLevel.READ_COMMITTED
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
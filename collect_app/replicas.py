@@ -0,0 +1,183 @@
+"""
+Чтение с реплик Postgres.
+
+Реплики перечисляются в ``DATABASE_REPLICAS`` (см. settings) и получают алиасы
+``REPLICA_DATABASES``. Роутер ``ReplicaRouter`` отправляет на них чтения только
+внутри безопасных запросов (GET/HEAD), которые размечает
+``ReplicaRoutingMiddleware``. Команды, воркеры и все небезопасные запросы
+работают с основной БД.
+
+Чтение своих записей: запрос, который писал в БД или пришёл с небезопасным
+методом, ставит cookie ``REPLICA_PIN_COOKIE`` на ``REPLICA_PIN_SECONDS``; пока
+она есть, чтения этого посетителя идут в основную БД. Внутри запроса после
+первой записи или внутри транзакции чтения тоже идут в основную БД.
+
+Отставание и отказ: состояние каждой реплики проверяется не чаще раза в
+``REPLICA_CHECK_INTERVAL`` секунд на процесс. Реплика, отставшая больше чем на
+``REPLICA_MAX_LAG_SECONDS`` или недоступная, исключается до следующей проверки;
+если подходящих реплик нет, чтения идут в основную БД.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Модели, которые всегда читаются из основной БД: устаревшая сессия разлогинивает посетителя.
+PRIMARY_APPS = {'sessions'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Отставание реплики в секундах; реплика, воспроизведшая всё полученное, не отстаёт.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class RoutingState:
+    """Состояние маршрутизации текущего запроса."""
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.wrote = False
+        self.replica_reads = 0
+
+
+_state = ContextVar('replica_routing', default=None)
+
+# Алиас реплики → (время проверки, пригодна ли она).
+_health = {}
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', ())
+
+
+def staleness_bound():
+    """Насколько данные с реплики могут отставать от основной БД, с учётом интервала проверки."""
+    return settings.REPLICA_MAX_LAG_SECONDS + settings.REPLICA_CHECK_INTERVAL
+
+
+def read_from_replica():
+    """Читал ли текущий запрос данные с реплики."""
+    state = _state.get()
+    return state is not None and state.replica_reads > 0
+
+
+def replica_lag(alias):
+    """Отставание реплики в секундах; у не-Postgres БД (локальная вторая БД) — 0."""
+    with connections[alias].cursor() as cursor:
+        if connections[alias].vendor != 'postgresql':
+            cursor.execute('SELECT 0')
+        else:
+            cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def is_healthy(alias):
+    checked_at, healthy = _health.get(alias, (0, False))
+    now = time.monotonic()
+    if now - checked_at < settings.REPLICA_CHECK_INTERVAL:
+        return healthy
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна, чтения идут в основную БД', alias, exc_info=True)
+        healthy = False
+    else:
+        healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning('Реплика %s отстаёт на %.1f с, чтения идут в основную БД', alias, lag)
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def healthy_replicas():
+    return [alias for alias in replica_aliases() if is_healthy(alias)]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None or not state.use_replicas or state.wrote
+            or model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        candidates = healthy_replicas()
+        if not candidates:
+            return DEFAULT_DB_ALIAS
+        state.replica_reads += 1
+        return random.choice(candidates)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтения с реплик безопасным запросам посетителей без cookie
+    закрепления и ставит эту cookie после записи.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    @staticmethod
+    def start(request):
+        return RoutingState(
+            bool(replica_aliases()) and request.method in SAFE_METHODS
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+
+    @staticmethod
+    def finish(request, response, state):
+        if replica_aliases() and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,37 @@
+"""
+Полнотекстовый поиск по сборам.
+
+В PostgreSQL колонка ``Collect.search_vector`` поддерживается триггером БД
+(см. миграцию ``0011_collect_search_vector``) по конфигурации ``russian``:
+название имеет вес A, уточнение повода — B, описание — C. Поиск идёт по
+GIN-индексу и ранжируется ``ts_rank``. На других СУБД (локальная разработка
+на SQLite) используется простой ``icontains`` без ранжирования.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
+
+SEARCH_CONFIG = 'russian'
+
+
+def search_query(text):
+    """Запрос в синтаксисе веб-поиска: слова, "фразы", OR и -исключения."""
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def supports_full_text(queryset):
+    return queryset.query.get_compiler(queryset.db).connection.vendor == 'postgresql'
+
+
+def search_collects(queryset, text):
+    """Сборы, подходящие под запрос, от самых релевантных к менее релевантным."""
+    text = text.strip()
+    if not supports_full_text(queryset):
+        return queryset.filter(
+            Q(title__icontains=text) | Q(description__icontains=text) | Q(occasion_other_text__icontains=text)
+        ).order_by('-created_at', '-id')
+    query = search_query(text)
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', '-id')
+    )
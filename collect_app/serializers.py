@@ -1,6 +1,8 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Collect, Payment
+from .models import Collect, CollectStats, Payment
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели пользователя."""
@@ -22,9 +24,19 @@ class PaymentSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class CollectStatsSerializer(serializers.ModelSerializer):
+    """Денормализованная статистика сбора (только чтение)."""
+    average_donation = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CollectStats
+        fields = ['donations_count', 'donors_count', 'last_donation_at', 'comments_count', 'average_donation']
+        read_only_fields = fields
+
 class CollectSerializer(serializers.ModelSerializer):
     """Сериализатор для модели сбора."""
     author = serializers.PrimaryKeyRelatedField(read_only=True)
+    stats = CollectStatsSerializer(read_only=True)
     get_raised_percentage = serializers.IntegerField(read_only=True)
     get_full_occasion_display = serializers.CharField(read_only=True)
 
@@ -34,10 +46,16 @@ class CollectSerializer(serializers.ModelSerializer):
             'id', 'title', 'author', 'occasion', 'occasion_other_text', 'description',
             'goal_amount', 'raised_amount', # <-- Убедись, что здесь `raised_amount`
             'cover_image', 'end_at',
-            'created_at', 'is_active', 'get_raised_percentage', 'get_full_occasion_display'
+            'created_at', 'is_active', 'get_raised_percentage', 'get_full_occasion_display', 'stats'
         ]
         read_only_fields = ['author', 'raised_amount', 'created_at']
 
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class PaymentImportRowSerializer(serializers.Serializer):
+    """Одна строка массового импорта платежей."""
+    collect = serializers.IntegerField(min_value=1)
+    user = serializers.IntegerField(min_value=1, required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
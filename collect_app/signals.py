@@ -1,20 +1,165 @@
+from functools import partial
+
 from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile, Collect, Payment
-from django.core.cache import cache
+from .models import Profile, Collect, CollectStats, Payment, Comment, UserDonationSummary
+from .caching import invalidate_tags, collect_tag, list_tag, ACTIVE_LIST, ARCHIVE_LIST
+from . import live
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+        UserDonationSummary.objects.create(user=instance)
     instance.profile.save()
 
 @receiver([post_save, post_delete], sender=Collect)
-@receiver([post_save, post_delete], sender=Payment)
-def clear_cache(sender, instance, **kwargs):
+def invalidate_collect_cache(sender, instance, **kwargs):
+    """
+    Инвалидирует кэш сбора и обоих списков: сохранение сбора может
+    перенести его между текущими сборами и архивом.
+    Инвалидация откладывается до фиксации транзакции, чтобы параллельный
+    запрос не закэшировал незафиксированное состояние.
+    """
+    transaction.on_commit(partial(invalidate_tags, collect_tag(instance.pk), ACTIVE_LIST, ARCHIVE_LIST))
+
+@receiver(post_save, sender=Payment)
+def invalidate_payment_cache(sender, instance, **kwargs):
+    """
+    Инвалидирует кэш сбора, к которому относится платёж, и списка, в котором он показан.
+    Сбор берётся сейчас: Payment.save дописывает в этот же объект новую сумму и
+    статус, поэтому после фиксации состояние читается из памяти, без запроса к БД.
+    """
+    transaction.on_commit(partial(_invalidate_collect_of_payment, instance.collect))
+
+def _invalidate_collect_of_payment(collect):
+    tags = [collect_tag(collect.pk), list_tag(collect.is_active)]
+    if not collect.is_active:
+        # Платёж мог только что закрыть сбор, убрав его из списка текущих.
+        tags.append(ACTIVE_LIST)
+    invalidate_tags(*tags)
+
+@receiver(post_delete, sender=Payment)
+def invalidate_deleted_payment_cache(sender, instance, **kwargs):
+    """
+    Теги собираются сейчас и только из ``collect_id``: при каскадном удалении
+    сбора его строки после фиксации уже нет.
+    """
+    on_commit_batch('tags', [collect_tag(instance.collect_id), ACTIVE_LIST, ARCHIVE_LIST], _invalidate_tags)
+
+def _invalidate_tags(tags):
+    invalidate_tags(*tags)
+
+def on_commit_batch(key, values, handler):
+    """
+    Добавляет ``values`` к пачке ``key`` текущей транзакции; ``handler(множество)``
+    вызывается один раз после фиксации. Каскадное удаление тысяч платежей
+    сбора даёт одну пачку, а не тысячи отложенных вызовов. Вне транзакции
+    ``handler`` вызывается сразу.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        handler(set(values))
+        return
+    # Список run_on_commit заменяется после фиксации и отката, вместе с ним — и пачки.
+    hooks, batches = getattr(connection, 'collect_app_batches', (None, None))
+    if hooks is not connection.run_on_commit:
+        batches = {}
+        connection.collect_app_batches = (connection.run_on_commit, batches)
+    batch = batches.get(key)
+    if batch is None:
+        batch = batches[key] = set()
+
+        def run():
+            # Значения, добавленные после запуска, попадут уже в новую пачку.
+            batches.pop(key, None)
+            handler(batch)
+
+        transaction.on_commit(run)
+    batch.update(values)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
     """
-    Очищает весь кэш при обновлении/создании/удалении
-    сборов или платежей.
+    Поддерживает денормализованный счётчик комментариев сбора: статистика и
+    версия сборов удалённых комментариев пересчитываются один раз на
+    транзакцию, поэтому каскадное удаление тысяч комментариев — это несколько
+    запросов, а не UPDATE на каждый.
     """
-    cache.clear()
\ No newline at end of file
+    on_commit_batch('collect_stats', [instance.collect_id], _rebuild_collect_stats)
+    on_commit_batch('touch', [instance.collect_id], _touch_collects)
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_cache(sender, instance, **kwargs):
+    """Число комментариев показывается в карточках и API, поэтому сбрасываются сбор и списки."""
+    on_commit_batch('tags', [collect_tag(instance.collect_id), ACTIVE_LIST, ARCHIVE_LIST], _invalidate_tags)
+
+@receiver(post_delete, sender=Payment)
+def touch_collect_of_deleted_payment(sender, instance, **kwargs):
+    """Версия сборов удалённых платежей обновляется одним UPDATE на транзакцию."""
+    on_commit_batch('touch', [instance.collect_id], _touch_collects)
+
+def _touch_collects(collect_ids):
+    Collect.objects.filter(pk__in=collect_ids).update(updated_at=timezone.now())
+
+@receiver(post_delete, sender=Payment)
+def rebuild_stats_of_deleted_payment(sender, instance, **kwargs):
+    """
+    Счётчики статистики только увеличиваются, поэтому после удаления платежей
+    (в том числе массового из админки) статистика их сборов пересчитывается.
+    """
+    on_commit_batch('collect_stats', [instance.collect_id], _rebuild_collect_stats)
+
+@receiver(post_delete, sender=Payment)
+def rebuild_summary_of_deleted_payment(sender, instance, **kwargs):
+    """То же для сводки участника: удаление платежа или каскадное удаление сбора уменьшает его итоги."""
+    on_commit_batch('user_summaries', [instance.user_id], _rebuild_user_summaries)
+
+def _rebuild_user_summaries(user_ids):
+    with transaction.atomic():
+        # Новый платёж обновляет строку сводки (record_donation) и ждёт, пока пересчёт её держит.
+        list(UserDonationSummary.objects.filter(pk__in=user_ids).select_for_update().values_list('pk', flat=True))
+        UserDonationSummary.rebuild(user_ids)
+
+def _rebuild_collect_stats(collect_ids):
+    with transaction.atomic():
+        # Платёж блокирует строку сбора (register_donation) — параллельный прирост не затрётся пересчётом.
+        list(Collect.objects.filter(pk__in=collect_ids).select_for_update().values_list('pk', flat=True))
+        CollectStats.rebuild(collect_ids)
+
+
+@receiver(post_delete, sender=Collect)
+def decrement_collects_created(sender, instance, **kwargs):
+    """Поддерживает счётчик созданных сборов в сводке автора."""
+    UserDonationSummary.objects.filter(pk=instance.author_id, collects_created__gt=0).update(
+        collects_created=F('collects_created') - 1
+    )
+
+
+@receiver(post_save, sender=Payment)
+def publish_donation(sender, instance, created, **kwargs):
+    """
+    Сообщает зрителям страницы сбора новую сумму. Payment.save дописывает
+    сумму и статус в этот же объект сбора уже после сигнала, поэтому событие
+    выбирается после фиксации и без запроса к БД.
+    """
+    if created:
+        transaction.on_commit(partial(_publish_collect_state, instance.collect))
+
+def _publish_collect_state(collect):
+    if collect.is_active:
+        live.publish_progress(collect)
+    else:
+        live.publish_closed(collect)
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(live.publish_comment, instance))
+
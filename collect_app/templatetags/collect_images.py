@@ -0,0 +1,38 @@
+"""
+Вывод изображений с уменьшенными копиями из ``collect_app.images``.
+
+``{% picture collect.cover_image collect.cover_renditions 'card' alt=collect.title class='card-img-top' %}``
+рисует ``<picture>`` с WebP- и JPEG-``srcset``. Пока копии не построены,
+выводится оригинал, а при отсутствии файла — локальная заглушка ``placeholder``.
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from collect_app.images import current_rendition
+
+register = template.Library()
+
+
+def _srcset(storage, sources):
+    return ', '.join(f'{storage.url(path)} {width}w' for path, width in sources)
+
+
+@register.simple_tag
+def picture(field_file, renditions, name, placeholder='img/cover_placeholder.svg', sizes=None, **attrs):
+    entry = current_rendition(field_file, renditions, name)
+    if entry is None:
+        src = field_file.url if field_file else static(placeholder)
+        return format_html('<img src="{}"{}>', src, flatatt(attrs))
+
+    storage = field_file.storage
+    sizes = sizes or f"{entry['width']}px"
+    attrs.setdefault('width', entry['width'])
+    attrs.setdefault('height', entry['height'])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        _srcset(storage, entry['webp']), sizes,
+        storage.url(entry['jpeg'][0][0]), _srcset(storage, entry['jpeg']), sizes, flatatt(attrs),
+    )
@@ -0,0 +1,1356 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO, StringIO
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, router, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from asgiref.sync import sync_to_async
+from PIL import Image
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import benchmarks, dbpool, fragments, live, replicas, views
+from .caching import ACTIVE_LIST, ARCHIVE_LIST, collect_tag, get_tag_versions
+from .models import Collect, CollectStats, Comment, ImageTask, OutgoingEmail, Payment, UserDonationSummary
+from .pagination import EstimatedCountPaginator, KeysetCursorPagination, decode_cursor, encode_cursor, keyset_page
+from .parsers import BLANK_LINE, NDJSONParser
+from .search import search_collects
+from .serializers import CollectSerializer, PaymentSerializer, UserSerializer
+from .utils import CensorEngine, censor, censor_many
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_collect(author, **kwargs):
+    defaults = {
+        'title': 'Сбор', 'occasion': Collect.Occasion.PROJECT, 'description': 'Описание',
+        'is_active': True, 'goal_amount': Decimal('1000'),
+    }
+    return Collect.objects.create(author=author, **{**defaults, **kwargs})
+
+
+class AsyncViewsURLConf:
+    """URL-конфигурация, как под ASGI (``ASYNC_VIEWS``): асинхронные варианты представлений чтения."""
+    urlpatterns = [
+        path('', views.ahome_page, name='home'),
+        path('archive/', views.aarchive_collects, name='archive'),
+        path('collect/<int:pk>/', views.acollect_detail, name='collect_detail'),
+        path('api/v1/collects/', views.aapi_collects),
+        path('api/v1/collects/<int:pk>/', views.aapi_collect),
+        path('api/v1/payments/', views.aapi_payments),
+        path('api/v1/users/<int:pk>/', views.aapi_user),
+        path('', include(settings.ROOT_URLCONF)),
+    ]
+
+STRESS_PAYMENTS = int(os.environ.get('STRESS_PAYMENTS', 2000))
+STRESS_WORKERS = int(os.environ.get('STRESS_WORKERS', 16))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Нужна PostgreSQL: SQLite сериализует запись целиком.')
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConcurrentDonationStressTest(TransactionTestCase):
+    """
+    Параллельные пожертвования через PaymentDemoView.post и PaymentViewSet.create
+    не должны терять обновлений raised_amount.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.donors = [
+            User.objects.create_user(f'donor{i}', f'donor{i}@example.com', 'password')
+            for i in range(STRESS_WORKERS)
+        ]
+        self.collect = Collect.objects.create(
+            author=self.author, title='Стресс-тест', occasion=Collect.Occasion.PROJECT,
+            description='Проверка конкурентных платежей', is_active=True,
+            goal_amount=Decimal(STRESS_PAYMENTS * 10),
+        )
+
+    def _donate(self, worker):
+        donor = self.donors[worker]
+        web, api = Client(), APIClient()
+        web.force_login(donor)
+        api.force_authenticate(donor)
+        try:
+            for i in range(worker, STRESS_PAYMENTS, STRESS_WORKERS):
+                if i % 2:
+                    web.post(reverse('payment_demo', args=[self.collect.pk]), {'amount': 7})
+                else:
+                    api.post('/api/v1/payments/', {'collect': self.collect.pk, 'amount': '7.00'}, format='json')
+                # Как request_finished в настоящем запросе: соединение возвращается в пул,
+                # которого иначе не хватило бы на всех воркеров теста.
+                connection.close()
+        finally:
+            connection.close()
+
+    def test_raised_amount_matches_payments(self):
+        with ThreadPoolExecutor(max_workers=STRESS_WORKERS) as pool:
+            list(pool.map(self._donate, range(STRESS_WORKERS)))
+
+        self.collect.refresh_from_db()
+        total = self.collect.payments.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(self.collect.payments.count(), STRESS_PAYMENTS)
+        self.assertEqual(self.collect.raised_amount, total)
+        stats = CollectStats.objects.get(pk=self.collect.pk)
+        self.assertEqual(stats.donations_count, STRESS_PAYMENTS)
+        self.assertEqual(stats.donors_count, STRESS_WORKERS)
+
+    def test_goal_closes_collect_exactly_once(self):
+        Collect.objects.filter(pk=self.collect.pk).update(goal_amount=Decimal(STRESS_PAYMENTS * 7))
+
+        with ThreadPoolExecutor(max_workers=STRESS_WORKERS) as pool:
+            list(pool.map(self._donate, range(STRESS_WORKERS)))
+
+        self.collect.refresh_from_db()
+        self.assertFalse(self.collect.is_active)
+        self.assertEqual(self.collect.close_reason, Collect.AUTO_CLOSE_REASON)
+        closed_notices = OutgoingEmail.objects.filter(subject__contains='завершён', recipients=[self.author.email])
+        self.assertEqual(closed_notices.count(), 1)
+        self.assertEqual(self.collect.raised_amount, Payment.objects.aggregate(total=Sum('amount'))['total'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class QueryBudgetTest(TestCase):
+    """Каждый сценарий из benchmarks.SCENARIOS укладывается в объявленный бюджет SQL-запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('fill_db', users=30, collects=20, payments=200, stdout=StringIO())
+        cls.fixtures = benchmarks.prepare_fixtures(comments=50)
+
+    def test_scenarios_within_query_budget(self):
+        for scenario in benchmarks.SCENARIOS:
+            with self.subTest(scenario=scenario.name):
+                result = benchmarks.run_scenario(scenario, self.fixtures, iterations=3)
+                self.assertLessEqual(result['queries'], scenario.budget)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CollectDeletionTest(TestCase):
+    """Удаление сбора с платежами каскадно удаляет платежи и сбрасывает кэш без чтения удалённого сбора."""
+
+    def test_delete_collect_with_payments(self):
+        author = User.objects.create_user('author')
+        donor = User.objects.create_user('donor')
+        collect = make_collect(author)
+        Payment.objects.create(collect=collect, user=donor, amount=Decimal('10'))
+        Payment.objects.create(collect=collect, user=author, amount=Decimal('20'))
+        tags = [collect_tag(collect.pk), ACTIVE_LIST, ARCHIVE_LIST]
+        before = get_tag_versions(tags)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Collect.objects.get(pk=collect.pk).delete()
+
+        self.assertFalse(Payment.objects.filter(collect_id=collect.pk).exists())
+        after = get_tag_versions(tags)
+        for tag in tags:
+            self.assertGreater(after[tag], before[tag], tag)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ServerTimingTest(TestCase):
+    """SQL асинхронных представлений попадает в Server-Timing, хотя выполняется не в потоке цикла событий."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.collect = make_collect(User.objects.create_user('author'))
+
+    @staticmethod
+    def query_count(response):
+        return int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response['Server-Timing']).group(1))
+
+    @override_settings(ROOT_URLCONF=AsyncViewsURLConf)
+    async def test_async_view_reports_queries(self):
+        response = await AsyncClient().get(reverse('collect_detail', args=[self.collect.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.query_count(response), 0)
+
+    def test_sync_view_reports_queries(self):
+        url = reverse('collect_detail', args=[self.collect.pk])
+        self.assertGreater(self.query_count(Client().get(url)), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AsyncViewsTest(TestCase):
+    """Под WSGI подключены синхронные представления чтения, асинхронные варианты отдают то же самое."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.collects = [make_collect(cls.author, title=f'Сбор {i}') for i in range(3)]
+        make_collect(cls.author, title='Архивный', is_active=False)
+        Payment.objects.create(collect=cls.collects[0], user=cls.author, amount=Decimal('10'))
+
+    def test_wsgi_urls_use_sync_views(self):
+        self.assertFalse(settings.ASYNC_VIEWS)
+        for url in ('/', '/archive/', f'/collect/{self.collects[0].pk}/', '/api/v1/collects/', '/api/v1/payments/'):
+            with self.subTest(url=url):
+                self.assertFalse(asyncio.iscoroutinefunction(resolve(url).func))
+
+    async def test_async_variants_match_sync(self):
+        urls = [
+            '/', '/archive/', f'/collect/{self.collects[0].pk}/',
+            '/api/v1/collects/?page_size=2', f'/api/v1/collects/{self.collects[1].pk}/?fields=id,title',
+            '/api/v1/payments/', f'/api/v1/users/{self.author.pk}/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                expected = await sync_to_async(Client().get)(url)
+                await sync_to_async(cache.clear)()
+                with override_settings(ROOT_URLCONF=AsyncViewsURLConf):
+                    response = await AsyncClient().get(url)
+                await sync_to_async(cache.clear)()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+
+class PaymentDeletionStatsTest(TestCase):
+    """Удаление платежей пересчитывает статистику сбора."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.donors = [User.objects.create_user(f'donor{i}') for i in range(2)]
+        self.collect = make_collect(self.author, goal_amount=None)
+        self.payments = [
+            Payment.objects.create(collect=self.collect, user=donor, amount=Decimal('10'))
+            for donor in (self.donors[0], self.donors[0], self.donors[1])
+        ]
+
+    def test_delete_payment(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payments[2].delete()
+        stats = CollectStats.objects.get(pk=self.collect.pk)
+        self.assertEqual((stats.donations_count, stats.donors_count), (2, 1))
+        self.assertEqual(stats.last_donation_at, self.payments[1].created_at)
+
+    def test_bulk_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(collect=self.collect).delete()
+        stats = CollectStats.objects.get(pk=self.collect.pk)
+        self.assertEqual((stats.donations_count, stats.donors_count, stats.last_donation_at), (0, 0, None))
+
+    def test_bulk_delete_touches_collect_once(self):
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        table = Collect._meta.db_table
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(collect=self.collect).delete()
+        touches = [query['sql'] for query in queries if query['sql'].startswith(f'UPDATE "{table}"')]
+        self.assertEqual(len(touches), 1)
+        self.assertGreater(Collect.objects.get(pk=self.collect.pk).updated_at, version)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RebuildCollectStatsCommandTest(TestCase):
+    """rebuild_collect_stats исправляет счётчики и обновляет версию и кэш пересчитанных сборов."""
+
+    def test_rebuild(self):
+        author = User.objects.create_user('author')
+        collects = [make_collect(author, goal_amount=None) for _ in range(3)]
+        for collect in collects:
+            Payment.objects.create(collect=collect, user=author, amount=Decimal('10'))
+        CollectStats.objects.update(donations_count=0, donors_count=0)
+        tags = [collect_tag(collect.pk) for collect in collects]
+        before = get_tag_versions(tags)
+        versions = dict(Collect.objects.values_list('pk', 'updated_at'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_collect_stats', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(set(CollectStats.objects.values_list('donations_count', 'donors_count')), {(1, 1)})
+        after = get_tag_versions(tags)
+        for collect in Collect.objects.all():
+            self.assertGreater(collect.updated_at, versions[collect.pk])
+            self.assertGreater(after[collect_tag(collect.pk)], before[collect_tag(collect.pk)])
+
+
+class UserSummaryMaintenanceTest(TestCase):
+    """Сводка пользователя следует за удалением платежей, сборов и сменой автора сбора."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.donor = User.objects.create_user('donor')
+        self.collect = make_collect(self.author, goal_amount=None)
+        self.payments = [
+            Payment.objects.create(collect=self.collect, user=self.donor, amount=amount)
+            for amount in (Decimal('10'), Decimal('25'))
+        ]
+
+    def summary(self, user):
+        return UserDonationSummary.objects.get(pk=user.pk)
+
+    def test_delete_payment(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payments[1].delete()
+        summary = self.summary(self.donor)
+        self.assertEqual((summary.total_donated, summary.donations_count), (Decimal('10'), 1))
+        self.assertEqual(summary.last_donation_at, self.payments[0].created_at)
+
+    def test_delete_collect(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Collect.objects.get(pk=self.collect.pk).delete()
+        summary = self.summary(self.donor)
+        self.assertEqual((summary.total_donated, summary.donations_count, summary.last_donation_at), (0, 0, None))
+        self.assertEqual(self.summary(self.author).collects_created, 0)
+
+    def test_change_author(self):
+        collect = Collect.objects.get(pk=self.collect.pk)
+        collect.author = self.donor
+        collect.save()
+        self.assertEqual(self.summary(self.author).collects_created, 0)
+        self.assertEqual(self.summary(self.donor).collects_created, 1)
+
+    def test_rebuild_uses_given_database(self):
+        UserDonationSummary.objects.all().delete()
+        CollectStats.objects.all().delete()
+        # Без явного using запросы ушли бы в несуществующую базу.
+        with override_settings(DATABASE_ROUTERS=[UnroutedDatabaseRouter()]):
+            UserDonationSummary.record_collect(self.author.pk, using=DEFAULT_DB_ALIAS)
+            UserDonationSummary.rebuild([self.donor.pk], using=DEFAULT_DB_ALIAS)
+            CollectStats.rebuild([self.collect.pk], using=DEFAULT_DB_ALIAS)
+        self.assertEqual(self.summary(self.author).collects_created, 1)
+        self.assertEqual(self.summary(self.donor).donations_count, 2)
+        self.assertEqual(CollectStats.objects.get(pk=self.collect.pk).donations_count, 2)
+
+    def test_collect_save_passes_database(self):
+        with mock.patch.object(UserDonationSummary, 'record_collect') as record_collect:
+            Collect(author=self.author, title='Сбор', occasion=Collect.Occasion.PROJECT).save(using=DEFAULT_DB_ALIAS)
+        record_collect.assert_called_once_with(self.author.pk, using=DEFAULT_DB_ALIAS)
+
+
+class UnroutedDatabaseRouter:
+    """Маршрутизатор, отправляющий запросы без явного ``using`` в несуществующую базу."""
+
+    def db_for_read(self, model, **hints):
+        return 'unrouted'
+
+    db_for_write = db_for_read
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PaymentImportTest(TestCase):
+    """Массовый импорт платежей: отчёт по строкам, закрытые сборы и живые обновления."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.donor = User.objects.create_user('donor')
+        self.collect = make_collect(self.admin, goal_amount=Decimal('100'))
+        self.closed = make_collect(self.admin, is_active=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('payment-bulk')
+
+    def post(self, body, content_type):
+        with mock.patch.object(live, 'publish_many') as publish_many, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, body, content_type=content_type)
+        return response, publish_many
+
+    def test_json_file(self):
+        rows = [
+            {'collect': self.collect.pk, 'amount': '30'},
+            {'collect': self.collect.pk, 'user': self.donor.pk, 'amount': '20'},
+        ]
+        response, publish_many = self.post(json.dumps(rows), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2, 'failed': 0, 'errors': []})
+        self.collect.refresh_from_db()
+        self.assertEqual(self.collect.raised_amount, Decimal('50'))
+        self.assertEqual(UserDonationSummary.objects.get(pk=self.donor.pk).total_donated, Decimal('20'))
+        (events,), _ = publish_many.call_args
+        self.assertEqual([(collect_id, event) for collect_id, event, _ in events], [(self.collect.pk, 'progress')])
+
+    def test_malformed_row(self):
+        body = '\n'.join([
+            json.dumps({'collect': self.collect.pk, 'amount': '10'}),
+            '{"collect": ',
+            json.dumps({'collect': self.collect.pk, 'amount': '-5'}),
+        ])
+        response, _ = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertIn('amount', report['errors'][1]['errors'])
+
+    def test_inactive_collect(self):
+        rows = [{'collect': self.closed.pk, 'amount': '10'}]
+        response, publish_many = self.post(json.dumps(rows), 'application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'row': 1, 'errors': {'collect': ['Сбор закрыт.']}}])
+        self.assertFalse(Payment.objects.filter(collect=self.closed).exists())
+        publish_many.assert_not_called()
+
+    def test_goal_reached_publishes_closed(self):
+        rows = [{'collect': self.collect.pk, 'amount': '100'}]
+        response, publish_many = self.post(json.dumps(rows), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        (events,), _ = publish_many.call_args
+        self.assertEqual([(collect_id, event) for collect_id, event, _ in events], [(self.collect.pk, 'closed')])
+        self.assertIs(events[0][2]['is_active'], False)
+
+    def test_parser(self):
+        stream = BytesIO(b'{"collect": 1, "amount": "10"}\n\nnot json\n')
+        rows = list(NDJSONParser().parse(stream))
+        self.assertEqual(rows[0], {'collect': 1, 'amount': '10'})
+        self.assertEqual(len(rows), 3)
+        self.assertIs(rows[1], BLANK_LINE)
+        self.assertIsInstance(rows[2], ParseError)
+
+    def test_error_rows_match_file_lines(self):
+        body = '\n'.join([
+            json.dumps({'collect': self.collect.pk, 'amount': '10'}),
+            '',
+            '   ',
+            json.dumps({'collect': self.closed.pk, 'amount': '10'}),
+            json.dumps({'collect': self.collect.pk, 'amount': '5'}),
+        ])
+        response, _ = self.post(body, 'application/x-ndjson')
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'], [{'row': 4, 'errors': {'collect': ['Сбор закрыт.']}}])
+
+    def test_collects_loaded_once(self):
+        other = make_collect(self.admin, goal_amount=None)
+        rows = [{'collect': collect.pk, 'amount': '10'} for collect in (self.collect, other) for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response, _ = self.post(json.dumps(rows), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        # Сборы с авторами для писем и событий — один запрос на весь импорт.
+        joins = f'FROM "{Collect._meta.db_table}" INNER JOIN "{User._meta.db_table}"'
+        self.assertEqual(sum(joins in query['sql'] for query in queries), 1)
+
+
+class DonationLiveUpdateTest(TestCase):
+    """Платёж, закрывший сбор, сообщает зрителям о закрытии, а не о прогрессе."""
+
+    def test_auto_close_publishes_closed(self):
+        author = User.objects.create_user('author')
+        collect = make_collect(author, goal_amount=Decimal('100'))
+        with mock.patch.object(live, 'publish_progress') as publish_progress, \
+                mock.patch.object(live, 'publish_closed') as publish_closed, \
+                self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(collect=collect, user=author, amount=Decimal('100'))
+        publish_progress.assert_not_called()
+        publish_closed.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ImageProcessingTest(TestCase):
+    """Очищенный оригинал получает новый URL, а страницы с изображением — новую версию."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.author = User.objects.create_user('author')
+        self.collect = make_collect(self.author)
+
+    @staticmethod
+    def upload(name, pil_format):
+        image = Image.new('RGB', (64, 48), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        image.save(buffer, pil_format, exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_images', stdout=StringIO())
+
+    def test_cover_renamed_without_metadata(self):
+        self.collect.cover_image = self.upload('photo.tiff', 'TIFF')
+        self.collect.save()
+        source = self.collect.cover_image.name
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        self.process()
+
+        collect = Collect.objects.get(pk=self.collect.pk)
+        cover = collect.cover_image
+        self.assertNotEqual(cover.name, source)
+        self.assertTrue(cover.name.endswith('.jpg'))
+        self.assertFalse(cover.storage.exists(source))
+        self.assertEqual(collect.cover_renditions['source'], cover.name)
+        self.assertGreater(collect.updated_at, version)
+        with Image.open(cover.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertFalse(image.getexif())
+
+    def test_failure_is_retried_later(self):
+        self.collect.cover_image = SimpleUploadedFile('broken.jpg', b'not an image')
+        self.collect.save()
+        self.process()
+
+        task = ImageTask.objects.get(object_id=self.collect.pk)
+        self.assertEqual((task.status, task.attempts), (ImageTask.Status.PENDING, 1))
+        self.assertTrue(task.last_error)
+        self.assertGreater(task.next_attempt_at, timezone.now())
+        self.assertEqual(Collect.objects.get(pk=self.collect.pk).cover_renditions, {})
+
+    def test_avatar_updates_author_collects(self):
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        before = get_tag_versions([collect_tag(self.collect.pk)])
+        profile = self.author.profile
+        profile.avatar = self.upload('me.jpg', 'JPEG')
+        profile.save()
+        self.process()
+
+        self.assertGreater(Collect.objects.get(pk=self.collect.pk).updated_at, version)
+        after = get_tag_versions([collect_tag(self.collect.pk)])
+        self.assertGreater(after[collect_tag(self.collect.pk)], before[collect_tag(self.collect.pk)])
+
+
+class CensorTest(unittest.TestCase):
+    """Цензура: пересечения, границы совпадений, регистр, «ё» и пакетный режим."""
+
+    def test_overlapping_words(self):
+        # Из пересекающихся совпадений берётся самое левое, из начинающихся в одной точке — самое длинное.
+        self.assertEqual(CensorEngine(words=['ab', 'bcd']).censor('abcd'), '***cd')
+        self.assertEqual(CensorEngine(words=['ab', 'abc', 'bcd']).censor('xabcdx'), 'x***dx')
+
+    def test_boundaries(self):
+        self.assertEqual(censor('мудаки'), '***и')
+        self.assertEqual(censor('страхуй'), 'стра***')
+        # Корень забирает остаток слова, но не знаки после него.
+        self.assertEqual(censor('гондоны!'), '***!')
+        self.assertEqual(censor('пидор-ы'), '***-ы')
+        self.assertEqual(censor('Хорошее слово'), 'Хорошее слово')
+
+    def test_case(self):
+        self.assertEqual(censor('Ну ты и СуКа!'), 'Ну ты и ***!')
+        self.assertEqual(censor('ГОНДОНЫ'), '***')
+        # Символ, меняющий длину при lower(), не сдвигает границы замены.
+        self.assertEqual(censor('İсука'), 'İ***')
+
+    def test_yo(self):
+        for text in ('ебаный', 'ёбаный', 'Ёбаный', 'ебёт'):
+            with self.subTest(text=text):
+                self.assertEqual(censor(text), '***')
+        self.assertEqual(censor('хуё'), censor('хуе'))
+
+    def test_censor_many(self):
+        texts = ['сука', None, 'нормально', '', 5, 'су', 'ка']
+        self.assertEqual(censor_many(texts), [censor(text) for text in texts])
+        # Разделитель внутри строки — отдельный проход по каждой строке.
+        self.assertEqual(censor_many(['сука\x00', 'ок']), ['***\x00', 'ок'])
+        self.assertEqual(censor_many([]), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConditionalGetTest(TestCase):
+    """ETag и Last-Modified страниц и API сборов: 304 и смена версии при записи."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.collect = make_collect(self.author, goal_amount=None)
+        self.urls = [
+            reverse('collect_detail', args=[self.collect.pk]),
+            f'/api/v1/collects/{self.collect.pk}/',
+            reverse('home'),
+            '/api/v1/collects/',
+        ]
+
+    def test_not_modified(self):
+        client = Client()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag, later = response['ETag'], http_date(time.time() + 60)
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=later).status_code, 304)
+                # If-None-Match важнее даты.
+                response = client.get(url, HTTP_IF_NONE_MATCH='"old"', HTTP_IF_MODIFIED_SINCE=later)
+                self.assertEqual(response.status_code, 200)
+
+    def test_second_write_within_same_second(self):
+        url = reverse('collect_detail', args=[self.collect.pk])
+        second = timezone.now().replace(microsecond=0) - timedelta(minutes=1)
+        for urlconf in (settings.ROOT_URLCONF, AsyncViewsURLConf):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                Collect.objects.filter(pk=self.collect.pk).update(updated_at=second)
+                response = Client().get(url)
+                last_modified = response['Last-Modified']
+                self.assertEqual(Client().get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+                Collect.objects.filter(pk=self.collect.pk).update(updated_at=second + timedelta(milliseconds=500))
+                fresh = Client().get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(fresh.status_code, 200)
+                self.assertEqual(fresh['Last-Modified'], last_modified)
+                self.assertNotEqual(fresh['ETag'], response['ETag'])
+
+    def assertEtagsChange(self, write):
+        client = Client()
+        before = {url: client.get(url)['ETag'] for url in self.urls}
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = client.get(url, HTTP_IF_NONE_MATCH=before[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], before[url])
+
+    def test_donation_changes_etag(self):
+        self.assertEtagsChange(
+            lambda: Payment.objects.create(collect=self.collect, user=self.author, amount=Decimal('10'))
+        )
+
+    def test_comment_changes_etag(self):
+        # Комментарий меняет версию сбора; списки от него не зависят.
+        self.urls = self.urls[:2]
+        self.assertEtagsChange(lambda: Comment.objects.create(collect=self.collect, author=self.author, text='Ура'))
+
+    def test_viewer_in_page_etag(self):
+        url = reverse('collect_detail', args=[self.collect.pk])
+        anonymous = Client().get(url)
+        client = Client()
+        client.force_login(self.author)
+        logged_in = client.get(url)
+        self.assertNotEqual(anonymous['ETag'], logged_in['ETag'])
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code, 200)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=logged_in['ETag']).status_code, 304)
+
+
+# Вторая БД для тестов маршрутизации: зеркало основной, как реплики из DATABASE_REPLICAS.
+REPLICA_ALIAS = 'replica_test'
+connections.settings.setdefault(REPLICA_ALIAS, {
+    **connections.settings[DEFAULT_DB_ALIAS],
+    'TEST': {**connections.settings[DEFAULT_DB_ALIAS]['TEST'], 'MIRROR': DEFAULT_DB_ALIAS},
+})
+
+
+@override_settings(REPLICA_DATABASES=[REPLICA_ALIAS], REPLICA_CHECK_INTERVAL=0)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Чтения безопасных запросов идут на реплику, кроме случаев, когда нужны свежие
+    данные. TransactionTestCase: внутри транзакции TestCase все чтения идут в основную БД.
+    """
+    databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+
+    def setUp(self):
+        self.collect = make_collect(User.objects.create_user('author'))
+        self.enterContext(mock.patch.dict(replicas._health, clear=True))
+        self.factory = RequestFactory()
+
+    def route(self, method='get', cookies=None, write=False):
+        """Проводит запрос через middleware; возвращает (ответ, БД чтений до записи, после записи, сессий)."""
+        routed = {}
+
+        def view(request):
+            routed['before'] = router.db_for_read(Collect)
+            if write:
+                Collect.touch(self.collect.pk)
+            routed['after'] = router.db_for_read(Collect)
+            routed['session'] = router.db_for_read(Session)
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/')
+        request.COOKIES.update(cookies or {})
+        response = replicas.ReplicaRoutingMiddleware(view)(request)
+        return response, routed
+
+    def test_get_reads_from_replica(self):
+        response, routed = self.route()
+        self.assertEqual((routed['before'], routed['after']), (REPLICA_ALIAS, REPLICA_ALIAS))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_read_after_write_uses_primary(self):
+        response, routed = self.route(write=True)
+        self.assertEqual((routed['before'], routed['after']), (REPLICA_ALIAS, DEFAULT_DB_ALIAS))
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_post_pins_to_primary(self):
+        response, routed = self.route(method='post')
+        self.assertEqual(routed['before'], DEFAULT_DB_ALIAS)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_pin_cookie_reads_from_primary(self):
+        _, routed = self.route(cookies={settings.REPLICA_PIN_COOKIE: '1'})
+        self.assertEqual(routed['before'], DEFAULT_DB_ALIAS)
+
+    def test_sessions_use_primary(self):
+        _, routed = self.route()
+        self.assertEqual(routed['session'], DEFAULT_DB_ALIAS)
+
+    def test_transaction_uses_primary(self):
+        def view(request):
+            with transaction.atomic():
+                return HttpResponse(router.db_for_read(Collect))
+
+        response = replicas.ReplicaRoutingMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(response.content.decode(), DEFAULT_DB_ALIAS)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch.object(replicas, 'replica_lag', return_value=settings.REPLICA_MAX_LAG_SECONDS + 1), \
+                self.assertLogs(replicas.logger, 'WARNING'):
+            _, routed = self.route()
+        self.assertEqual(routed['before'], DEFAULT_DB_ALIAS)
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        with mock.patch.object(replicas, 'replica_lag', side_effect=OperationalError('connection refused')), \
+                self.assertLogs(replicas.logger, 'WARNING'):
+            _, routed = self.route()
+        self.assertEqual(routed['before'], DEFAULT_DB_ALIAS)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CloseExpiredCollectsTest(TestCase):
+    """close_expired_collects закрывает истёкшие сборы пачками, по письму и сбросу кэша на сбор."""
+
+    def setUp(self):
+        now = timezone.now()
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.expired = [make_collect(self.author, end_at=now - timedelta(hours=hours)) for hours in range(1, 6)]
+        self.expired[0].close_reason = 'Причина автора'
+        self.expired[0].save()
+        self.pending = [
+            make_collect(self.author, end_at=now + timedelta(hours=1)),
+            make_collect(self.author, end_at=None),
+        ]
+
+    def test_close_in_batches(self):
+        tags = [collect_tag(collect.pk) for collect in self.expired + self.pending]
+        before = get_tag_versions(tags)
+        emails = OutgoingEmail.objects.count()
+        stdout = StringIO()
+        with mock.patch.object(live, 'publish_closed_many') as publish_closed_many, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('close_expired_collects', batch_size=2, stdout=stdout)
+
+        self.assertEqual(stdout.getvalue().split(), 'Закрыто сборов: 2 Закрыто сборов: 2 Закрыто сборов: 1'.split())
+        closed = Collect.objects.filter(pk__in=[collect.pk for collect in self.expired])
+        self.assertFalse(closed.filter(is_active=True).exists())
+        self.assertEqual(closed.get(pk=self.expired[0].pk).close_reason, 'Причина автора')
+        self.assertEqual(closed.filter(close_reason=Collect.EXPIRED_CLOSE_REASON).count(), 4)
+        self.assertEqual(Collect.objects.filter(pk__in=[collect.pk for collect in self.pending], is_active=True).count(), 2)
+
+        self.assertEqual(OutgoingEmail.objects.count() - emails, len(self.expired))
+        after = get_tag_versions(tags)
+        for collect in self.expired:
+            self.assertEqual(after[collect_tag(collect.pk)], before[collect_tag(collect.pk)] + 1)
+        for collect in self.pending:
+            self.assertEqual(after[collect_tag(collect.pk)], before[collect_tag(collect.pk)])
+        published = [collect.pk for (batch,), _ in publish_closed_many.call_args_list for collect in batch]
+        self.assertCountEqual(published, [collect.pk for collect in self.expired])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CommentBulkDeleteTest(TestCase):
+    """Массовое удаление комментариев обновляет счётчик, версию сбора и кэш один раз на пачку."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.collect = make_collect(self.author)
+        self.other = make_collect(self.author)
+        # Отложенные пачки сигналов выполняются здесь, чтобы тест не дописывал в пачку setUp.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comments = [
+                Comment.objects.create(collect=self.collect, author=self.author, text=f'Комментарий {i}')
+                for i in range(4)
+            ]
+            self.foreign = Comment.objects.create(collect=self.other, author=self.author, text='Чужой')
+
+    def test_delete_selected(self):
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        pks = [self.comments[0].pk, self.comments[1].pk, self.foreign.pk]
+        self.assertEqual(Comment.delete_selected(self.collect.pk, pks), 2)
+
+        self.assertEqual(CollectStats.objects.get(pk=self.collect.pk).comments_count, 2)
+        self.assertEqual(Comment.objects.filter(collect=self.collect).count(), 2)
+        self.assertGreater(Collect.objects.get(pk=self.collect.pk).updated_at, version)
+        # Комментарий другого сбора не удаляется, даже если его id передан.
+        self.assertTrue(Comment.objects.filter(pk=self.foreign.pk).exists())
+        self.assertEqual(CollectStats.objects.get(pk=self.other.pk).comments_count, 1)
+
+    def test_queryset_delete_batches_updates(self):
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        before = get_tag_versions([collect_tag(self.collect.pk)])[collect_tag(self.collect.pk)]
+        table = Collect._meta.db_table
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.filter(collect=self.collect).exclude(pk=self.comments[0].pk).delete()
+        touches = [query['sql'] for query in queries if query['sql'].startswith(f'UPDATE "{table}"')]
+        self.assertEqual(len(touches), 1)
+        self.assertEqual(CollectStats.objects.get(pk=self.collect.pk).comments_count, 1)
+        self.assertGreater(Collect.objects.get(pk=self.collect.pk).updated_at, version)
+        after = get_tag_versions([collect_tag(self.collect.pk)])[collect_tag(self.collect.pk)]
+        self.assertEqual(after, before + 1)
+
+    def test_nothing_deleted(self):
+        version = Collect.objects.get(pk=self.collect.pk).updated_at
+        self.assertEqual(Comment.delete_selected(self.collect.pk, [self.foreign.pk]), 0)
+        self.assertEqual(Comment.delete_selected(self.collect.pk, []), 0)
+        self.assertEqual(CollectStats.objects.get(pk=self.collect.pk).comments_count, 4)
+        self.assertEqual(Collect.objects.get(pk=self.collect.pk).updated_at, version)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ExportTest(TestCase):
+    """Потоковая выгрузка платежей и сборов: формат, колонки, фильтры и доступ."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', is_staff=True)
+        cls.donor = User.objects.create_user('donor', 'donor@example.com')
+        cls.collect = make_collect(cls.staff, title='Подарок', occasion=Collect.Occasion.BIRTHDAY, goal_amount=None)
+        cls.other = make_collect(cls.staff, goal_amount=None)
+        moments = {
+            'before': datetime(2024, 3, 9, 12, 0),
+            'late': datetime(2024, 3, 10, 23, 30),
+            'midnight': datetime(2024, 3, 11, 0, 0),
+        }
+        cls.payments = {}
+        for name, moment in moments.items():
+            payment = Payment.objects.create(collect=cls.collect, user=cls.donor, amount=Decimal('10.50'))
+            Payment.objects.filter(pk=payment.pk).update(created_at=timezone.make_aware(moment))
+            cls.payments[name] = payment.pk
+        cls.payments['other'] = Payment.objects.create(collect=cls.other, user=cls.donor, amount=Decimal('5')).pk
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, resource='payments', **params):
+        response = self.client.get(reverse(f'export_{resource}'), params)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+        return response
+
+    def ids(self, **params):
+        response = self.export(format='ndjson', fields='id', **params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line)['id'] for line in response.body.splitlines()]
+
+    def test_csv(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="payments-', response['Content-Disposition'])
+        self.assertTrue(response.body.startswith('\ufeff'.encode()))
+        rows = list(csv.reader(StringIO(response.body.decode('utf-8-sig'))))
+        self.assertEqual(rows[0], [
+            'id', 'created_at', 'amount', 'collect', 'collect_title', 'occasion', 'occasion_display',
+            'user', 'username', 'email',
+        ])
+        self.assertEqual(len(rows), 1 + len(self.payments))
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['id'], str(self.payments['before']))
+        self.assertEqual(first['created_at'], '2024-03-09 12:00:00+03:00')
+        self.assertEqual((first['amount'], first['collect_title'], first['username']), ('10.50', 'Подарок', 'donor'))
+        self.assertEqual(first['occasion_display'], Collect.Occasion.BIRTHDAY.label)
+
+    def test_ndjson(self):
+        response = self.export(format='ndjson', collect=self.collect.pk)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = response.body.splitlines()
+        self.assertEqual(len(lines), 3)
+        row = json.loads(lines[0])
+        self.assertEqual(row['id'], self.payments['before'])
+        self.assertEqual(row['created_at'], '2024-03-09T12:00:00+03:00')
+        self.assertEqual((row['amount'], row['user'], row['email']), ('10.50', self.donor.pk, 'donor@example.com'))
+
+    def test_fields(self):
+        response = self.export(fields='amount,id')
+        header = response.body.decode('utf-8-sig').splitlines()[0]
+        # Колонки идут в порядке описания выгрузки, а не запроса.
+        self.assertEqual(header, 'id,amount')
+        response = self.export(format='ndjson', fields='username')
+        self.assertEqual(json.loads(response.body.splitlines()[0]), {'username': 'donor'})
+        self.assertEqual(self.export(fields='id,password').status_code, 400)
+
+    def test_date_range(self):
+        day = self.ids(date_from='2024-03-10', date_to='2024-03-10')
+        self.assertEqual(day, [self.payments['late']])
+        # Дата со временем — граница включительно с точностью до момента.
+        self.assertEqual(self.ids(date_from='2024-03-10', date_to='2024-03-11T00:00:00'),
+                         [self.payments['late'], self.payments['midnight']])
+        self.assertEqual(self.ids(date_to='2024-03-09'), [self.payments['before']])
+
+    def test_filters(self):
+        self.assertEqual(self.ids(occasion=Collect.Occasion.BIRTHDAY), [
+            self.payments['before'], self.payments['late'], self.payments['midnight'],
+        ])
+        collects = self.export('collects', format='ndjson', fields='id', occasion=Collect.Occasion.PROJECT)
+        self.assertEqual([json.loads(line)['id'] for line in collects.body.splitlines()], [self.other.pk])
+
+    def test_bad_parameters(self):
+        for params in ({'date_from': '2024-13-01'}, {'date_to': 'вчера'}, {'occasion': 'unknown'},
+                       {'collect': 'abc'}, {'format': 'xml'}):
+            with self.subTest(params=params):
+                response = self.export(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.json())
+
+    def test_staff_only(self):
+        self.client.force_login(self.donor)
+        self.assertEqual(self.export().status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.export('collects').status_code, 403)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('export', 'payments', format='ndjson', fields='id', to='2024-03-10', stdout=stdout)
+        self.assertEqual([json.loads(line)['id'] for line in stdout.getvalue().splitlines()],
+                         [self.payments['before'], self.payments['late']])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DonationAutoCloseTest(TestCase):
+    """Автозакрытие платежом: запись в БД платежа и одно письмо с событием о закрытии."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.collect = make_collect(self.author, goal_amount=Decimal('100'))
+
+    def test_routed_to_payment_database(self):
+        with mock.patch.object(Collect, 'register_donation', wraps=Collect.register_donation) as register_donation:
+            payment = Payment(collect=self.collect, user=self.author, amount=Decimal('10'))
+            payment.save(using=DEFAULT_DB_ALIAS)
+        register_donation.assert_called_once_with(self.collect.pk, Decimal('10'), using=DEFAULT_DB_ALIAS)
+
+    def test_save_after_auto_close(self):
+        payment = Payment.objects.create(collect=self.collect, user=self.author, amount=Decimal('100'))
+        collect = payment.collect
+        self.assertFalse(collect.is_active)
+        emails = OutgoingEmail.objects.count()
+        with mock.patch.object(live, 'publish_closed') as publish_closed, \
+                self.captureOnCommitCallbacks(execute=True):
+            collect.title = 'Новое название'
+            collect.save()
+        publish_closed.assert_not_called()
+        self.assertEqual(OutgoingEmail.objects.count(), emails)
+        self.collect.refresh_from_db()
+        self.assertEqual((self.collect.is_active, self.collect.close_reason), (False, Collect.AUTO_CLOSE_REASON))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class KeysetPaginationTest(TestCase):
+    """Курсорная пагинация лент и API: обход без пропусков и повторов при равных датах, отказ на битом курсоре."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.active = [make_collect(author, title=f'Сбор {i}') for i in range(2 * views.LIST_PAGE_SIZE + 1)]
+        cls.archived = [
+            make_collect(author, title=f'Архив {i}', is_active=False) for i in range(views.LIST_PAGE_SIZE + 2)
+        ]
+        # Одинаковые даты: порядок внутри страницы и граница курсора держатся на id.
+        moment = timezone.now() - timedelta(days=1)
+        Collect.objects.update(created_at=moment, end_at=None)
+        Collect.objects.filter(pk__in=[c.pk for c in cls.archived[:3]]).update(end_at=moment + timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk_pages(self, url):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(url, {'cursor': cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            ids += [collect.pk for collect in response.context['collects']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_home_pages_cover_active_collects_once(self):
+        expected = sorted((c.pk for c in self.active), reverse=True)
+        self.assertEqual(self.walk_pages(reverse('home')), expected)
+
+    def test_archive_pages_order_by_closing_date(self):
+        closed_early = sorted((c.pk for c in self.archived[3:]), reverse=True)
+        closed_late = sorted((c.pk for c in self.archived[:3]), reverse=True)
+        self.assertEqual(self.walk_pages(reverse('archive')), closed_late + closed_early)
+
+    def test_api_next_links_cover_collects_once(self):
+        ids, url = [], '/api/v1/collects/?page_size=4'
+        while url:
+            data = self.client.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, sorted((c.pk for c in self.active + self.archived), reverse=True))
+
+    def test_cursor_round_trip(self):
+        queryset = Collect.objects.all()
+        first, cursor = keyset_page(queryset, ['-created_at', '-id'], size=5)
+        values = decode_cursor(cursor, queryset, ['-created_at', '-id'])
+        self.assertEqual(values, [first[-1].created_at, first[-1].pk])
+        second, _ = keyset_page(queryset, ['-created_at', '-id'], cursor, size=5)
+        self.assertEqual(second[0].pk, first[-1].pk - 1)
+
+    def test_invalid_cursor_rejected(self):
+        wrong_length = encode_cursor([1])
+        for cursor in ('не-курсор', wrong_length, encode_cursor(['вчера', 1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(reverse('home'), {'cursor': cursor}).status_code, 400)
+                response = self.client.get('/api/v1/collects/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': KeysetCursorPagination.invalid_cursor_message})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SearchTest(TestCase):
+    """Поиск по названию, уточнению повода и описанию (в PostgreSQL — полнотекстовый, иначе icontains)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.by_title = make_collect(author, title='Подарок учителю')
+        cls.by_occasion = make_collect(
+            author, title='Сбор', occasion=Collect.Occasion.OTHER, occasion_other_text='Выпускной вечер'
+        )
+        cls.by_description = make_collect(author, title='Сбор', description='Купим велосипед для Маши')
+        make_collect(author, title='Посторонний сбор', description='Ничего общего')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, text):
+        return [collect.pk for collect in search_collects(Collect.objects.all(), text)]
+
+    def test_matches_each_searchable_field(self):
+        # icontains в SQLite не сравнивает кириллицу без учёта регистра, поэтому регистр слов совпадает.
+        cases = [('учителю', self.by_title), ('Выпускной', self.by_occasion), ('велосипед', self.by_description)]
+        for text, collect in cases:
+            with self.subTest(text=text):
+                self.assertEqual(self.search(text), [collect.pk])
+
+    def test_search_page_and_api(self):
+        response = self.client.get(reverse('collect_search'), {'q': ' велосипед '})
+        self.assertEqual([c.pk for c in response.context['collects']], [self.by_description.pk])
+        data = self.client.get('/api/v1/collects/', {'q': 'учителю'}).json()
+        self.assertEqual([row['id'] for row in data['results']], [self.by_title.pk])
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('collect_search'), {'q': '  '})
+        self.assertEqual(list(response.context['collects']), [])
+        data = self.client.get('/api/v1/collects/', {'q': '  '}).json()
+        self.assertEqual(len(data['results']), Collect.objects.count())
+
+
+class SendOutboxTest(TestCase):
+    """Воркер send_outbox: отправка готовых писем и повтор с экспоненциальной задержкой после ошибки."""
+
+    def setUp(self):
+        self.email = OutgoingEmail.enqueue('Сбор закрыт', 'Цель достигнута', ['author@example.com'])
+
+    def send(self, **options):
+        call_command('send_outbox', stdout=StringIO(), **options)
+        self.email.refresh_from_db()
+
+    def test_sends_due_emails(self):
+        later = OutgoingEmail.enqueue('Позже', 'Ещё рано', ['author@example.com'])
+        OutgoingEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        self.send()
+        self.assertEqual((self.email.status, self.email.attempts), (OutgoingEmail.Status.SENT, 1))
+        self.assertIsNotNone(self.email.sent_at)
+        self.assertEqual([(m.subject, m.to) for m in mail.outbox], [('Сбор закрыт', ['author@example.com'])])
+        self.assertEqual(OutgoingEmail.objects.get(pk=later.pk).status, OutgoingEmail.Status.PENDING)
+
+    def test_failure_retried_with_backoff(self):
+        send_messages = mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP недоступен')
+        )
+        with send_messages:
+            before = timezone.now()
+            self.send(retry_delay=30, max_attempts=3)
+            self.assertEqual((self.email.status, self.email.attempts), (OutgoingEmail.Status.PENDING, 1))
+            self.assertEqual(self.email.last_error, 'SMTP недоступен')
+            self.assertGreaterEqual(self.email.next_attempt_at, before + timedelta(seconds=30))
+
+            self.send(retry_delay=30, max_attempts=3)
+            self.assertEqual(self.email.attempts, 1, 'до next_attempt_at письмо не берётся')
+
+            OutgoingEmail.objects.filter(pk=self.email.pk).update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            self.send(retry_delay=30, max_attempts=3)
+            self.assertEqual(self.email.attempts, 2)
+            self.assertGreaterEqual(self.email.next_attempt_at, before + timedelta(seconds=60))
+
+            OutgoingEmail.objects.filter(pk=self.email.pk).update(next_attempt_at=timezone.now())
+            self.send(retry_delay=30, max_attempts=3)
+            self.assertEqual((self.email.status, self.email.attempts), (OutgoingEmail.Status.FAILED, 3))
+        self.assertEqual(mail.outbox, [])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED поддерживает только PostgreSQL.')
+class SendOutboxLockingTest(TransactionTestCase):
+    """Письма, заблокированные другим воркером, пропускаются, а не отправляются дважды."""
+
+    def test_skips_locked_emails(self):
+        locked = OutgoingEmail.enqueue('Занято', 'У другого воркера', ['a@example.com'])
+        free = OutgoingEmail.enqueue('Свободно', 'Можно отправлять', ['b@example.com'])
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('BEGIN')
+                cursor.execute(f'SELECT id FROM {OutgoingEmail._meta.db_table} WHERE id = %s FOR UPDATE', [locked.pk])
+                call_command('send_outbox', stdout=StringIO())
+                cursor.execute('ROLLBACK')
+        finally:
+            other.close()
+        self.assertEqual(OutgoingEmail.objects.get(pk=locked.pk).status, OutgoingEmail.Status.PENDING)
+        self.assertEqual(OutgoingEmail.objects.get(pk=free.pk).status, OutgoingEmail.Status.SENT)
+        self.assertEqual([m.subject for m in mail.outbox], ['Свободно'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProjectionTest(TestCase):
+    """Чтение API проекциями: тот же JSON, что у сериализаторов, и выбор полей через ``?fields=``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', first_name='Анна')
+        cls.collect = make_collect(
+            cls.author, occasion=Collect.Occasion.OTHER, occasion_other_text='Юбилей',
+            goal_amount=Decimal('300'), end_at=timezone.now() + timedelta(days=3),
+        )
+        cls.without_goal = make_collect(cls.author, goal_amount=None)
+        cls.payment = Payment.objects.create(collect=cls.collect, user=cls.author, amount=Decimal('100.50'))
+
+    def setUp(self):
+        cache.clear()
+
+    def serialized(self, serializer_class, instance):
+        request = RequestFactory().get('/')
+        return json.loads(JSONRenderer().render(serializer_class(instance, context={'request': request}).data))
+
+    def test_matches_serializers(self):
+        cases = [
+            *((f'/api/v1/collects/{collect.pk}/', CollectSerializer, collect) for collect in Collect.objects.all()),
+            (f'/api/v1/payments/{self.payment.pk}/', PaymentSerializer, self.payment),
+            (f'/api/v1/users/{self.author.pk}/', UserSerializer, self.author),
+        ]
+        for url, serializer_class, instance in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).json(), self.serialized(serializer_class, instance))
+        self.assertEqual(self.client.get(f'/api/v1/collects/{self.collect.pk}/').json()['stats']['donations_count'], 1)
+
+    def test_list_matches_detail(self):
+        results = self.client.get('/api/v1/collects/').json()['results']
+        self.assertEqual(results, [self.client.get(f'/api/v1/collects/{row["id"]}/').json() for row in results])
+
+    def test_fields_selects_columns_in_declared_order(self):
+        data = self.client.get('/api/v1/collects/', {'fields': 'title, id,stats'}).json()
+        self.assertEqual([list(row) for row in data['results']], [['id', 'title', 'stats']] * 2)
+        self.assertIsNone(data['next'])
+        row = self.client.get(f'/api/v1/payments/{self.payment.pk}/', {'fields': 'amount'}).json()
+        self.assertEqual(row, {'amount': '100.50'})
+
+    def test_unknown_field_rejected(self):
+        for url in ('/api/v1/collects/', f'/api/v1/collects/{self.collect.pk}/', '/api/v1/users/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'id,password,secret'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Неизвестные поля: password, secret.'})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CollectCardCacheTest(TestCase):
+    """Карточки сборов кэшируются по ``updated_at`` и обновляются после пожертвования и комментария."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collect = make_collect(self.author, goal_amount=Decimal('1000'))
+
+    def card(self):
+        collect = Collect.objects.select_related('stats').get(pk=self.collect.pk)
+        (_, html), = fragments.render_cards([collect])
+        return collect, html
+
+    def test_unchanged_card_served_from_cache(self):
+        collect, html = self.card()
+        with mock.patch.object(fragments, 'render_to_string') as render_to_string:
+            self.assertEqual(self.card(), (collect, html))
+        render_to_string.assert_not_called()
+        self.assertIsNotNone(cache.get(fragments.card_key(collect)))
+
+    def test_donation_refreshes_card(self):
+        before, html = self.card()
+        self.assertIn('Собрано:</strong> 0', html)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(collect=self.collect, user=self.author, amount=Decimal('250'))
+        after, html = self.card()
+        self.assertGreater(after.updated_at, before.updated_at)
+        self.assertIn('Собрано:</strong> 250', html)
+        self.assertIn('Участников: 1', html)
+
+    def test_comment_refreshes_card(self):
+        before, html = self.card()
+        self.assertIn('💬 0', html)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(collect=self.collect, author=self.author, text='Поддерживаю')
+        after, html = self.card()
+        self.assertNotEqual(fragments.card_key(after), fragments.card_key(before))
+        self.assertIn('💬 1', html)
+        self.assertIn('💬 1', self.client.get(reverse('home')).content.decode())
+
+
+class FakePoolConnection:
+    """Соединение psycopg2 для тестов пула: закрытие, откат и ``SELECT 1`` без сервера."""
+
+    def __init__(self):
+        self.closed = 0
+        self.server_gone = False
+        self.info = mock.Mock(transaction_status=TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        if self.server_gone:
+            error = psycopg2.OperationalError('server closed the connection')
+            cursor.__enter__.return_value.execute.side_effect = error
+        return cursor
+
+    def rollback(self):
+        if self.closed or self.server_gone:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """Пул соединений: повторная выдача возвращённых соединений и замена оборванных."""
+
+    def setUp(self):
+        self.pool = dbpool.ConnectionPool(
+            'db', 'collects', min_size=1, max_size=2, timeout=0.05, max_age=1800, max_idle=300, check_idle=30,
+        )
+        self.opened = []
+
+    def connect(self):
+        self.opened.append(FakePoolConnection())
+        return self.opened[-1]
+
+    def test_returned_connection_reused(self):
+        first = self.pool.getconn(self.connect)
+        self.assertEqual(self.pool.stats()['in_use'], 1)
+        self.pool.putconn(first)
+        self.assertIs(self.pool.getconn(self.connect), first)
+        stats = self.pool.stats()
+        self.assertEqual((stats['opened'], stats['checkouts'], stats['size']), (1, 2, 1))
+
+    def test_exhausted_pool_waits_then_times_out(self):
+        held = [self.pool.getconn(self.connect) for _ in range(2)]
+        with self.assertRaises(dbpool.PoolTimeout):
+            self.pool.getconn(self.connect)
+        with ThreadPoolExecutor(1) as executor:
+            waiting = executor.submit(self.pool.getconn, self.connect)
+            while not self.pool._waiters:
+                time.sleep(0.001)
+            self.pool.putconn(held[0])
+            self.assertIs(waiting.result(timeout=1), held[0])
+        stats = self.pool.stats()
+        self.assertEqual((stats['opened'], stats['timeouts'], stats['exhausted']), (2, 1, 1))
+
+    def test_broken_connection_discarded_on_return(self):
+        closed = self.pool.getconn(self.connect)
+        closed.close()
+        self.pool.putconn(closed)
+        in_transaction = self.pool.getconn(self.connect)
+        in_transaction.info.transaction_status = TRANSACTION_STATUS_INERROR
+        in_transaction.server_gone = True
+        self.pool.putconn(in_transaction)
+        self.assertTrue(in_transaction.closed)
+        self.assertEqual((self.pool.stats()['size'], self.pool.stats()['closed']['broken']), (0, 2))
+        self.assertIs(self.pool.getconn(self.connect), self.opened[2])
+
+    def test_connection_closed_by_server_replaced_on_checkout(self):
+        connection = self.pool.getconn(self.connect)
+        self.pool.putconn(connection)
+        connection.server_gone = True
+        self.pool._idle[-1] = (connection, time.monotonic() - self.pool.check_idle - 1)
+        replacement = self.pool.getconn(self.connect)
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['closed']['check'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LargeTableAdminTest(TestCase):
+    """Списки админки для больших таблиц: оценка числа строк, фильтр с автодополнением и поиск пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.donors = [User.objects.create_user(name) for name in ('Anna', 'annette', 'boris')]
+        cls.collect = make_collect(cls.admin, goal_amount=None)
+        for donor in cls.donors:
+            Payment.objects.create(collect=cls.collect, user=donor, amount=Decimal('10'))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_estimated_count_used_for_large_results(self):
+        payments = Payment.objects.order_by('-id')
+        with mock.patch('collect_app.pagination.estimated_count', return_value=None):
+            self.assertEqual(EstimatedCountPaginator(payments, 2).count, 3)
+        with mock.patch('collect_app.pagination.estimated_count', return_value=250_000), \
+                CaptureQueriesContext(connection) as queries:
+            paginator = EstimatedCountPaginator(payments, 2)
+            self.assertEqual(paginator.count, 250_000)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+    def test_page_reads_rows_by_primary_keys(self):
+        payments = Payment.objects.select_related('user').order_by('-id')
+        page = EstimatedCountPaginator(payments, 2).page(2)
+        self.assertEqual([payment.user for payment in page], [self.donors[0]])
+        self.assertEqual(EstimatedCountPaginator(payments, 2).page(1).object_list.count(), 2)
+
+    def test_autocomplete_filter_renders_selected_user_only(self):
+        url = reverse('admin:collect_app_payment_changelist')
+        selected = self.donors[1]
+        response = self.client.get(url, {'user__id__exact': selected.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([payment.user for payment in response.context['cl'].result_list], [selected])
+        content = response.content.decode()
+        self.assertIn(f'<option value="{selected.pk}" selected>annette</option>', content)
+        self.assertNotIn('>boris</option>', content)
+        self.assertIn('data-placeholder="Участник"', content)
+
+    def test_autocomplete_filter_with_invalid_value(self):
+        response = self.client.get(reverse('admin:collect_app_payment_changelist'), {'user__id__exact': 'abc'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_user_search_by_prefix_ignores_case(self):
+        response = self.client.get(reverse('admin:auth_user_changelist'), {'q': 'ANN'})
+        found = {user.username for user in response.context['cl'].result_list}
+        self.assertEqual(found, {'Anna', 'annette'})
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Индекс по UPPER(username) есть только в PostgreSQL.')
+    def test_user_search_uses_upper_index(self):
+        queryset, _ = admin.site._registry[User].get_search_results(None, User.objects.all(), 'ann')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('auth_user_username_upper_like_idx', plan)
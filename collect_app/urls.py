@@ -1,25 +1,37 @@
 from django.urls import path, include
 from .views import (
-    HomePageView,
-    ArchiveCollectsView, # <-- Правильное имя класса
-    CollectDetailView,
+    for_server,
+    home_page,
+    ahome_page,
+    archive_collects,
+    aarchive_collects,
+    collect_detail,
+    acollect_detail,
     CollectCreateView,
     PaymentDemoView,
     AdminUserListView,
+    db_pool_stats,
     SignUpView,
     profile_view,
     CollectCloseView,
+    CollectSearchView,
+    collect_comments,
+    collect_events,
 )
 
 urlpatterns = [
-    path('', HomePageView.as_view(), name='home'),
-    path('archive/', ArchiveCollectsView.as_view(), name='archive'), # <-- Правильное имя пути 'archive'
+    path('', for_server(home_page, ahome_page), name='home'),
+    path('archive/', for_server(archive_collects, aarchive_collects), name='archive'),
+    path('search/', CollectSearchView.as_view(), name='collect_search'),
     path('collect/new/', CollectCreateView.as_view(), name='collect_create'),
-    path('collect/<int:pk>/', CollectDetailView.as_view(), name='collect_detail'),
+    path('collect/<int:pk>/', for_server(collect_detail, acollect_detail), name='collect_detail'),
+    path('collect/<int:pk>/comments/', collect_comments, name='collect_comments'),
+    path('collect/<int:pk>/events/', collect_events, name='collect_events'),
     path('collect/<int:pk>/donate/', PaymentDemoView.as_view(), name='payment_demo'),
     path('collect/<int:pk>/close/', CollectCloseView.as_view(), name='collect_close'),
     path('signup/', SignUpView.as_view(), name='signup'),
     path('profile/', profile_view, name='profile'),
     path('admin/users/', AdminUserListView.as_view(), name='admin_user_list'),
+    path('admin/db-pool/', db_pool_stats, name='db_pool_stats'),
     path('accounts/', include('django.contrib.auth.urls')),
 ]
\ No newline at end of file
@@ -1,20 +1,159 @@
-import re
+"""
+Цензура нецензурной лексики.
 
+Русские шаблоны и английский словарь пакета ``profanity`` собраны в один автомат
+Ахо — Корасик, поэтому текст проверяется за один линейный проход независимо от
+размера словаря. Совпадения ищутся без учёта регистра и без различия «ё» и «е»,
+из пересекающихся выбирается самое левое и самое длинное, найденный фрагмент
+заменяется на ``***``.
+"""
+from collections import deque
+from functools import lru_cache
+
+from profanity import profanity
+
+CENSOR_MASK = '***'
+
+# Фрагменты, которые заменяются ровно в границах совпадения.
 RU_PROFANITY = [
-    r'п(и|е|ы)?з(д|т)',
-    r'хуй', r'хую', r'хуя',  r'хуе|ё',
-    r'ёб', r'еб[а-я]*',
-    r'бля[тд][ьи]?',
-    r'сука', r'мудак',
-    r'пидор[а-я]*',
-    r'гондон[а-я]*',
-    r'чмо',
-    r'сук(а|и)', r'сучка', r'сучье'
+    'пзд', 'пзт', 'пизд', 'пизт', 'пезд', 'пезт', 'пызд', 'пызт',
+    'хуй', 'хую', 'хуя', 'хуе', 'хуё',
+    'ёб',
+    'блят', 'бляд', 'блять', 'бляти', 'блядь', 'бляди',
+    'сука', 'суки', 'мудак',
+    'чмо',
+    'сучка', 'сучье',
 ]
 
-PATTERN = re.compile(r'(' + '|'.join(RU_PROFANITY) + r')', flags=re.IGNORECASE)
+# Корни, после которых цензурируется и остаток слова (буквы а–я).
+RU_PROFANITY_STEMS = ['еб', 'пидор', 'гондон']
+
+_WORD_TAIL = frozenset(map(chr, range(ord('а'), ord('я') + 1)))
+_SEPARATOR = '\x00'
+
+
+def _fold(text):
+    """Нижний регистр и «ё» → «е»; длина строки не меняется."""
+    return text.lower().replace('ё', 'е')
+
+
+class CensorEngine:
+    """Автомат Ахо — Корасик над словарём; строится один раз и переиспользуется."""
+
+    def __init__(self, words=(), stems=()):
+        self.goto = [{}]
+        self.fail = [0]
+        # Слово, заканчивающееся в состоянии: (длина, корень ли) или None.
+        self.output = [None]
+        # Ближайшее по суффиксным ссылкам состояние, в котором заканчивается слово.
+        self.output_link = [0]
+        for word in words:
+            self._add(_fold(word), stem=False)
+        for stem in stems:
+            self._add(_fold(stem), stem=True)
+        self._build_links()
+
+    def _add(self, word, stem):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.output_link.append(0)
+            state = next_state
+        if self.output[state] is None or stem:
+            self.output[state] = (len(word), stem)
+
+    def _build_links(self):
+        # Суффиксные ссылки сразу сворачиваются в полную таблицу переходов (ДКА):
+        # при сканировании на символ приходится один поиск в словаре, без возвратов.
+        self.delta = [dict(self.goto[0])]
+        self.delta.extend({} for _ in range(len(self.goto) - 1))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self.delta[state] = {**self.delta[self.fail[state]], **self.goto[state]}
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                target = self.delta[self.fail[state]].get(char, 0)
+                self.fail[next_state] = target
+                self.output_link[next_state] = target if self.output[target] else self.output_link[target]
+        self.matches = [bool(self.output[state] or self.output_link[state]) for state in range(len(self.goto))]
+
+    def _spans(self, lowered):
+        """Самые левые и самые длинные непересекающиеся совпадения ``(start, end)``."""
+        delta, matches, output, output_link = self.delta, self.matches, self.output, self.output_link
+        size = len(lowered)
+        best = {}
+        state = 0
+        for position, char in enumerate(lowered):
+            state = delta[state].get(char, 0)
+            if not matches[state]:
+                continue
+            match_state = state if output[state] else output_link[state]
+            while match_state:
+                length, stem = output[match_state]
+                start, end = position + 1 - length, position + 1
+                if stem:
+                    while end < size and lowered[end] in _WORD_TAIL:
+                        end += 1
+                if end > best.get(start, start):
+                    best[start] = end
+                match_state = output_link[match_state]
+
+        spans = []
+        covered = 0
+        for start in sorted(best):
+            if start >= covered:
+                spans.append((start, best[start]))
+                covered = best[start]
+        return spans
+
+    def censor(self, text):
+        if not isinstance(text, str) or not text:
+            return text
+        lowered = _fold(text)
+        if len(lowered) != len(text):
+            # Редкие символы (например, «İ») при lower() меняют длину — сравниваем посимвольно.
+            lowered = ''.join(char if len(char.lower()) != 1 else _fold(char) for char in text)
+        spans = self._spans(lowered)
+        if not spans:
+            return text
+        parts = []
+        previous = 0
+        for start, end in spans:
+            parts.append(text[previous:start])
+            parts.append(CENSOR_MASK)
+            previous = end
+        parts.append(text[previous:])
+        return ''.join(parts)
+
+    def censor_many(self, texts):
+        """
+        Цензурирует список строк одним проходом автомата по склеенному тексту.
+        Не строки (``None`` и т. п.) возвращаются без изменений.
+        """
+        texts = list(texts)
+        strings = [text for text in texts if isinstance(text, str)]
+        if any(_SEPARATOR in text for text in strings):
+            return [self.censor(text) for text in texts]
+        censored = iter(self.censor(_SEPARATOR.join(strings)).split(_SEPARATOR)) if strings else iter(())
+        return [next(censored) if isinstance(text, str) else text for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Общий экземпляр движка: словарь загружается и автомат строится один раз на процесс."""
+    return CensorEngine(words=RU_PROFANITY + profanity.get_words(), stems=RU_PROFANITY_STEMS)
+
 
 def censor(text):
-    if not isinstance(text, str):
-        return text
-    return PATTERN.sub('***', text)
+    return get_engine().censor(text)
+
+
+def censor_many(texts):
+    return get_engine().censor_many(texts)
@@ -1,82 +1,234 @@
 # /collect_app/views.py
 
+import os
+from django.conf import settings
 from .forms import SignUpForm
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, TemplateView
+from django.views.generic import ListView, CreateView, UpdateView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy, reverse
-from django.db.models import Sum, Count
+from django.db.models.functions import Coalesce
 from django.contrib import messages
-from .models import Collect, Payment, User, Profile
+from .models import Collect, Comment, Payment, User, Profile, OutgoingEmail, UserDonationSummary
 from .forms import CollectCreationForm, UserUpdateForm, ProfileUpdateForm
 from django.contrib.auth.decorators import login_required
 from .forms import CloseCollectForm
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.exceptions import BadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from .forms import CommentForm
-from profanity import profanity
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.conf import settings
-from rest_framework import viewsets
+from django.db import transaction
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .parsers import NDJSONParser
+from .ingest import ingest_payments
 from .serializers import CollectSerializer, PaymentSerializer, UserSerializer
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from .pagination import (
+    akeyset_page, keyset_page, KeysetPaginationMixin, KeysetCursorPagination, IdCursorPagination,
+    SearchResultsPagination,
+)
+from . import exports, projections
+from .search import search_collects
+from . import dbpool
+from .fragments import arender_cards, render_cards, CollectCardsMixin
+from .conditional import collect_condition, tags_condition
+from .caching import cache_page_tagged, collect_tag, ACTIVE_LIST, ARCHIVE_LIST
 from django.views.decorators.vary import vary_on_cookie
+from asgiref.sync import sync_to_async
+
+LIST_PAGE_SIZE = 9
+
+
+def for_server(view, async_view):
+    """Представление для текущего сервера: асинхронный вариант под ASGI (``ASYNC_VIEWS``), иначе синхронный."""
+    return async_view if settings.ASYNC_VIEWS else view
+
+
+def render_collect_list(request, queryset, ordering, **extra_context):
+    """Страница ленты сборов: сборы по курсору и готовые карточки из кэша фрагментов."""
+    cursor = request.GET.get('cursor')
+    collects, next_cursor = keyset_page(queryset, ordering, cursor, LIST_PAGE_SIZE)
+    context = {
+        'collects': collects,
+        'cards': render_cards(collects),
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+        **extra_context,
+    }
+    return render(request, 'home.html', context)
+
+
+async def arender_collect_list(request, queryset, ordering, **extra_context):
+    """
+    Асинхронный вариант ``render_collect_list``: сборы и карточки читаются
+    асинхронным ORM и API кэша. Шаблон рендерится в потоке, потому что ``user``
+    и сообщения в base.html лениво читают сессию из БД.
+    """
+    cursor = request.GET.get('cursor')
+    collects, next_cursor = await akeyset_page(queryset, ordering, cursor, LIST_PAGE_SIZE)
+    context = {
+        'collects': collects,
+        'cards': await arender_cards(collects),
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+        **extra_context,
+    }
+    return await sync_to_async(render)(request, 'home.html', context)
+
+
+def _active_collects():
+    return Collect.objects.filter(is_active=True).select_related('stats'), ['-created_at', '-id']
+
+
+def _archived_collects():
+    # Сборы без даты окончания сортируются по дате создания (индекс collect_archive_closed_idx).
+    queryset = Collect.objects.filter(is_active=False).select_related('stats').annotate(
+        closed_at=Coalesce('end_at', 'created_at')
+    )
+    return queryset, ['-closed_at', '-id']
+
+
+@tags_condition([ACTIVE_LIST], per_viewer=True)
+@cache_page_tagged(60 * 2, [ACTIVE_LIST], vary=('Cookie',))
+def home_page(request):
+    return render_collect_list(request, *_active_collects())
+
+
+@tags_condition([ACTIVE_LIST], per_viewer=True)
+@cache_page_tagged(60 * 2, [ACTIVE_LIST], vary=('Cookie',))
+async def ahome_page(request):
+    return await arender_collect_list(request, *_active_collects())
 
-@method_decorator(vary_on_cookie, name='dispatch')
-@method_decorator(cache_page(60 * 2), name='dispatch')
-class HomePageView(ListView):
-    model = Collect
-    template_name = 'home.html'
-    context_object_name = 'collects'
-    paginate_by = 9
-    def get_queryset(self):
-        return Collect.objects.filter(is_active=True).order_by('-created_at')
+
+@tags_condition([ARCHIVE_LIST], per_viewer=True)
+@cache_page_tagged(60 * 2, [ARCHIVE_LIST], vary=('Cookie',))
+def archive_collects(request):
+    return render_collect_list(request, *_archived_collects(), is_archive_page=True)
+
+
+@tags_condition([ARCHIVE_LIST], per_viewer=True)
+@cache_page_tagged(60 * 2, [ARCHIVE_LIST], vary=('Cookie',))
+async def aarchive_collects(request):
+    return await arender_collect_list(request, *_archived_collects(), is_archive_page=True)
 
 @method_decorator(vary_on_cookie, name='dispatch')
-@method_decorator(cache_page(60 * 2), name='dispatch')
-class ArchiveCollectsView(ListView):
-    model = Collect
+@method_decorator(cache_page_tagged(60 * 2, [ACTIVE_LIST, ARCHIVE_LIST]), name='dispatch')
+class CollectSearchView(CollectCardsMixin, ListView):
     template_name = 'home.html'
     context_object_name = 'collects'
     paginate_by = 9
     def get_queryset(self):
-        return Collect.objects.filter(is_active=False).order_by('-end_at', '-created_at')
+        self.query = self.request.GET.get('q', '').strip()
+        if not self.query:
+            return Collect.objects.none()
+        return search_collects(Collect.objects.select_related('stats'), self.query)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_archive_page'] = True
+        context['is_search_page'] = True
+        context['query'] = self.query
         return context
 
-class CollectDetailView(DetailView):
-    def get(self, request, pk):
-        collect = get_object_or_404(Collect, pk=pk)
-        comments = collect.comments.all()
-        comment_form = CommentForm()
-        context = {
-            'collect': collect,
-            'comments': comments,
-            'comment_form': comment_form
-        }
-        return render(request, 'collect_detail.html', context)
-    def post(self, request, pk):
-        if not request.user.is_authenticated:
-            return redirect('login')
-        collect = get_object_or_404(Collect, pk=pk)
-        comment_form = CommentForm(request.POST)
-        if comment_form.is_valid():
-            new_comment = comment_form.save(commit=False)
-            new_comment.collect = collect
-            new_comment.author = request.user
-            censored_text = profanity.censor(new_comment.text)
-            new_comment.text = censored_text
-            new_comment.save()
-            return redirect('collect_detail', pk=collect.pk)
-        comments = collect.comments.all()
-        context = {
-            'collect': collect,
-            'comments': comments,
-            'comment_form': comment_form
-        }
-        return render(request, 'collect_detail.html', context)
+COMMENTS_PAGE_SIZE = 20
+
+
+def comments_page(collect_id, cursor=None):
+    """Страница комментариев сбора (новые сверху) вместе с автором и профилем одним запросом."""
+    return keyset_page(_comments(collect_id), ['-created_at', '-id'], cursor=cursor, size=COMMENTS_PAGE_SIZE)
+
+
+async def acomments_page(collect_id, cursor=None):
+    return await akeyset_page(_comments(collect_id), ['-created_at', '-id'], cursor=cursor, size=COMMENTS_PAGE_SIZE)
+
+
+def _comments(collect_id):
+    return Comment.objects.filter(collect_id=collect_id).select_related('author__profile')
+
+
+def _detail_context(collect, comments, next_cursor, comment_form):
+    return {
+        'collect': collect,
+        'comments': comments,
+        'comments_next': next_cursor,
+        'comment_form': comment_form
+    }
+
+
+def collect_detail(request, pk):
+    if request.method == 'POST':
+        return post_comment(request, pk)
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD', 'POST'])
+    return _collect_detail_page(request, pk=pk)
+
+
+async def acollect_detail(request, pk):
+    if request.method == 'POST':
+        return await sync_to_async(post_comment)(request, pk)
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD', 'POST'])
+    return await _acollect_detail_page(request, pk=pk)
+
+
+def _detail_collects():
+    return Collect.objects.select_related('author__profile', 'stats')
+
+
+@collect_condition(per_viewer=True)
+def _collect_detail_page(request, pk):
+    collect = _detail_collects().filter(pk=pk).first()
+    if collect is None:
+        raise Http404('Сбор не найден.')
+    comments, next_cursor = comments_page(collect.pk)
+    return render(request, 'collect_detail.html', _detail_context(collect, comments, next_cursor, CommentForm()))
+
+
+@collect_condition(per_viewer=True)
+async def _acollect_detail_page(request, pk):
+    collect = await _detail_collects().filter(pk=pk).afirst()
+    if collect is None:
+        raise Http404('Сбор не найден.')
+    comments, next_cursor = await acomments_page(collect.pk)
+    context = _detail_context(collect, comments, next_cursor, CommentForm())
+    return await sync_to_async(render)(request, 'collect_detail.html', context)
+
+
+def post_comment(request, pk):
+    if not request.user.is_authenticated:
+        return redirect('login')
+    collect = get_object_or_404(Collect.objects.select_related('author__profile', 'stats'), pk=pk)
+    comment_form = CommentForm(request.POST)
+    if comment_form.is_valid():
+        new_comment = comment_form.save(commit=False)
+        new_comment.collect = collect
+        new_comment.author = request.user
+        new_comment.save()
+        return redirect('collect_detail', pk=collect.pk)
+    comments, next_cursor = comments_page(collect.pk)
+    return render(request, 'collect_detail.html', _detail_context(collect, comments, next_cursor, comment_form))
+
+
+def collect_comments(request, pk):
+    """Следующая страница комментариев для кнопки «Показать ещё»: готовый HTML и курсор."""
+    get_object_or_404(Collect.objects.only('pk'), pk=pk)
+    comments, next_cursor = comments_page(pk, request.GET.get('cursor'))
+    html = render_to_string('comment_list.html', {'comments': comments}, request=request)
+    return JsonResponse({'html': html, 'next': next_cursor})
+
+def collect_events(request, pk):
+    """
+    Поток живых обновлений обслуживает ASGI-приложение ``collect_app.live.LiveUpdatesApp``.
+    Сюда запрос попадает только без него (WSGI, runserver): 204 говорит
+    EventSource не переподключаться.
+    """
+    return HttpResponse(status=204)
 
 class CollectCreateView(LoginRequiredMixin, CreateView):
     model = Collect
@@ -85,29 +237,23 @@ class CollectCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('home')
     def form_valid(self, form):
         form.instance.author = self.request.user
-        response = super().form_valid(form)
-        messages.success(self, 'Ваш сбор успешно создан и отправлен на модерацию!')
-        new_collect = self.object
-        admin_users = User.objects.filter(is_superuser=True)
-        admin_emails = [user.email for user in admin_users if user.email]
-        if admin_emails:
-            subject = f'Новый сбор на модерацию: "{new_collect.title}"'
-            admin_url = self.request.build_absolute_uri(
-                reverse('admin:collect_app_collect_change', args=[new_collect.pk])
-            )
-            message = (
-                f'Пользователь {new_collect.author.username} создал новый сбор.\n'
-                f'Название: {new_collect.title}\n\n'
-                f'Пожалуйста, проверьте и активируйте его в админ-панели:\n'
-                f'{admin_url}'
-            )
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                admin_emails,
-                fail_silently=False,
-            )
+        with transaction.atomic():
+            response = super().form_valid(form)
+            new_collect = self.object
+            admin_emails = OutgoingEmail.admin_recipients()
+            if admin_emails:
+                subject = f'Новый сбор на модерацию: "{new_collect.title}"'
+                admin_url = self.request.build_absolute_uri(
+                    reverse('admin:collect_app_collect_change', args=[new_collect.pk])
+                )
+                message = (
+                    f'Пользователь {new_collect.author.username} создал новый сбор.\n'
+                    f'Название: {new_collect.title}\n\n'
+                    f'Пожалуйста, проверьте и активируйте его в админ-панели:\n'
+                    f'{admin_url}'
+                )
+                OutgoingEmail.enqueue(subject, message, admin_emails)
+        messages.success(self.request, 'Ваш сбор успешно создан и отправлен на модерацию!')
         return response
 
 class ProfileView(LoginRequiredMixin, UpdateView):
@@ -170,17 +316,61 @@ class PaymentDemoView(LoginRequiredMixin, TemplateView):
         messages.success(request, f'Спасибо! Вы успешно пожертвовали {amount} ₽.')
         return redirect('collect_detail', pk=collect.pk)
 
-class AdminUserListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
-    model = User
+class AdminUserListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView):
     template_name = 'admin_user_list.html'
-    context_object_name = 'users'
+    context_object_name = 'summaries'
+    page_size = 50
+    # Параметр ?sort= → поле сводки; у каждого поля есть индекс (поле, user_id).
+    SORT_FIELDS = {
+        'joined': 'user_id',
+        'collects': 'collects_created',
+        'donated': 'total_donated',
+        'donations': 'donations_count',
+        'last_donation': 'last_donation_at',
+    }
+    COLUMN_LABELS = [
+        ('joined', 'Дата регистрации'),
+        ('collects', 'Создано сборов'),
+        ('donated', 'Всего пожертвовано'),
+        ('donations', 'Пожертвований'),
+        ('last_donation', 'Последнее пожертвование'),
+    ]
     def test_func(self):
         return self.request.user.is_superuser
+    def get_sort(self):
+        sort = self.request.GET.get('sort', '-joined')
+        return sort if sort.lstrip('-') in self.SORT_FIELDS else '-joined'
+    def get_keyset_ordering(self):
+        sort = self.get_sort()
+        prefix = '-' if sort.startswith('-') else ''
+        field = self.SORT_FIELDS[sort.lstrip('-')]
+        return [prefix + field] if field == 'user_id' else [prefix + field, prefix + 'user_id']
     def get_queryset(self):
-        return User.objects.annotate(
-            collections_created=Count('collections'),
-            total_donated=Sum('donations__amount')
-        ).order_by('-date_joined')
+        queryset = UserDonationSummary.objects.select_related('user')
+        if self.get_sort().lstrip('-') == 'last_donation':
+            # Курсор не умеет сравнивать NULL: без пожертвований сортировать нечего.
+            queryset = queryset.filter(last_donation_at__isnull=False)
+        return queryset
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        sort = self.get_sort()
+        context['sort'] = sort
+        context['columns'] = [
+            {
+                'key': key,
+                'label': label,
+                'next_sort': key if sort == f'-{key}' else f'-{key}',
+                'arrow': '▼' if sort == f'-{key}' else '▲' if sort == key else '',
+            }
+            for key, label in self.COLUMN_LABELS
+        ]
+        return context
+
+def db_pool_stats(request):
+    """Состояние пулов соединений текущего процесса (у каждого воркера gunicorn — свои)."""
+    if not request.user.is_superuser:
+        return redirect('home')
+    return JsonResponse({'pid': os.getpid(), 'pools': dbpool.pool_stats()})
 
 def end_collect(request, pk):
     if not request.user.is_superuser:
@@ -192,22 +382,242 @@ def end_collect(request, pk):
     return redirect('home')
 
 class CollectViewSet(viewsets.ModelViewSet):
-    queryset = Collect.objects.all()
+    queryset = Collect.objects.select_related('stats')
     serializer_class = CollectSerializer
-    @method_decorator(cache_page(60 * 2))
+    pagination_class = KeysetCursorPagination
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        query = self.request.query_params.get('q', '').strip()
+        if self.action == 'list' and query:
+            queryset = search_collects(queryset, query)
+        return queryset
+    @property
+    def paginator(self):
+        # Результаты поиска отсортированы по релевантности, поэтому листаются по номеру страницы.
+        if not hasattr(self, '_paginator'):
+            if self.action == 'list' and self.request.query_params.get('q', '').strip():
+                self._paginator = SearchResultsPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    @method_decorator(tags_condition([ACTIVE_LIST, ARCHIVE_LIST]))
+    @method_decorator(cache_page_tagged(60 * 2, [ACTIVE_LIST, ARCHIVE_LIST]))
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
-    @method_decorator(cache_page(60 * 2))
+    @method_decorator(collect_condition())
+    @method_decorator(cache_page_tagged(60 * 2, lambda request, *args, **kwargs: [collect_tag(kwargs['pk'])]))
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+collect_list_api = CollectViewSet.as_view({'get': 'list', 'post': 'create'})
+collect_detail_api = CollectViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+
+def _wants_json(request):
+    """Клиент ждёт JSON, а не браузируемый API DRF."""
+    return request.GET.get('format', 'json') == 'json' and 'text/html' not in request.headers.get('Accept', '')
+
+def _json_response(data, status=200):
+    return HttpResponse(projections.render(data), status=status, content_type='application/json')
+
+def _projection_list(request, projection, queryset, paginator):
+    """Страница API из ``values_list()``-проекции с полями ``?fields=``."""
+    try:
+        names = projection.field_names(request.GET.get('fields'))
+    except BadRequest as exc:
+        return _json_response({'detail': str(exc)}, status=400)
+    rows, value, build = projection.select(queryset, names, paginator.ordering)
+    try:
+        page = paginator.paginate_queryset(rows, request, value=value)
+    except NotFound as exc:
+        return _json_response({'detail': str(exc.detail)}, status=404)
+    return _json_response({'next': paginator.get_next_link(), 'results': build(page, request)})
+
+async def _aprojection_list(request, projection, queryset, paginator):
+    try:
+        names = projection.field_names(request.GET.get('fields'))
+    except BadRequest as exc:
+        return _json_response({'detail': str(exc)}, status=400)
+    rows, value, build = projection.select(queryset, names, paginator.ordering)
+    try:
+        page = await paginator.apaginate_queryset(rows, request, value)
+    except NotFound as exc:
+        return _json_response({'detail': str(exc.detail)}, status=404)
+    return _json_response({'next': paginator.get_next_link(), 'results': build(page, request)})
+
+def _projection_not_found(projection):
+    return _json_response({'detail': f'No {projection.model._meta.object_name} matches the given query.'}, status=404)
+
+def _projection_detail(request, projection, queryset, pk):
+    try:
+        names = projection.field_names(request.GET.get('fields'))
+    except BadRequest as exc:
+        return _json_response({'detail': str(exc)}, status=400)
+    rows, _, build = projection.select(queryset.filter(pk=pk), names)
+    row = rows.first()
+    if row is None:
+        return _projection_not_found(projection)
+    return _json_response(build([row], request)[0])
+
+async def _aprojection_detail(request, projection, queryset, pk):
+    try:
+        names = projection.field_names(request.GET.get('fields'))
+    except BadRequest as exc:
+        return _json_response({'detail': str(exc)}, status=400)
+    rows, _, build = projection.select(queryset.filter(pk=pk), names)
+    row = await rows.afirst()
+    if row is None:
+        return _projection_not_found(projection)
+    return _json_response(build([row], request)[0])
+
+def api_collects(request):
+    """
+    Список сборов API. Чтение в JSON обслуживается проекцией; запись, поиск ``?q=``
+    и браузируемый API — ``CollectViewSet``.
+    """
+    if request.method in ('GET', 'HEAD') and _wants_json(request) and not request.GET.get('q', '').strip():
+        return _api_collect_list(request)
+    return collect_list_api(request)
+
+async def aapi_collects(request):
+    """Асинхронный вариант ``api_collects``: ``CollectViewSet`` вызывается в потоке (DRF не поддерживает async)."""
+    if request.method in ('GET', 'HEAD') and _wants_json(request) and not request.GET.get('q', '').strip():
+        return await _aapi_collect_list(request)
+    return await sync_to_async(collect_list_api)(request)
+
+def api_collect(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return _api_collect_detail(request, pk=pk)
+    return collect_detail_api(request, pk=pk)
+
+async def aapi_collect(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return await _aapi_collect_detail(request, pk=pk)
+    return await sync_to_async(collect_detail_api)(request, pk=pk)
+
+# Запись проверяет CSRF сама DRF (SessionAuthentication), как в CollectViewSet.as_view().
+# csrf_exempt в Django 4.2 оборачивает представление синхронной функцией, поэтому флаг ставится напрямую.
+api_collects.csrf_exempt = api_collect.csrf_exempt = aapi_collects.csrf_exempt = aapi_collect.csrf_exempt = True
+
+@tags_condition([ACTIVE_LIST, ARCHIVE_LIST])
+@cache_page_tagged(60 * 2, [ACTIVE_LIST, ARCHIVE_LIST], vary=('Accept',))
+def _api_collect_list(request):
+    return _projection_list(request, projections.COLLECT, Collect.objects.all(), KeysetCursorPagination())
+
+@tags_condition([ACTIVE_LIST, ARCHIVE_LIST])
+@cache_page_tagged(60 * 2, [ACTIVE_LIST, ARCHIVE_LIST], vary=('Accept',))
+async def _aapi_collect_list(request):
+    return await _aprojection_list(request, projections.COLLECT, Collect.objects.all(), KeysetCursorPagination())
+
+@collect_condition()
+@cache_page_tagged(60 * 2, lambda request, *args, **kwargs: [collect_tag(kwargs['pk'])], vary=('Accept',))
+def _api_collect_detail(request, pk):
+    return _projection_detail(request, projections.COLLECT, Collect.objects.all(), pk)
+
+@collect_condition()
+@cache_page_tagged(60 * 2, lambda request, *args, **kwargs: [collect_tag(kwargs['pk'])], vary=('Accept',))
+async def _aapi_collect_detail(request, pk):
+    return await _aprojection_detail(request, projections.COLLECT, Collect.objects.all(), pk)
+
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = KeysetCursorPagination
+
+    @action(detail=False, methods=['post'], url_path='bulk',
+            parser_classes=[JSONParser, NDJSONParser], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        """
+        Массовый импорт платежей: JSON-массив или NDJSON с полями collect, amount
+        и необязательным user. Возвращает отчёт с ошибками по номерам строк.
+        """
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = [rows]
+        report = ingest_payments(rows, request.user)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = IdCursorPagination
+
+payment_list_api = PaymentViewSet.as_view({'get': 'list', 'post': 'create'})
+payment_detail_api = PaymentViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+user_list_api = UserViewSet.as_view({'get': 'list', 'post': 'create'})
+user_detail_api = UserViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+
+def api_payments(request):
+    """Платежи API: чтение в JSON — проекцией, остальное — ``PaymentViewSet``."""
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return _projection_list(request, projections.PAYMENT, Payment.objects.all(), KeysetCursorPagination())
+    return payment_list_api(request)
+
+async def aapi_payments(request):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return await _aprojection_list(request, projections.PAYMENT, Payment.objects.all(), KeysetCursorPagination())
+    return await sync_to_async(payment_list_api)(request)
+
+def api_payment(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return _projection_detail(request, projections.PAYMENT, Payment.objects.all(), pk)
+    return payment_detail_api(request, pk=pk)
+
+async def aapi_payment(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return await _aprojection_detail(request, projections.PAYMENT, Payment.objects.all(), pk)
+    return await sync_to_async(payment_detail_api)(request, pk=pk)
+
+def api_users(request):
+    """Пользователи API: чтение в JSON — проекцией, остальное — ``UserViewSet``."""
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return _projection_list(request, projections.USER, User.objects.all(), IdCursorPagination())
+    return user_list_api(request)
+
+async def aapi_users(request):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return await _aprojection_list(request, projections.USER, User.objects.all(), IdCursorPagination())
+    return await sync_to_async(user_list_api)(request)
+
+def api_user(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return _projection_detail(request, projections.USER, User.objects.all(), pk)
+    return user_detail_api(request, pk=pk)
+
+async def aapi_user(request, pk):
+    if request.method in ('GET', 'HEAD') and _wants_json(request):
+        return await _aprojection_detail(request, projections.USER, User.objects.all(), pk)
+    return await sync_to_async(user_detail_api)(request, pk=pk)
+
+for _view in (api_payments, api_payment, api_users, api_user, aapi_payments, aapi_payment, aapi_users, aapi_user):
+    _view.csrf_exempt = True
+
+def export_data(request, resource):
+    """
+    Потоковая выгрузка для персонала: ``?format=csv|ndjson``, фильтры ``collect``,
+    ``occasion``, ``date_from``, ``date_to`` и колонки ``fields`` (см. ``exports``).
+    """
+    if not request.user.is_staff:
+        return _json_response({'detail': 'Выгрузка доступна только персоналу.'}, status=403)
+    export = exports.EXPORTS[resource]
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return _json_response({'detail': f'Неизвестный формат: {fmt}.'}, status=400)
+    try:
+        # Реплика выбирается сейчас: поток читается уже после middleware маршрутизации.
+        names, rows, build = export.select(request.GET, using=router.db_for_read(export.model))
+    except BadRequest as exc:
+        return _json_response({'detail': str(exc)}, status=400)
+    chunks = exports.stream(names, rows, build, fmt)
+    # Под ASGI синхронный поток Django собрал бы в память целиком.
+    response = StreamingHttpResponse(
+        exports.aiterate(chunks) if isinstance(request, ASGIRequest) else chunks, content_type=exports.FORMATS[fmt]
+    )
+    filename = f"{resource}-{timezone.localtime():%Y%m%d-%H%M}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    # nginx не должен буферизовать выгрузку.
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 class SignUpView(CreateView):
     form_class = SignUpForm
@@ -245,25 +655,25 @@ class CollectCloseView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
             collect.is_active = False
             collect.end_at = timezone.now()
             collect.save()
-            messages.success(self, f'Сбор "{collect.title}" был успешно завершен.')
+            messages.success(self.request, f'Сбор "{collect.title}" был успешно завершен.')
         else:
-            collect.closure_requested = True
-            collect.save()
-            messages.info(self, 'Ваш запрос на досрочное завершение сбора отправлен администратору.')
-            admin_users = User.objects.filter(is_superuser=True)
-            admin_emails = [user.email for user in admin_users if user.email]
-            if admin_emails:
-                subject = f'⚠️ Запрос на закрытие сбора: "{collect.title}"'
-                admin_url = self.request.build_absolute_uri(
-                    reverse('admin:collect_app_collect_change', args=[collect.pk])
-                )
-                message = (
-                    f'Пользователь {collect.author.username} запросил досрочное завершение сбора "{collect.title}".\n\n'
-                    f'Причина: {collect.close_reason}\n\n'
-                    f'Пожалуйста, рассмотрите запрос и при необходимости завершите сбор в админ-панели:\n'
-                    f'{admin_url}'
-                )
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, admin_emails, fail_silently=False)
+            with transaction.atomic():
+                collect.closure_requested = True
+                collect.save()
+                admin_emails = OutgoingEmail.admin_recipients()
+                if admin_emails:
+                    subject = f'⚠️ Запрос на закрытие сбора: "{collect.title}"'
+                    admin_url = self.request.build_absolute_uri(
+                        reverse('admin:collect_app_collect_change', args=[collect.pk])
+                    )
+                    message = (
+                        f'Пользователь {collect.author.username} запросил досрочное завершение сбора "{collect.title}".\n\n'
+                        f'Причина: {collect.close_reason}\n\n'
+                        f'Пожалуйста, рассмотрите запрос и при необходимости завершите сбор в админ-панели:\n'
+                        f'{admin_url}'
+                    )
+                    OutgoingEmail.enqueue(subject, message, admin_emails)
+            messages.info(self.request, 'Ваш запрос на досрочное завершение сбора отправлен администратору.')
         return redirect(self.get_success_url())
     def get_success_url(self):
         return reverse_lazy('collect_detail', kwargs={'pk': self.object.pk})
\ No newline at end of file
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "group_collects.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from collect_app.live import LiveUpdatesApp  # noqa: E402 — после настройки Django
+
+# Поток живых обновлений сбора обслуживается отдельно от Django, остальное — Django.
+application = LiveUpdatesApp(django_application)
@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_yasg',
     'corsheaders',
@@ -24,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'collect_app.instrumentation.RequestMetricsMiddleware',
+    'collect_app.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -34,13 +37,21 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Метрики запросов: заголовок Server-Timing и лог медленных запросов (collect_app.slow_requests)
+REQUEST_METRICS_ENABLED = int(os.environ.get('REQUEST_METRICS_ENABLED', 1))
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Асинхронные варианты представлений чтения подключаются только под ASGI (воркеры uvicorn,
+# см. gunicorn.conf.py): под WSGI каждый запрос к ним платил бы за переходы между потоками.
+ASYNC_VIEWS = os.environ.get('GUNICORN_MODE', 'wsgi') == 'asgi'
+
 ROOT_URLCONF = 'group_collects.urls'
 CORS_ALLOW_ALL_ORIGINS = True
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'collect_app.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'], 'APP_DIRS': True,
         'OPTIONS': {'context_processors': [
             'django.template.context_processors.debug',
@@ -53,17 +64,42 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'group_collects.wsgi.application'
 
+# Соединения берутся из пула процесса (collect_app/dbpool.py); DB_POOL=0 возвращает стандартный бэкенд.
+# CONN_MAX_AGE остаётся 0: в конце запроса соединение возвращается в пул, а не закрывается.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'collect_app.pooled_postgresql' if int(os.environ.get('DB_POOL', 1)) else 'django.db.backends.postgresql',
         'NAME': os.environ.get('POSTGRES_DB'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_AGE': float(os.environ.get('DB_POOL_MAX_AGE', 1800)),
+            'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'CHECK_IDLE': float(os.environ.get('DB_POOL_CHECK_IDLE', 30)),
+        },
     }
 }
 
+# Реплики только для чтения (collect_app/replicas.py): "host" или "host:port" через запятую.
+# Локально репликой может быть и вторая БД на том же сервере: маршрутизация от этого не меняется.
+REPLICA_DATABASES = []
+for index, address in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': int(port or 5432), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+DATABASE_ROUTERS = ['collect_app.replicas.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 2))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+# После записи посетитель читает из основной БД столько секунд (чтение своих записей).
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+REPLICA_PIN_COOKIE = 'primary_pin'
+
 AUTH_PASSWORD_VALIDATORS = []
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'
@@ -87,11 +123,14 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": "redis://redis:6379/1",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "CLIENT_CLASS": "collect_app.instrumentation.InstrumentedRedisClient",
         },
     }
 }
 
+# Живые обновления страницы сбора через Redis pub/sub (collect_app/live.py); пустое значение отключает их.
+LIVE_UPDATES_REDIS_URL = os.environ.get('LIVE_UPDATES_REDIS_URL', 'redis://redis:6379/2')
+
 # Настройки для Jazzmin
 JAZZMIN_SETTINGS = {
     "site_title": "🌿 Сбор Средств",
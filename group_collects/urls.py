@@ -20,12 +20,14 @@ schema_view = get_schema_view(
 )
 
 urlpatterns = [
+    # collect_app объявляет admin/users/, поэтому подключается раньше админки:
+    # иначе этот путь перехватывает catch-all представление admin.site.
+    path('', include('collect_app.urls')),
     path('admin/', admin.site.urls),
     path('api/v1/', include('collect_app.api_urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('', include('collect_app.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
     path('api/', include('collect_app.api_urls')),
 ]
@@ -0,0 +1,24 @@
+"""
+Настройки gunicorn для сервиса web.
+
+По умолчанию — синхронные воркеры WSGI: на нагрузочном замере
+(``manage.py benchmark --load``) они пока быстрее ASGI. ``GUNICORN_MODE=asgi``
+включает воркеры uvicorn и вместе с ними асинхронные варианты лент сборов,
+страницы сбора и чтения API (настройка ``ASYNC_VIEWS``); под WSGI работают
+синхронные варианты без переходов между потоками. Переключать по умолчанию
+стоит только после того, как замер на стенде покажет выигрыш. Поток живых
+обновлений (``collect_app/live.py``) в любом режиме держит отдельный
+ASGI-сервис live.
+"""
+import multiprocessing
+import os
+
+mode = os.environ.get('GUNICORN_MODE', 'wsgi')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+if mode == 'asgi':
+    wsgi_app = 'group_collects.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'group_collects.wsgi:application'
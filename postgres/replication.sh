@@ -0,0 +1,5 @@
+#!/bin/bash
+# Выполняется при инициализации основной БД (docker-entrypoint-initdb.d): разрешает реплике
+# забирать WAL под учётной записью POSTGRES_USER.
+set -e
+echo "host replication ${POSTGRES_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"